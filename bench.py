@@ -0,0 +1,351 @@
+import hashlib
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime
+from dist_block import dist_block
+from peer import PEER_PORT_BASE, TRACKER_PORT, METRICS_PORT_BASE
+from tracker import METRICS_PORT
+from utils import tabela_arquivos, caminho_da_tabela
+
+AQUI = os.path.dirname(os.path.abspath(__file__))
+
+# Configuração padrão; um arquivo JSON passado em --config sobrescreve as chaves que definir
+CONFIG_PADRAO = {
+    'name': 'padrao',
+    'file_size': 8 * 1024 * 1024,      # bytes do arquivo gerado em arquivos/
+    'piece_size': 256 * 1024,          # tamanho de cada bloco (peça) usado pelo seed
+    'peers': 5,                        # total de peers, incluindo o seed (peer 0)
+    'distribution': {'min_blocks': 1, 'max_blocks': 10},  # blocos copiados do seed para cada peer (null: nenhum)
+    'super_seed': False,               # seed com --super-seed (em geral com "distribution": null)
+    'seed': 42,                        # semente do conteúdo do arquivo e da distribuição inicial
+    'content': 'random',               # conteúdo do arquivo: 'random' (bytes aleatórios) ou 'text' (comprimível)
+    'mode': 'thread',                  # motor de rede de peers e tracker: 'thread' ou 'asyncio'
+    'storage': 'arquivo',
+    'start_delay': 1,                  # espera dos peers entre subir o servidor e começar a baixar
+    'timeout': 300,                    # segundos até desistir dos peers que não terminaram
+    'repeat': 1,                       # execuções (cada uma em uma pasta nova)
+    'peer_args': [],                   # argumentos extras para todos os peer.py
+    'tracker_args': [],                # argumentos extras para o tracker.py
+}
+
+# Vocabulário do conteúdo 'text': linhas de palavras sorteadas, comprimíveis como um texto comum
+PALAVRAS = ('bloco', 'peer', 'swarm', 'tracker', 'peça', 'hash', 'arquivo', 'conexão', 'rede', 'download',
+            'upload', 'seed', 'chunk', 'quadro', 'requisição', 'resposta', 'cache', 'disco', 'de', 'o', 'a',
+            'com', 'para', 'um', 'uma', 'em', 'que', 'não', 'se', 'do')
+
+# Intervalo (segundos) entre verificações de prontidão e de término dos processos
+INTERVALO = 0.05
+
+
+def porta_aberta(porta, host='localhost'):
+    try:
+        with socket.create_connection((host, porta), timeout=0.2):
+            return True
+    except OSError:
+        return False
+
+
+def aguardar(condicao, timeout, processo=None, descricao=''):
+    """
+    Espera a condição ficar verdadeira (sinal de prontidão) em vez de dormir um tempo fixo.
+    Falha se o processo informado morrer antes ou se o timeout passar.
+    """
+    limite = time.monotonic() + timeout
+    while not condicao():
+        if processo is not None and processo.poll() is not None:
+            raise RuntimeError(f'{descricao}: processo encerrou com código {processo.returncode}')
+        if time.monotonic() > limite:
+            raise TimeoutError(f'{descricao}: não ficou pronto em {timeout}s')
+        time.sleep(INTERVALO)
+
+
+def aguardar_porta(porta, timeout=30, processo=None, descricao=None):
+    aguardar(lambda: porta_aberta(porta), timeout, processo, descricao or f'porta {porta}')
+
+
+def coletar(processo):
+    """
+    Espera o processo encerrar (os.wait4) e retorna (código de saída, CPU em segundos).
+    """
+    _, status, uso = os.wait4(processo.pid, 0)
+    processo.returncode = os.waitstatus_to_exitcode(status)
+    return processo.returncode, uso.ru_utime + uso.ru_stime
+
+
+def hash_pasta(pasta):
+    """
+    SHA-256 do conteúdo da pasta na mesma ordem em que o seed a divide em blocos.
+    """
+    h = hashlib.sha256()
+    for entrada in tabela_arquivos(pasta):
+        with open(caminho_da_tabela(pasta, entrada), 'rb') as f:
+            for pedaco in iter(lambda: f.read(1 << 20), b''):
+                h.update(pedaco)
+    return h.hexdigest()
+
+
+def hash_arquivo(caminho):
+    if not os.path.exists(caminho):
+        return None
+    h = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for pedaco in iter(lambda: f.read(1 << 20), b''):
+            h.update(pedaco)
+    return h.hexdigest()
+
+
+def somar_metrica(porta, prefixo):
+    """
+    Soma das amostras que começam com prefixo no endpoint de métricas da porta (None se indisponível).
+    """
+    try:
+        texto = urllib.request.urlopen(f'http://localhost:{porta}/metrics', timeout=2).read().decode()
+    except OSError:
+        return None
+    return sum(int(float(linha.rsplit(' ', 1)[1])) for linha in texto.splitlines() if linha.startswith(prefixo))
+
+
+def requisicoes_tracker():
+    """
+    Total de requisições atendidas pelo tracker, lido do endpoint de métricas (None se indisponível).
+    """
+    return somar_metrica(METRICS_PORT, 'minibit_tracker_request_seconds_count')
+
+
+def bytes_enviados_seed():
+    """
+    Bytes de blocos servidos pelo seed (peer 0), lidos do endpoint de métricas dele.
+    """
+    return somar_metrica(METRICS_PORT_BASE, 'minibit_bytes_total{direcao="out"}')
+
+
+def percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p * (len(ordenados) - 1))))]
+
+
+class Execucao:
+    """
+    Uma execução do benchmark em uma pasta de trabalho: gera o arquivo, sobe tracker e seed,
+    distribui os blocos iniciais (se houver distribuição), sobe os demais peers ao mesmo tempo
+    e mede quando cada um termina.
+    """
+
+    def __init__(self, config, pasta):
+        self.config = config
+        self.pasta = pasta
+        self.processos = []
+        os.makedirs(os.path.join(pasta, 'logs'), exist_ok=True)
+
+    def iniciar(self, nome, script, *args):
+        log = open(os.path.join(self.pasta, 'logs', f'{nome}.log'), 'w')
+        processo = subprocess.Popen([sys.executable, os.path.join(AQUI, script), *map(str, args)],
+                                    cwd=self.pasta, stdout=log, stderr=subprocess.STDOUT)
+        log.close()
+        self.processos.append(processo)
+        return processo
+
+    def peer_args(self, peer_id):
+        c = self.config
+        args = [peer_id, '--modo', c['mode'], '--storage', c['storage'], '--piece-size', c['piece_size'],
+                '--start-delay', c['start_delay'], *c['peer_args']]
+        if peer_id == 0 and c['super_seed']:
+            args.append('--super-seed')
+        return args
+
+    def gerar_arquivo(self):
+        origem = os.path.join(self.pasta, 'arquivos')
+        os.makedirs(origem, exist_ok=True)
+        gerador = random.Random(self.config['seed'])
+        restante = self.config['file_size']
+        with open(os.path.join(origem, 'bench.bin'), 'wb') as f:
+            while restante:
+                n = min(restante, 1 << 20)
+                f.write(self.gerar_conteudo(gerador, n))
+                restante -= n
+        return hash_pasta(origem)
+
+    def gerar_conteudo(self, gerador, n):
+        if self.config['content'] == 'random':
+            return gerador.randbytes(n)
+        partes, total = [], 0
+        while total < n:
+            linha = (' '.join(gerador.choices(PALAVRAS, k=12)) + '\n').encode()
+            partes.append(linha)
+            total += len(linha)
+        return b''.join(partes)[:n]
+
+    def distribuir(self):
+        distribuicao = self.config['distribution']
+        if distribuicao is None:
+            return
+        random.seed(self.config['seed'])
+        diretorio = os.getcwd()
+        os.chdir(self.pasta)
+        try:
+            dist_block(num_peers=self.config['peers'], min_blocos=distribuicao['min_blocks'],
+                       max_blocos=distribuicao['max_blocks'], storage=self.config['storage'])
+        finally:
+            os.chdir(diretorio)
+
+    def rodar(self):
+        c = self.config
+        for porta in (TRACKER_PORT, PEER_PORT_BASE, METRICS_PORT):
+            if porta_aberta(porta):
+                raise RuntimeError(f'Porta {porta} já está em uso: encerre o MiniBit que está rodando')
+        esperado = self.gerar_arquivo()
+
+        inicio = time.monotonic()
+        tracker = self.iniciar('tracker', 'tracker.py', '--modo', c['mode'], *c['tracker_args'])
+        aguardar_porta(TRACKER_PORT, processo=tracker, descricao='tracker')
+        seed = self.iniciar('peer_0', 'peer.py', *self.peer_args(0))
+        aguardar_porta(PEER_PORT_BASE, timeout=max(30, c['file_size'] / 20e6), processo=seed, descricao='seed')
+        pronto_seed = time.monotonic() - inicio
+        self.distribuir()
+
+        partida = time.monotonic()
+        peers = {i: self.iniciar(f'peer_{i}', 'peer.py', *self.peer_args(i)) for i in range(1, c['peers'])}
+        resultados = {i: {'peer': i, 'ready_s': None, 'completed_s': None} for i in peers}
+        pendentes = dict(peers)
+        limite = partida + c['timeout']
+        while pendentes and time.monotonic() < limite:
+            agora = time.monotonic() - partida
+            for i, processo in list(pendentes.items()):
+                pid, status, uso = os.wait4(processo.pid, os.WNOHANG)
+                if pid:
+                    processo.returncode = os.waitstatus_to_exitcode(status)
+                    resultados[i].update(completed_s=round(agora, 3), exit_code=processo.returncode,
+                                         cpu_s=round(uso.ru_utime + uso.ru_stime, 3))
+                    del pendentes[i]
+                elif resultados[i]['ready_s'] is None and porta_aberta(PEER_PORT_BASE + i):
+                    resultados[i]['ready_s'] = round(agora, 3)
+            time.sleep(INTERVALO)
+        for i, processo in pendentes.items():
+            processo.kill()
+            codigo, cpu = coletar(processo)
+            resultados[i].update(exit_code=codigo, cpu_s=round(cpu, 3), timed_out=True)
+
+        requisicoes = requisicoes_tracker()
+        enviados_seed = bytes_enviados_seed()
+        seed.terminate()
+        _, cpu_seed = coletar(seed)
+        tracker.terminate()
+        _, cpu_tracker = coletar(tracker)
+
+        for i, resultado in resultados.items():
+            saida = os.path.join(self.pasta, f'reconstruido_peer_{i}.txt')
+            resultado['ok'] = resultado.get('exit_code') == 0 and hash_arquivo(saida) == esperado
+        tempos = [r['completed_s'] for r in resultados.values() if r['ok']]
+        total = max(tempos) if tempos else None
+        baixados = c['file_size'] * len(tempos)
+        return {
+            'dir': self.pasta,
+            'seed_ready_s': round(pronto_seed, 3),
+            'peers': list(resultados.values()),
+            'completed': len(tempos),
+            'total_time_s': total,
+            'mean_time_s': round(statistics.mean(tempos), 3) if tempos else None,
+            'p50_time_s': percentil(tempos, 0.5),
+            'p90_time_s': percentil(tempos, 0.9),
+            'bytes_downloaded': baixados,
+            'aggregate_throughput_bps': round(baixados / total) if total else None,
+            'seed': {'cpu_s': round(cpu_seed, 3), 'bytes_out': enviados_seed},
+            'tracker': {'cpu_s': round(cpu_tracker, 3), 'requests': requisicoes},
+        }
+
+    def encerrar(self):
+        for processo in self.processos:
+            if processo.poll() is None:
+                processo.kill()
+                processo.wait()
+
+
+def mediana(execucoes, chave, *caminho):
+    valores = []
+    for execucao in execucoes:
+        valor = execucao
+        for parte in (chave, *caminho):
+            valor = valor.get(parte) if isinstance(valor, dict) else None
+        if valor is not None:
+            valores.append(valor)
+    return statistics.median(valores) if valores else None
+
+
+def benchmark(config, pasta_base=None, manter=False):
+    """
+    Roda config['repeat'] execuções e retorna o relatório (dict serializável em JSON).
+    """
+    inicio = datetime.now().isoformat(timespec='seconds')
+    execucoes = []
+    for n in range(config['repeat']):
+        pasta = tempfile.mkdtemp(prefix=f"minibit_bench_{config['name']}_{n}_", dir=pasta_base)
+        execucao = Execucao(config, pasta)
+        try:
+            resultado = execucao.rodar()
+        finally:
+            execucao.encerrar()
+        execucoes.append(resultado)
+        print(f"[BENCH] Execução {n + 1}/{config['repeat']}: {resultado['completed']}/{config['peers'] - 1} peers "
+              f"em {resultado['total_time_s']}s, tracker {resultado['tracker']['cpu_s']}s de CPU")
+        if not manter and resultado['completed'] == config['peers'] - 1:
+            shutil.rmtree(pasta, ignore_errors=True)
+            resultado['dir'] = None
+    return {
+        'config': config,
+        'started_at': inicio,
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpus': os.cpu_count()},
+        'runs': execucoes,
+        'summary': {
+            'completed': min(e['completed'] for e in execucoes),
+            'total_time_s': mediana(execucoes, 'total_time_s'),
+            'p90_time_s': mediana(execucoes, 'p90_time_s'),
+            'aggregate_throughput_bps': mediana(execucoes, 'aggregate_throughput_bps'),
+            'tracker_cpu_s': mediana(execucoes, 'tracker', 'cpu_s'),
+            'seed_cpu_s': mediana(execucoes, 'seed', 'cpu_s'),
+            'seed_bytes_out': mediana(execucoes, 'seed', 'bytes_out'),
+        },
+    }
+
+
+def carregar_config(caminho=None, **sobrescritas):
+    config = json.loads(json.dumps(CONFIG_PADRAO))
+    if caminho:
+        with open(caminho) as f:
+            config.update(json.load(f))
+    config.update({k: v for k, v in sobrescritas.items() if v is not None})
+    return config
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Benchmark reprodutível de um swarm MiniBit em localhost')
+    parser.add_argument('--config', metavar='ARQUIVO', help='JSON com as chaves de CONFIG_PADRAO a alterar')
+    parser.add_argument('--peers', type=int, help='total de peers, incluindo o seed')
+    parser.add_argument('--repeat', type=int, help='quantidade de execuções')
+    parser.add_argument('--output', metavar='ARQUIVO', help='grava o relatório JSON neste arquivo')
+    parser.add_argument('--dir', metavar='PASTA', help='onde criar as pastas de trabalho (padrão: temporário)')
+    parser.add_argument('--keep', action='store_true', help='mantém as pastas de trabalho com os logs')
+    args = parser.parse_args()
+
+    config = carregar_config(args.config, peers=args.peers, repeat=args.repeat)
+    relatorio = benchmark(config, args.dir, args.keep)
+    texto = json.dumps(relatorio, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(texto + '\n')
+        print(f"[BENCH] Relatório salvo em {args.output}")
+    else:
+        print(texto)
@@ -0,0 +1,74 @@
+import struct
+
+# Índice de bloco em uma lista de deltas (HAVES): inteiro sem sinal de 32 bits
+INDICE = struct.Struct('!I')
+
+
+class Bitfield:
+    """
+    Conjunto de índices de blocos guardado em um bytearray, um bit por bloco.
+    O bloco 0 é o bit mais significativo do primeiro byte, o mesmo formato enviado pela rede,
+    então uma mensagem de disponibilidade tem (total de blocos + 7) // 8 bytes.
+    """
+
+    def __init__(self, tamanho, dados=None):
+        self.tamanho = tamanho
+        self.bits = bytearray((tamanho + 7) // 8)
+        if dados:
+            n = min(len(dados), len(self.bits))
+            self.bits[:n] = dados[:n]
+            sobra = len(self.bits) * 8 - tamanho
+            if sobra and self.bits:
+                # Bits de preenchimento do último byte não representam blocos
+                self.bits[-1] &= (0xFF << sobra) & 0xFF
+        self.contagem = int.from_bytes(self.bits, 'big').bit_count()
+
+    @classmethod
+    def from_bytes(cls, tamanho, dados):
+        return cls(tamanho, dados)
+
+    def to_bytes(self):
+        return bytes(self.bits)
+
+    def copy(self):
+        return Bitfield(self.tamanho, self.bits)
+
+    def add(self, indice):
+        if not 0 <= indice < self.tamanho:
+            raise IndexError(f"Bloco {indice} fora do bitfield de {self.tamanho} blocos")
+        mascara = 0x80 >> (indice & 7)
+        if not self.bits[indice >> 3] & mascara:
+            self.bits[indice >> 3] |= mascara
+            self.contagem += 1
+
+    def discard(self, indice):
+        if indice in self:
+            self.bits[indice >> 3] &= ~(0x80 >> (indice & 7)) & 0xFF
+            self.contagem -= 1
+
+    def __contains__(self, indice):
+        return 0 <= indice < self.tamanho and bool(self.bits[indice >> 3] & (0x80 >> (indice & 7)))
+
+    def __len__(self):
+        return self.contagem
+
+    def __iter__(self):
+        for i, byte in enumerate(self.bits):
+            if byte:
+                for bit in range(8):
+                    if byte & (0x80 >> bit):
+                        yield i * 8 + bit
+
+    def __repr__(self):
+        return f'Bitfield({self.contagem}/{self.tamanho})'
+
+
+def encode_indices(indices):
+    """
+    Codifica uma lista de índices de blocos (delta de HAVEs) em 4 bytes por índice.
+    """
+    return b''.join(INDICE.pack(i) for i in indices)
+
+
+def decode_indices(dados):
+    return [i for (i,) in INDICE.iter_unpack(dados)]
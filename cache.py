@@ -0,0 +1,99 @@
+import threading
+from collections import OrderedDict
+
+# Capacidade padrão (bytes) do cache de peças em memória de um peer; 0 desliga o cache
+CACHE_SIZE = 64 * 1024 * 1024
+
+
+class PieceCache:
+    """
+    Cache LRU de peças em memória, limitado pela soma dos tamanhos das peças e compartilhado
+    por todas as conexões e swarms de um peer. As chaves são (info_hash, índice da peça), ou
+    (info_hash, índice, offset, tamanho, codec) para os trechos já comprimidos de uma peça.
+
+    get_or_load devolve a peça em cache ou a carrega uma única vez, mesmo com várias conexões
+    pedindo a mesma peça ao mesmo tempo (as demais esperam a primeira leitura). Quem serve
+    um trecho usa memoryview sobre o buffer devolvido, sem copiar os bytes.
+    """
+
+    def __init__(self, capacidade=CACHE_SIZE):
+        self.capacidade = capacidade
+        self.pecas = OrderedDict()  # chave -> bytes, da menos para a mais recentemente usada
+        self.tamanho = 0
+        self.carregando = {}  # chave -> Event de quem está lendo a peça do disco
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def __contains__(self, chave):
+        with self.lock:
+            return chave in self.pecas
+
+    def fits(self, tamanho):
+        """
+        Indica se uma peça de tamanho bytes pode ficar no cache.
+        """
+        return 0 < tamanho <= self.capacidade
+
+    def _insert(self, chave, dados):
+        antigo = self.pecas.pop(chave, None)
+        if antigo is not None:
+            self.tamanho -= len(antigo)
+        self.pecas[chave] = dados
+        self.tamanho += len(dados)
+        while self.tamanho > self.capacidade:
+            _, removido = self.pecas.popitem(last=False)
+            self.tamanho -= len(removido)
+            self.evictions += 1
+
+    def get_or_load(self, chave, carregar):
+        """
+        Peça da chave; num miss chama carregar() (fora do lock) e guarda o resultado.
+        """
+        while True:
+            with self.lock:
+                dados = self.pecas.get(chave)
+                if dados is not None:
+                    self.pecas.move_to_end(chave)
+                    self.hits += 1
+                    return dados
+                evento = self.carregando.get(chave)
+                if evento is None:
+                    self.misses += 1
+                    evento = self.carregando[chave] = threading.Event()
+                    break
+            # Outra conexão já está lendo esta peça: espera e tenta de novo
+            evento.wait()
+        try:
+            dados = carregar()
+            if self.fits(len(dados)):
+                with self.lock:
+                    self._insert(chave, dados)
+            return dados
+        finally:
+            with self.lock:
+                del self.carregando[chave]
+            evento.set()
+
+    def discard(self, chave):
+        with self.lock:
+            dados = self.pecas.pop(chave, None)
+            if dados is not None:
+                self.tamanho -= len(dados)
+
+    def stats(self):
+        """
+        Estatísticas do cache: hits, misses, taxa de acerto, remoções, peças e bytes em cache.
+        """
+        with self.lock:
+            consultas = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / consultas, 3) if consultas else 0.0,
+                'evictions': self.evictions,
+                'pieces': len(self.pecas),
+                'bytes': self.tamanho,
+                'capacity': self.capacidade,
+            }
@@ -0,0 +1,131 @@
+import random
+import threading
+import time
+from collections import deque
+
+# Quantidade de peers desbloqueados pela taxa medida (além do slot otimista)
+UNCHOKE_SLOTS = 4
+
+# Rodadas do unchoke loop que o mesmo peer fica no slot otimista antes de trocar
+OPTIMISTIC_ROUNDS = 3
+
+# Janela (segundos) das taxas de upload e download medidas por peer
+RATE_WINDOW = 20
+
+
+class RateMeter:
+    """
+    Taxa de transferência por peer em uma janela deslizante: os bytes são somados em
+    baldes de um segundo e os baldes mais velhos que a janela são descartados.
+    """
+
+    def __init__(self, janela=RATE_WINDOW):
+        self.janela = janela
+        self.baldes = {}  # peer -> deque de [segundo, bytes]
+
+    def record(self, peer, nbytes, agora=None):
+        segundo = int(agora if agora is not None else time.monotonic())
+        baldes = self.baldes.setdefault(peer, deque())
+        if baldes and baldes[-1][0] == segundo:
+            baldes[-1][1] += nbytes
+        else:
+            baldes.append([segundo, nbytes])
+        self._trim(baldes, segundo)
+
+    def _trim(self, baldes, segundo):
+        while baldes and baldes[0][0] <= segundo - self.janela:
+            baldes.popleft()
+
+    def rate(self, peer, agora=None):
+        """
+        Bytes por segundo do peer na janela.
+        """
+        baldes = self.baldes.get(peer)
+        if not baldes:
+            return 0.0
+        self._trim(baldes, int(agora if agora is not None else time.monotonic()))
+        return sum(n for _, n in baldes) / self.janela
+
+    def active(self, agora=None):
+        """
+        Peers com alguma transferência dentro da janela; os demais são esquecidos.
+        """
+        segundo = int(agora if agora is not None else time.monotonic())
+        for peer in list(self.baldes):
+            self._trim(self.baldes[peer], segundo)
+            if not self.baldes[peer]:
+                del self.baldes[peer]
+        return set(self.baldes)
+
+
+class Choker:
+    """
+    Tit-for-tat baseado nas taxas medidas de um swarm.
+
+    A cada rodada (recalculate) ficam desbloqueados os slots peers que mais nos enviaram
+    dados na janela (downloading) ou, quando o swarm já está completo (seeding), os que
+    mais rápido baixam de nós. Um slot otimista, trocado a cada OPTIMISTIC_ROUNDS rodadas,
+    dá a um peer qualquer a chance de provar sua taxa.
+
+    O bloqueio vale no lado de quem serve: allows é consultado antes de enviar cada chunk.
+    Enquanto houver slots livres, peers novos são desbloqueados na hora, sem esperar a rodada.
+    """
+
+    def __init__(self, slots=UNCHOKE_SLOTS, optimistic_rounds=OPTIMISTIC_ROUNDS, janela=RATE_WINDOW):
+        self.slots = slots
+        self.optimistic_rounds = optimistic_rounds
+        self.upload = RateMeter(janela)    # bytes que enviamos a cada peer
+        self.download = RateMeter(janela)  # bytes que cada peer nos enviou
+        self.unchoked = set()
+        self.optimistic = None
+        self.rodadas_otimista = 0
+        self.lock = threading.Lock()
+
+    def record_upload(self, peer, nbytes):
+        with self.lock:
+            self.upload.record(peer, nbytes)
+
+    def record_download(self, peer, nbytes):
+        with self.lock:
+            self.download.record(peer, nbytes)
+
+    def allows(self, peer):
+        """
+        Indica se o peer pode receber dados agora. Peers sem identificação (sem HELLO) são recusados.
+        """
+        if peer is None:
+            return False
+        with self.lock:
+            if peer in self.unchoked:
+                return True
+            if len(self.unchoked) < self.slots + 1:
+                self.unchoked.add(peer)
+                return True
+            return False
+
+    def recalculate(self, known_peers=(), seeding=False):
+        """
+        Refaz o conjunto de peers desbloqueados. Os candidatos são os peers conhecidos e os
+        que transferiram dados conosco na janela. Retorna (desbloqueados pela taxa, otimista).
+        """
+        with self.lock:
+            candidatos = set(known_peers) | self.upload.active() | self.download.active()
+            medidor = self.upload if seeding else self.download
+            ranking = sorted(candidatos, key=medidor.rate, reverse=True)
+            fixos = set(ranking[:self.slots])
+            restantes = [p for p in ranking if p not in fixos]
+
+            self.rodadas_otimista += 1
+            if (self.optimistic not in restantes or self.rodadas_otimista >= self.optimistic_rounds):
+                self.optimistic = random.choice(restantes) if restantes else None
+                self.rodadas_otimista = 0
+            self.unchoked = fixos | ({self.optimistic} if self.optimistic is not None else set())
+            return fixos, self.optimistic
+
+    def rates(self):
+        """
+        Taxas atuais (upload, download) em bytes/s de cada peer ativo.
+        """
+        with self.lock:
+            peers = self.upload.active() | self.download.active()
+            return {p: (round(self.upload.rate(p)), round(self.download.rate(p))) for p in peers}
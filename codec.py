@@ -0,0 +1,54 @@
+import zlib
+
+# Nível de compressão do zlib (1 = mais rápido, 9 = menor); as formas comprimidas das peças
+# mais pedidas ficam no cache, então cada trecho é comprimido poucas vezes
+ZLIB_LEVEL = 6
+
+
+class ZlibCodec:
+    """
+    Compressão dos trechos de bloco com o zlib da biblioteca padrão.
+    """
+
+    nome = 'zlib'
+
+    def __init__(self, nivel=ZLIB_LEVEL):
+        self.nivel = nivel
+
+    def compress(self, dados):
+        return zlib.compress(dados, self.nivel)
+
+    def decompress(self, dados, tamanho):
+        """
+        Descomprime um trecho de exatamente tamanho bytes; a saída é limitada a esse tamanho,
+        então um corpo malformado não consegue crescer sem limite na memória.
+        """
+        descompressor = zlib.decompressobj()
+        saida = descompressor.decompress(dados, tamanho)
+        sobra = descompressor.unconsumed_tail or descompressor.unused_data
+        if len(saida) != tamanho or not descompressor.eof or sobra:
+            raise ValueError(f"Trecho comprimido inválido: esperados {tamanho} bytes")
+        return saida
+
+
+# Codecs conhecidos, pelo nome usado no HELLO e nas respostas ZDATA. Um codec novo precisa
+# de nome, compress(dados) e decompress(dados, tamanho) e entra com register_codec
+CODECS = {}
+
+
+def register_codec(codec):
+    CODECS[codec.nome] = codec
+
+
+def parse_codecs(hello):
+    """
+    Codecs aceitos por quem mandou 'HELLO porta [codec,codec...]' e que este peer também conhece.
+    Um HELLO sem a lista (peer antigo) não aceita compressão.
+    """
+    partes = hello.split()
+    if len(partes) < 3:
+        return frozenset()
+    return frozenset(nome for nome in partes[2].split(',') if nome in CODECS)
+
+
+register_codec(ZlibCodec())
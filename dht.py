@@ -0,0 +1,532 @@
+import hashlib
+import hmac
+import ipaddress
+import json
+import os
+import random
+import re
+import socket
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, wait, FIRST_COMPLETED, TimeoutError as FutureTimeout
+from logger import gerar_log, DEBUG, WARNING
+from metrics import REGISTRY
+
+# Porta UDP do nó DHT do peer X: DHT_PORT_BASE + X
+DHT_PORT_BASE = 8000
+
+# Identificadores de nós e chaves: 160 bits, o mesmo tamanho do info-hash (SHA-1)
+ID_BITS = 160
+
+# Nós por bucket da tabela de roteamento e tamanho das listas de nós mais próximos
+K = 8
+
+# Consultas em paralelo em cada passo de uma busca iterativa
+ALPHA = 3
+
+# Tempo (segundos) para um nó responder uma consulta
+RPC_TIMEOUT = 2
+
+# Um nó sem responder há NO_STALE segundos pode ser trocado por outro num bucket cheio
+NO_STALE = 15 * 60
+
+# Tempo (segundos) que um anúncio (announce_peer) fica guardado no nó
+PEER_TTL = 30 * 60
+
+# Troca do segredo dos tokens de announce_peer; tokens do segredo anterior ainda valem
+TOKEN_ROTACAO = 5 * 60
+
+# Intervalo (segundos) entre dois anúncios de um swarm na DHT; sem peers conhecidos, DHT_RETRY
+DHT_ANNOUNCE_INTERVAL = 60
+DHT_RETRY = 10
+
+# Maior datagrama aceito
+MAX_PACOTE = 8192
+
+# Peers devolvidos por get_peers
+MAX_PEERS = 50
+
+LOOKUP_SECONDS = REGISTRY.histogram('minibit_dht_lookup_seconds', 'Duração das buscas iterativas na DHT', ('tipo',))
+LOOKUP_QUERIES = REGISTRY.histogram('minibit_dht_lookup_queries', 'Consultas enviadas em cada busca iterativa',
+                                    ('tipo',), buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+MESSAGES = REGISTRY.counter('minibit_dht_messages_total', 'Datagramas da DHT enviados e recebidos', ('direcao',))
+MESSAGES_OUT = MESSAGES.labels('out')
+MESSAGES_IN = MESSAGES.labels('in')
+TIMEOUTS = REGISTRY.counter('minibit_dht_timeouts_total', 'Consultas da DHT sem resposta')
+
+
+def dht_key(info_hash):
+    """
+    Chave de um swarm na DHT: o próprio info-hash (SHA-1 em hexadecimal) como inteiro de 160 bits.
+    """
+    return int(info_hash, 16)
+
+
+def new_node_id():
+    return random.getrandbits(ID_BITS)
+
+
+def _hex(valor):
+    return format(valor, '040x')
+
+
+# Id de nó (ou chave) nas mensagens: 160 bits em hexadecimal
+ID_HEX = re.compile(r'[0-9a-fA-F]{40}')
+
+
+def parse_id(valor):
+    """
+    Id de nó recebido em uma mensagem; levanta ValueError se não for um id de 160 bits em hexadecimal.
+    """
+    if not isinstance(valor, str) or not ID_HEX.fullmatch(valor):
+        raise ValueError(f"id inválido: {valor!r}")
+    return int(valor, 16)
+
+
+def parse_address(ip, porta):
+    """
+    (ip, porta) recebido em uma resposta, ou None se o ip não é um IPv4 ou a porta está fora do intervalo.
+    """
+    if not isinstance(ip, str) or type(porta) is not int or not 0 < porta < 65536:
+        return None
+    try:
+        ipaddress.IPv4Address(ip)
+    except ValueError:
+        return None
+    return ip, porta
+
+
+def _entries(resposta, campo):
+    valor = resposta.get(campo)
+    return valor if isinstance(valor, list) else ()
+
+
+def resolve(endereco):
+    """
+    Endereço (ip, porta) IPv4 de um (host, porta). Nomes como 'localhost' viram o IP, que é o
+    que recvfrom devolve nas respostas e o que fica nas consultas pendentes e na tabela.
+    """
+    host, porta = endereco
+    return socket.getaddrinfo(host, int(porta), socket.AF_INET, socket.SOCK_DGRAM)[0][4]
+
+
+class RoutingTable:
+    """
+    Tabela de roteamento do Kademlia: um bucket por bit de distância (XOR) ao nó dono, cada
+    um com até k nós, do visto há mais tempo para o mais recente. Um bucket cheio só troca
+    o nó mais antigo se ele não é visto há NO_STALE segundos; nós que não respondem saem.
+    """
+
+    def __init__(self, proprio, k=K):
+        self.proprio = proprio
+        self.k = k
+        self.buckets = [OrderedDict() for _ in range(ID_BITS)]  # id -> (endereço, visto em)
+        self.lock = threading.Lock()
+
+    def _bucket(self, no_id):
+        return self.buckets[(no_id ^ self.proprio).bit_length() - 1]
+
+    def seen(self, no_id, endereco):
+        if no_id == self.proprio:
+            return
+        agora = time.monotonic()
+        with self.lock:
+            bucket = self._bucket(no_id)
+            if no_id in bucket:
+                bucket.move_to_end(no_id)
+            elif len(bucket) >= self.k:
+                antigo, (_, visto) = next(iter(bucket.items()))
+                if agora - visto < NO_STALE:
+                    return
+                del bucket[antigo]
+            bucket[no_id] = (endereco, agora)
+
+    def remove(self, no_id):
+        if no_id == self.proprio:
+            return
+        with self.lock:
+            self._bucket(no_id).pop(no_id, None)
+
+    def closest(self, alvo, n=K):
+        """
+        Os n nós conhecidos mais próximos de alvo, como [(id, endereço)].
+        """
+        with self.lock:
+            nos = [(no_id, endereco) for bucket in self.buckets for no_id, (endereco, _) in bucket.items()]
+        nos.sort(key=lambda no: no[0] ^ alvo)
+        return nos[:n]
+
+    def __len__(self):
+        with self.lock:
+            return sum(len(bucket) for bucket in self.buckets)
+
+
+class DHTNode:
+    """
+    Nó de uma DHT no estilo Kademlia sobre UDP, que guarda e encontra os peers de cada swarm
+    pela chave do info-hash. As mensagens são objetos JSON em um datagrama:
+    {"t": transação, "y": "q"|"r"|"e", "id": nó, "q": consulta, "a": argumentos, "r": resposta}.
+
+    Consultas: ping; find_node (alvo) devolve os k nós mais próximos do alvo; get_peers (chave)
+    devolve os peers guardados para a chave, os nós mais próximos e um token; announce_peer
+    (chave, porta, token) guarda o remetente como peer da chave.
+
+    Uma thread recebe os datagramas: responde as consultas e entrega as respostas às Futures
+    das consultas enviadas. As buscas iterativas (lookup) mantêm até alpha consultas em voo.
+    """
+
+    def __init__(self, porta=0, host='127.0.0.1', node_id=None, k=K, alpha=ALPHA, timeout=RPC_TIMEOUT, nome='DHT'):
+        self.id = new_node_id() if node_id is None else node_id
+        self.k = k
+        self.alpha = alpha
+        self.timeout = timeout
+        self.nome = nome
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, porta))
+        self.endereco = self.sock.getsockname()
+        self.tabela = RoutingTable(self.id, k)
+        self.pendentes = {}  # transação -> (Future, endereço consultado)
+        self.next_t = 1
+        self.lock = threading.Lock()
+        self.armazenados = {}  # chave -> {peer: expira em}
+        self.segredos = [os.urandom(16), os.urandom(16)]
+        self.troca_segredo = time.monotonic() + TOKEN_ROTACAO
+        self.fechado = False
+
+        # Estatísticas do nó, também expostas nas métricas do processo
+        self.enviadas = 0
+        self.recebidas = 0
+        self.timeouts = 0
+        self.buscas = 0
+        self.consultas_buscas = 0
+        self.tempo_buscas = 0.0
+
+        threading.Thread(target=self._receiver_loop, name='dht', daemon=True).start()
+
+    # --- Transporte ---
+
+    def _send(self, mensagem, endereco):
+        mensagem['id'] = _hex(self.id)
+        try:
+            self.sock.sendto(json.dumps(mensagem, separators=(',', ':')).encode(), endereco)
+        except OSError as e:
+            gerar_log("[%s] Erro ao enviar para %s: %s", self.nome, endereco, e, nivel=DEBUG)
+            return False
+        self.enviadas += 1
+        MESSAGES_OUT.inc()
+        return True
+
+    def query(self, endereco, consulta, argumentos=None):
+        """
+        Envia uma consulta e retorna uma Future com o dict da resposta. Quem espera a Future
+        deve chamar expire se desistir dela. endereco pode trazer um nome de host (resolve).
+        """
+        future = Future()
+        future.t = None
+        try:
+            endereco = resolve(endereco)
+        except (OSError, ValueError) as e:
+            future.set_exception(ConnectionError(f"Endereço inválido {endereco}: {e}"))
+            return future
+        with self.lock:
+            t = self.next_t
+            self.next_t = self.next_t % 0xFFFFFFFF + 1
+            self.pendentes[t] = (future, endereco)
+        future.t = t
+        if not self._send({'t': t, 'y': 'q', 'q': consulta, 'a': argumentos or {}}, endereco):
+            self.expire(future, ConnectionError(f"Falha ao enviar para {endereco}"))
+        return future
+
+    def call(self, endereco, consulta, argumentos=None):
+        """
+        Envia uma consulta e espera a resposta (até timeout segundos).
+        """
+        future = self.query(endereco, consulta, argumentos)
+        try:
+            return future.result(self.timeout)
+        except FutureTimeout:
+            self.expire(future)
+            raise
+
+    def expire(self, future, erro=None):
+        with self.lock:
+            self.pendentes.pop(future.t, None)
+        if not future.done():
+            if erro is None:
+                self.timeouts += 1
+                TIMEOUTS.inc()
+                erro = TimeoutError("Nó da DHT não respondeu")
+            future.set_exception(erro)
+
+    def _receiver_loop(self):
+        while not self.fechado:
+            try:
+                dados, endereco = self.sock.recvfrom(MAX_PACOTE)
+            except OSError:
+                if self.fechado:
+                    break
+                continue  # por exemplo, ICMP de porta fechada de um envio anterior
+            self.recebidas += 1
+            MESSAGES_IN.inc()
+            try:
+                mensagem = json.loads(dados)
+                remetente = parse_id(mensagem['id'])
+                tipo = mensagem['y']
+            except (ValueError, KeyError, TypeError) as e:
+                gerar_log("[%s] Datagrama inválido de %s: %s", self.nome, endereco, e, nivel=DEBUG)
+                continue
+            if tipo == 'q':
+                self._answer(mensagem, remetente, endereco)
+            elif tipo in ('r', 'e'):
+                t = mensagem.get('t')
+                if not isinstance(t, int):
+                    continue  # as transações que enviamos são inteiros
+                with self.lock:
+                    future, consultado = self.pendentes.pop(t, (None, None))
+                if future is None or consultado != endereco:
+                    continue  # resposta atrasada (já expirada) ou de quem não foi consultado
+                if tipo == 'e':
+                    future.set_exception(ValueError(mensagem.get('e')))
+                elif not isinstance(mensagem.get('r', {}), dict):
+                    future.set_exception(ValueError(f"Resposta inválida de {endereco}"))
+                else:
+                    self.tabela.seen(remetente, endereco)
+                    future.set_result(mensagem.get('r', {}))
+
+    # --- Consultas recebidas ---
+
+    def _token(self, ip, segredo):
+        return hmac.new(segredo, ip.encode(), hashlib.sha1).hexdigest()[:16]
+
+    def _rotate_secret(self):
+        agora = time.monotonic()
+        if agora >= self.troca_segredo:
+            self.segredos = [os.urandom(16), self.segredos[0]]
+            self.troca_segredo = agora + TOKEN_ROTACAO
+
+    def _nodes(self, alvo):
+        return [[_hex(no_id), ip, porta] for no_id, (ip, porta) in self.tabela.closest(alvo, self.k)]
+
+    def _answer(self, mensagem, remetente, endereco):
+        t = mensagem.get('t')
+        consulta = mensagem.get('q')
+        argumentos = mensagem.get('a') or {}
+        try:
+            if consulta == 'ping':
+                resposta = {}
+            elif consulta == 'find_node':
+                resposta = {'nodes': self._nodes(parse_id(argumentos['alvo']))}
+            elif consulta == 'get_peers':
+                chave = parse_id(argumentos['chave'])
+                self._rotate_secret()
+                resposta = {'nodes': self._nodes(chave), 'token': self._token(endereco[0], self.segredos[0])}
+                peers = self.stored_peers(chave)
+                if peers:
+                    resposta['peers'] = peers
+            elif consulta == 'announce_peer':
+                chave = parse_id(argumentos['chave'])
+                self._rotate_secret()
+                if argumentos.get('token') not in [self._token(endereco[0], s) for s in self.segredos]:
+                    self._send({'t': t, 'y': 'e', 'e': 'token inválido'}, endereco)
+                    return
+                peer = parse_address(endereco[0], argumentos['porta'])
+                if peer is None:
+                    raise ValueError(f"porta inválida: {argumentos['porta']!r}")
+                self.store_peer(chave, peer)
+                resposta = {}
+            else:
+                self._send({'t': t, 'y': 'e', 'e': f'consulta desconhecida: {consulta}'}, endereco)
+                return
+        except (KeyError, ValueError, TypeError) as e:
+            self._send({'t': t, 'y': 'e', 'e': f'argumentos inválidos: {e}'}, endereco)
+            return
+        self._send({'t': t, 'y': 'r', 'r': resposta}, endereco)
+        # Quem consulta também entra na tabela, como no Kademlia
+        self.tabela.seen(remetente, endereco)
+
+    def store_peer(self, chave, peer):
+        with self.lock:
+            self.armazenados.setdefault(chave, {})[peer] = time.monotonic() + PEER_TTL
+
+    def stored_peers(self, chave):
+        agora = time.monotonic()
+        with self.lock:
+            peers = self.armazenados.get(chave, {})
+            for peer in [p for p, expira in peers.items() if expira < agora]:
+                del peers[peer]
+            return [list(p) for p in list(peers)[-MAX_PEERS:]]
+
+    # --- Buscas ---
+
+    def lookup(self, alvo, consulta='find_node'):
+        """
+        Busca iterativa: consulta os nós mais próximos de alvo, até alpha por vez, e segue
+        os nós devolvidos enquanto algum dos k mais próximos ainda não tiver respondido.
+        Retorna ([(id, endereço, token)] dos k nós mais próximos que responderam, peers encontrados).
+        """
+        inicio = time.perf_counter()
+        argumentos = {'alvo': _hex(alvo)} if consulta == 'find_node' else {'chave': _hex(alvo)}
+        candidatos = dict(self.tabela.closest(alvo, self.k))
+        consultados, responderam, tokens, peers = set(), set(), {}, []
+        em_voo = {}  # Future -> (id, prazo)
+        enviadas = 0
+        while True:
+            fila = [n for n in sorted(candidatos, key=lambda n: n ^ alvo)
+                    if n not in consultados or n in responderam][:self.k]
+            for no_id in fila:
+                if len(em_voo) >= self.alpha:
+                    break
+                if no_id not in consultados:
+                    consultados.add(no_id)
+                    em_voo[self.query(candidatos[no_id], consulta, argumentos)] = (no_id, time.monotonic() + self.timeout)
+                    enviadas += 1
+            if not em_voo:
+                break
+            prazo = min(p for _, p in em_voo.values())
+            prontas, _ = wait(list(em_voo), timeout=max(prazo - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+            agora = time.monotonic()
+            for future in [f for f, (_, p) in em_voo.items() if f in prontas or p <= agora]:
+                no_id, _ = em_voo.pop(future)
+                if not future.done():
+                    self.expire(future)
+                try:
+                    resposta = future.result()
+                except Exception:
+                    # Quem não responde sai dos candidatos e da tabela
+                    candidatos.pop(no_id, None)
+                    self.tabela.remove(no_id)
+                    continue
+                responderam.add(no_id)
+                if isinstance(resposta.get('token'), str):
+                    tokens[no_id] = resposta['token']
+                # Entradas malformadas (id, ip ou porta inválidos) são ignoradas
+                for entrada in _entries(resposta, 'peers'):
+                    peer = parse_address(*entrada) if isinstance(entrada, list) and len(entrada) == 2 else None
+                    if peer is not None and peer not in peers:
+                        peers.append(peer)
+                for entrada in _entries(resposta, 'nodes'):
+                    if not isinstance(entrada, list) or len(entrada) != 3:
+                        continue
+                    try:
+                        novo = parse_id(entrada[0])
+                    except ValueError:
+                        continue
+                    endereco = parse_address(entrada[1], entrada[2])
+                    if endereco is not None and novo != self.id:
+                        candidatos.setdefault(novo, endereco)
+        duracao = time.perf_counter() - inicio
+        self.buscas += 1
+        self.consultas_buscas += enviadas
+        self.tempo_buscas += duracao
+        LOOKUP_SECONDS.labels(consulta).observe(duracao)
+        LOOKUP_QUERIES.labels(consulta).observe(enviadas)
+        proximos = sorted(responderam, key=lambda n: n ^ alvo)[:self.k]
+        gerar_log("[%s] Busca %s %s: %d consultas, %d nós, %d peers em %.1f ms", self.nome, consulta, _hex(alvo)[:8],
+                  enviadas, len(proximos), len(peers), duracao * 1000, nivel=DEBUG)
+        return [(n, candidatos[n], tokens.get(n)) for n in proximos], peers
+
+    def bootstrap(self, enderecos):
+        """
+        Entra na rede pelos nós informados: pinga cada um e busca o próprio id para povoar a
+        tabela. Retorna quantos nós a tabela conhece.
+        """
+        for endereco in enderecos:
+            try:
+                if resolve(endereco) == self.endereco:
+                    continue
+                self.call(endereco, 'ping')
+            except Exception as e:
+                gerar_log("[%s] Nó de bootstrap %s não respondeu: %s", self.nome, endereco, e, nivel=WARNING)
+        if len(self.tabela):
+            self.lookup(self.id)
+        return len(self.tabela)
+
+    def get_peers(self, info_hash):
+        """
+        Peers (ip, porta) anunciados na DHT para o swarm do info-hash.
+        """
+        _, peers = self.lookup(dht_key(info_hash), 'get_peers')
+        return peers
+
+    def announce(self, info_hash, porta):
+        """
+        Anuncia este peer (na porta informada) aos k nós mais próximos da chave do swarm e
+        retorna os peers já anunciados lá, aproveitando a mesma busca.
+        """
+        chave = dht_key(info_hash)
+        proximos, peers = self.lookup(chave, 'get_peers')
+        futures = [self.query(endereco, 'announce_peer', {'chave': _hex(chave), 'porta': porta, 'token': token})
+                   for _, endereco, token in proximos if token is not None]
+        _, atrasadas = wait(futures, timeout=self.timeout)
+        for future in atrasadas:
+            self.expire(future)
+        return peers
+
+    def stats(self):
+        """
+        Estatísticas do nó: nós na tabela, chaves guardadas, mensagens, timeouts e buscas.
+        """
+        buscas = self.buscas
+        return {
+            'nodes': len(self.tabela),
+            'keys': len(self.armazenados),
+            'messages_out': self.enviadas,
+            'messages_in': self.recebidas,
+            'timeouts': self.timeouts,
+            'lookups': buscas,
+            'lookup_avg_ms': round(self.tempo_buscas / buscas * 1000, 1) if buscas else 0.0,
+            'lookup_avg_queries': round(self.consultas_buscas / buscas, 1) if buscas else 0.0,
+        }
+
+    def close(self):
+        self.fechado = True
+        self.sock.close()
+
+
+def simular(n_nos=40, n_chaves=10, seed=None):
+    """
+    Sobe n_nos nós em localhost, todos entrando pela rede pelo primeiro, anuncia n_chaves
+    swarms a partir de nós sorteados e procura cada um a partir de outro nó. Retorna um resumo.
+    """
+    aleatorio = random.Random(seed)
+    nos = [DHTNode(nome=f'DHT {i}') for i in range(n_nos)]
+    try:
+        for no in nos[1:]:
+            no.bootstrap([nos[0].endereco])
+        # Uma segunda rodada de buscas espalha os nós que entraram por último
+        for no in nos:
+            no.lookup(no.id)
+        encontrados = 0
+        for i in range(n_chaves):
+            chave = hashlib.sha1(f'swarm-{i}'.encode()).hexdigest()
+            anunciante, buscador = aleatorio.sample(nos, 2)
+            anunciante.announce(chave, 6000 + i)
+            if (anunciante.endereco[0], 6000 + i) in buscador.get_peers(chave):
+                encontrados += 1
+        estatisticas = [no.stats() for no in nos]
+        buscas = sum(s['lookups'] for s in estatisticas)
+        return {
+            'nodes': n_nos,
+            'keys': n_chaves,
+            'found': encontrados,
+            'avg_table_size': round(sum(s['nodes'] for s in estatisticas) / n_nos, 1),
+            'lookups': buscas,
+            'lookup_avg_ms': round(sum(no.tempo_buscas for no in nos) / buscas * 1000, 1) if buscas else 0.0,
+            'lookup_avg_queries': round(sum(no.consultas_buscas for no in nos) / buscas, 1) if buscas else 0.0,
+            'messages': sum(s['messages_out'] for s in estatisticas),
+            'timeouts': sum(s['timeouts'] for s in estatisticas),
+        }
+    finally:
+        for no in nos:
+            no.close()
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Simula uma DHT MiniBit com vários nós em localhost')
+    parser.add_argument('--nodes', type=int, default=40, help='quantidade de nós')
+    parser.add_argument('--keys', type=int, default=10, help='swarms anunciados e procurados')
+    parser.add_argument('--seed', type=int, help='semente do sorteio de nós')
+    args = parser.parse_args()
+    print(json.dumps(simular(args.nodes, args.keys, args.seed), indent=2))
@@ -1,51 +1,64 @@
 import os
-import shutil
 import random
+from storage import open_store, block_index, STORAGES, STORAGE_ARQUIVO
+from utils import ler_metadados, ARQUIVO_METADADOS
 
 n_peers= 5
 
-def dist_block(seed_dir='blocos_peer_0', num_peers= n_peers, min_blocos=1, max_blocos=10):
+def dist_block(seed_dir='blocos_peer_0', num_peers= n_peers, min_blocos=1, max_blocos=10, storage=STORAGE_ARQUIVO):
     """
     Distribui aleatoriamente blocos do diretório seed para outros peers.
 
     Args:
-        seed_dir (str): Diretório que contém os blocos originais e arquivo 'block_count.txt'.
+        seed_dir (str): Diretório que contém os blocos originais e o arquivo 'metadata.json'.
         num_peers (int): Número total de peers na rede (incluindo o seed).
         min_blocos (int): Mínimo de blocos que um peer pode receber.
         max_blocos (int): Máximo de blocos que um peer pode receber.
+        storage (str): Tipo de armazenamento usado pelos peers ('arquivo' ou 'blocos').
     """
 
-    # Ler arquivo que indica a quantidade total de blocos no peer seed
-    contagem_path = os.path.join(seed_dir, 'block_count.txt')
-    if not os.path.exists(contagem_path):
-        raise FileNotFoundError(f"Arquivo de contagem de blocos não encontrado: {contagem_path}")
+    # Ler metadados que indicam a quantidade total de blocos (peças) no peer seed
+    metadados_path = os.path.join(seed_dir, ARQUIVO_METADADOS)
+    if not os.path.exists(metadados_path):
+        raise FileNotFoundError(f"Arquivo de metadados não encontrado: {metadados_path}")
     
-    # Obter o número total de blocos
-    with open(contagem_path, 'r') as f:
-        total_blocos = int(f.read().strip())
+    # Obter o número total de blocos e o tamanho de cada um
+    metadados = ler_metadados(seed_dir)
+    total_blocos = metadados['total_pieces']
+    tamanho_bloco = metadados['piece_size']
     
     # Criar lista com nomes dos blocos disponíveis
     blocos = [f'block_{i}' for i in range(total_blocos)]  # Aqui gera a lista limpa dos blocos reais
-    print(f"Seed tem {total_blocos} blocos.")
+    print(f"Seed tem {total_blocos} blocos de {tamanho_bloco} bytes.")
+
+    seed = open_store(storage, seed_dir, 'reconstruido_peer_0.txt', total_blocos, tamanho_bloco)
 
     # Distribuir blocos aleatoriamente entre os peers restantes
     for peer_id in range(1, num_peers):
-        destino = f'blocos_peer_{peer_id}'
-        if not os.path.exists(destino):
-            os.makedirs(destino)
+        destino = open_store(storage, f'blocos_peer_{peer_id}', f'reconstruido_peer_{peer_id}.txt',
+                             total_blocos, tamanho_bloco)
         
         # Escolher aleatoriamente quantos blocos este peer vai receber
-        num_blocos_peer = random.randint(min_blocos, min(max_blocos, total_blocos - 1))
+        # (com um único bloco não há o que distribuir: o peer baixa tudo do seed)
+        if total_blocos > 1:
+            num_blocos_peer = random.randint(min(min_blocos, total_blocos - 1), min(max_blocos, total_blocos - 1))
+        else:
+            num_blocos_peer = 0
 
         # Escolher blocos específicos para este peer
         blocos_para_copiar = random.sample(blocos, num_blocos_peer)
 
-        # Copiar cada bloco selecionado para o diretório do peer
+        # Copiar cada bloco selecionado para o armazenamento do peer
         for bloco in blocos_para_copiar:
-            src = os.path.join(seed_dir, bloco)
-            dst = os.path.join(destino, bloco)
-            shutil.copy(src, dst)
+            indice = block_index(bloco)
+            destino.write_block(indice, seed.read_block(indice))
+        destino.close()
         print(f"Peer {peer_id} recebeu {num_blocos_peer} blocos: {blocos_para_copiar}")
+    seed.close()
 
 if __name__ == '__main__':
-    dist_block()
+    import argparse
+    parser = argparse.ArgumentParser(description='Distribui blocos iniciais entre os peers')
+    parser.add_argument('--storage', choices=STORAGES, default=STORAGE_ARQUIVO)
+    args = parser.parse_args()
+    dist_block(storage=args.storage)
@@ -0,0 +1,64 @@
+import hashlib
+import json
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# Algoritmo usado no manifesto de hashes das peças (metadata.json)
+ALGORITMO_HASH = 'sha256'
+
+# Threads dedicadas ao cálculo de hashes; o hashlib libera o GIL em buffers grandes,
+# então o hash roda em paralelo com as threads (ou o loop de eventos) de rede
+HASH_WORKERS = 2
+
+
+def hash_piece(data):
+    """
+    Hash hexadecimal de uma peça completa.
+    """
+    return hashlib.new(ALGORITMO_HASH, data).hexdigest()
+
+
+def info_hash(metadados):
+    """
+    Identificador do swarm: SHA-1 do manifesto (nome, tamanhos e hashes das peças) serializado
+    de forma canônica, então o mesmo conteúdo sempre gera o mesmo info-hash.
+    """
+    return hashlib.sha1(json.dumps(metadados, sort_keys=True).encode()).hexdigest()
+
+
+def new_hash_pool(workers=HASH_WORKERS):
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix='hash')
+
+
+class PieceHasher:
+    """
+    Calcula o hash de uma peça à medida que os chunks chegam, sem esperar a peça inteira.
+
+    Cada chunk é entregue com seu índice na peça (feed) e absorvido por uma thread do pool;
+    chunks que chegam fora de ordem ficam guardados até os anteriores serem absorvidos.
+    A Future digest é resolvida com o hash quando o último chunk é absorvido.
+    """
+
+    def __init__(self, total_chunks, pool):
+        self.total_chunks = total_chunks
+        self.pool = pool
+        self.hash = hashlib.new(ALGORITMO_HASH)
+        self.proximo = 0
+        self.pendentes = {}
+        self.lock = threading.Lock()
+        self.digest = Future()
+
+    def feed(self, indice, dados):
+        """
+        Agenda a absorção do chunk de índice indice no pool de hash. Não bloqueia.
+        """
+        self.pool.submit(self._absorb, indice, dados)
+
+    def _absorb(self, indice, dados):
+        with self.lock:
+            self.pendentes[indice] = dados
+            while self.proximo in self.pendentes:
+                self.hash.update(self.pendentes.pop(self.proximo))
+                self.proximo += 1
+            if self.proximo == self.total_chunks and not self.digest.done():
+                self.digest.set_result(self.hash.hexdigest())
@@ -0,0 +1,165 @@
+import atexit
+import json
+import queue
+import sys
+import threading
+import time
+
+# Níveis de log, na mesma escala do módulo logging da biblioteca padrão
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+NIVEIS = {'debug': DEBUG, 'info': INFO, 'warning': WARNING, 'error': ERROR}
+NOMES_NIVEIS = {v: k.upper() for k, v in NIVEIS.items()}
+
+# Formatos de saída: texto ('[LOG] mensagem', o formato original) ou uma linha JSON por registro
+FORMATO_TEXTO = 'texto'
+FORMATO_JSON = 'json'
+FORMATOS = (FORMATO_TEXTO, FORMATO_JSON)
+
+# Registros em espera para a thread escritora; com a fila cheia, novos registros são descartados
+CAPACIDADE_FILA = 10000
+
+# Máximo de registros escritos de uma vez pela thread escritora
+LOTE = 512
+
+
+class AsyncLogger:
+    """
+    Log fora do caminho crítico: gerar_log só confere o nível e põe o registro em uma fila
+    limitada; a formatação (mensagem % args) e a escrita, em lotes, ficam com uma thread
+    escritora. Se a fila encher, o registro é descartado e contado em vez de bloquear quem loga.
+
+    Como a formatação acontece depois, os args devem ser valores que não mudam (números,
+    strings, tuplas ou cópias), nunca estruturas que outra thread altera sob um lock.
+    """
+
+    def __init__(self, nivel=INFO, formato=FORMATO_TEXTO, arquivo=None, capacidade=CAPACIDADE_FILA,
+                 saida=None):
+        self.nivel = nivel
+        self.formato = formato
+        self.saida = saida or sys.stdout
+        self.arquivo = open(arquivo, 'a', encoding='utf-8') if arquivo else None
+        self.fila = queue.Queue(maxsize=capacidade)
+        self.descartados = 0
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self._writer_loop, name='log', daemon=True)
+        self.thread.start()
+
+    def enabled(self, nivel):
+        return nivel >= self.nivel
+
+    def log(self, nivel, mensagem, args=(), campos=None, arquivo_log=None):
+        if nivel < self.nivel:
+            return
+        try:
+            self.fila.put_nowait((time.time(), nivel, mensagem, args, campos, arquivo_log))
+        except queue.Full:
+            with self.lock:
+                self.descartados += 1
+
+    def _format(self, registro):
+        instante, nivel, mensagem, args, campos, _ = registro
+        try:
+            texto = mensagem % args if args else mensagem
+        except Exception as e:
+            texto = f'{mensagem} {args!r} (erro ao formatar: {e})'
+        if self.formato == FORMATO_JSON:
+            linha = {'ts': round(instante, 6), 'nivel': NOMES_NIVEIS.get(nivel, nivel), 'msg': texto}
+            if campos:
+                linha.update(campos)
+            return json.dumps(linha, default=str, ensure_ascii=False)
+        if campos:
+            texto += ' ' + ' '.join(f'{k}={v}' for k, v in campos.items())
+        return f'[LOG] {texto}'
+
+    def _write(self, lote):
+        linhas = []
+        extras = {}
+        for registro in lote:
+            linha = self._format(registro)
+            linhas.append(linha)
+            if registro[5]:
+                extras.setdefault(registro[5], []).append(linha)
+        with self.lock:
+            descartados, self.descartados = self.descartados, 0
+        if descartados:
+            linhas.append(self._format((time.time(), WARNING, 'Log: %d registros descartados (fila cheia)',
+                                        (descartados,), None, None)))
+        texto = '\n'.join(linhas) + '\n'
+        try:
+            self.saida.write(texto)
+            self.saida.flush()
+            if self.arquivo is not None:
+                self.arquivo.write(texto)
+                self.arquivo.flush()
+            for caminho, extra in extras.items():
+                with open(caminho, 'a', encoding='utf-8') as f:
+                    f.write('\n'.join(extra) + '\n')
+        except (OSError, ValueError):
+            pass  # saída fechada (por exemplo, no encerramento do processo)
+
+    def _writer_loop(self):
+        while True:
+            lote = [self.fila.get()]
+            while len(lote) < LOTE:
+                try:
+                    lote.append(self.fila.get_nowait())
+                except queue.Empty:
+                    break
+            self._write(lote)
+            for _ in lote:
+                self.fila.task_done()
+
+    def flush(self):
+        """
+        Espera a thread escritora esvaziar a fila.
+        """
+        self.fila.join()
+
+    def close(self):
+        self.flush()
+        if self.arquivo is not None:
+            self.arquivo.close()
+            self.arquivo = None
+
+
+_logger = AsyncLogger()
+atexit.register(lambda: _logger.flush())
+
+
+def configurar_log(nivel=INFO, formato=FORMATO_TEXTO, arquivo=None, capacidade=CAPACIDADE_FILA):
+    """
+    Troca o logger do processo (nível mínimo, formato, arquivo JSON-lines/texto adicional).
+    nivel aceita o número ou o nome ('debug', 'info', ...).
+    """
+    global _logger
+    antigo = _logger
+    _logger = AsyncLogger(NIVEIS.get(nivel, nivel), formato, arquivo, capacidade)
+    antigo.close()
+    return _logger
+
+
+def log_enabled(nivel):
+    """
+    Indica se registros do nível seriam escritos; útil para evitar montar args caros.
+    """
+    return _logger.enabled(nivel)
+
+
+def log_pending():
+    """
+    Registros na fila esperando a thread escritora.
+    """
+    return _logger.fila.qsize()
+
+
+def gerar_log(mensagem, *args, nivel=INFO, arquivo_log=None, **campos):
+    """
+    Registra uma mensagem no log. A formatação é preguiçosa: com args, a mensagem é
+    formatada (mensagem % args) só pela thread escritora e só se o nível estiver habilitado.
+    Campos extras nomeados vão como chaves da linha JSON (ou 'chave=valor' no texto).
+    Se arquivo_log for informado, a linha também é acrescentada a esse arquivo.
+    """
+    _logger.log(nivel, mensagem, args, campos or None, arquivo_log)
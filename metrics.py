@@ -0,0 +1,362 @@
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Limites (segundos) dos buckets dos histogramas de latência
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Limites (segundos) dos buckets do tempo de espera por locks
+LOCK_BUCKETS = (0.000001, 0.00001, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(nomes, valores, extra=None):
+    pares = [f'{n}="{_escape(v)}"' for n, v in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return '{' + ','.join(pares) + '}' if pares else ''
+
+
+def _numero(valor):
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return repr(valor) if isinstance(valor, float) else str(valor)
+
+
+class _Metric:
+    tipo = None
+
+    def __init__(self, nome, ajuda, rotulos=()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self.lock = threading.Lock()
+        self.filhos = {}
+        self.funcao = None
+
+    def set_function(self, funcao):
+        """
+        Faz o valor vir de uma função chamada a cada coleta, útil para tamanhos de fila e
+        contagens que já existem em outro objeto. A função retorna um número ou um dict
+        {tupla de valores de rótulo: número}.
+        """
+        self.funcao = funcao
+
+    def _values(self):
+        valores = {v: f.valor for v, f in list(self.filhos.items())}
+        if self.funcao is not None:
+            try:
+                resultado = self.funcao()
+            except Exception:
+                resultado = None
+            if isinstance(resultado, dict):
+                valores.update({tuple(str(x) for x in k): v for k, v in resultado.items()})
+            elif resultado is not None:
+                valores[()] = resultado
+        return valores
+
+    def labels(self, *valores):
+        """
+        Série da métrica com os valores de rótulo informados (na ordem de rotulos).
+        Guarde o retorno quando os rótulos são fixos, para não refazer a busca a cada uso.
+        """
+        valores = tuple(str(v) for v in valores)
+        filho = self.filhos.get(valores)
+        if filho is None:
+            with self.lock:
+                filho = self.filhos.get(valores)
+                if filho is None:
+                    filho = self.filhos[valores] = self._new_child()
+        return filho
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        linhas = [f'# HELP {self.nome} {self.ajuda}', f'# TYPE {self.nome} {self.tipo}']
+        linhas += [f'{nome}{rotulos} {_numero(valor)}' for nome, rotulos, valor in self._samples()]
+        return '\n'.join(linhas)
+
+
+class _Value:
+    __slots__ = ('valor', 'lock')
+
+    def __init__(self, lock):
+        self.valor = 0
+        self.lock = lock
+
+    def inc(self, valor=1):
+        with self.lock:
+            self.valor += valor
+
+    def dec(self, valor=1):
+        with self.lock:
+            self.valor -= valor
+
+    def set(self, valor):
+        self.valor = valor
+
+
+class Counter(_Metric):
+    """
+    Contador que só cresce (bytes transferidos, mensagens recebidas, ...).
+    """
+    tipo = 'counter'
+
+    def _new_child(self):
+        return _Value(self.lock)
+
+    def inc(self, valor=1):
+        self.labels().inc(valor)
+
+    def _samples(self):
+        return [(self.nome, _labels(self.rotulos, v), valor) for v, valor in self._values().items()]
+
+
+class Gauge(_Metric):
+    """
+    Valor que sobe e desce: set/inc/dec ou uma função lida a cada coleta (set_function).
+    """
+    tipo = 'gauge'
+
+    def _new_child(self):
+        return _Value(self.lock)
+
+    def set(self, valor):
+        self.labels().set(valor)
+
+    def _samples(self):
+        return [(self.nome, _labels(self.rotulos, v), valor) for v, valor in self._values().items()]
+
+
+class _HistogramSeries:
+    """
+    Contagens de uma série de histograma. observe não tem lock próprio: quem chama garante a
+    exclusão (o lock da métrica ou, no TimedLock, o próprio lock medido).
+    """
+    __slots__ = ('limites', 'contagens', 'soma', 'total')
+
+    def __init__(self, limites):
+        self.limites = limites
+        self.contagens = [0] * (len(limites) + 1)
+        self.soma = 0.0
+        self.total = 0
+
+    def observe(self, valor):
+        self.contagens[bisect_left(self.limites, valor)] += 1
+        self.soma += valor
+        self.total += 1
+
+
+class _HistogramChild:
+    __slots__ = ('serie', 'lock')
+
+    def __init__(self, serie, lock):
+        self.serie = serie
+        self.lock = lock
+
+    def observe(self, valor):
+        with self.lock:
+            self.serie.observe(valor)
+
+    def time(self):
+        return _Timer(self)
+
+
+class _Timer:
+    """
+    Context manager que observa a duração do bloco with.
+    """
+    __slots__ = ('filho', 'inicio')
+
+    def __init__(self, filho):
+        self.filho = filho
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.filho.observe(time.perf_counter() - self.inicio)
+
+
+class Histogram(_Metric):
+    """
+    Distribuição de valores (latências) em buckets cumulativos, no formato do Prometheus.
+    """
+    tipo = 'histogram'
+
+    def __init__(self, nome, ajuda, rotulos=(), buckets=LATENCY_BUCKETS):
+        super().__init__(nome, ajuda, rotulos)
+        self.limites = tuple(sorted(buckets))
+        self.anexadas = {}  # valores de rótulo -> séries mantidas fora do lock da métrica
+
+    def _new_child(self):
+        return _HistogramChild(_HistogramSeries(self.limites), self.lock)
+
+    def observe(self, valor):
+        self.labels().observe(valor)
+
+    def time(self):
+        return self.labels().time()
+
+    def attach(self, *valores):
+        """
+        Cria uma série extra, somada às de mesmos rótulos na coleta, para um dono que
+        atualiza as contagens sob sua própria exclusão (ver TimedLock).
+        """
+        serie = _HistogramSeries(self.limites)
+        with self.lock:
+            self.anexadas.setdefault(tuple(str(v) for v in valores), []).append(serie)
+        return serie
+
+    def detach(self, serie, *valores):
+        """
+        Remove uma série anexada, somando suas contagens à série comum dos mesmos rótulos.
+        """
+        valores = tuple(str(v) for v in valores)
+        filho = self.labels(*valores)
+        with self.lock:
+            extras = self.anexadas.get(valores, [])
+            if serie in extras:
+                extras.remove(serie)
+            if not extras:
+                self.anexadas.pop(valores, None)
+            comum = filho.serie
+            for i, contagem in enumerate(serie.contagens):
+                comum.contagens[i] += contagem
+            comum.soma += serie.soma
+            comum.total += serie.total
+
+    def _samples(self):
+        with self.lock:
+            series = {v: [f.serie] for v, f in self.filhos.items()}
+            for v, extras in self.anexadas.items():
+                series.setdefault(v, []).extend(extras)
+            amostras = []
+            for v, grupo in series.items():
+                contagens = [sum(s.contagens[i] for s in grupo) for i in range(len(self.limites) + 1)]
+                acumulado = 0
+                for limite, contagem in zip(self.limites + ('+Inf',), contagens):
+                    acumulado += contagem
+                    le = 'le="%s"' % (limite if limite == '+Inf' else _numero(float(limite)))
+                    amostras.append((f'{self.nome}_bucket', _labels(self.rotulos, v, le), acumulado))
+                amostras.append((f'{self.nome}_sum', _labels(self.rotulos, v), sum(s.soma for s in grupo)))
+                amostras.append((f'{self.nome}_count', _labels(self.rotulos, v), sum(s.total for s in grupo)))
+            return amostras
+
+
+class Registry:
+    """
+    Conjunto de métricas de um processo. counter/gauge/histogram devolvem a métrica já
+    registrada com o mesmo nome, então módulos diferentes podem declarar a mesma métrica.
+    """
+
+    def __init__(self):
+        self.metricas = {}
+        self.lock = threading.Lock()
+
+    def _get(self, classe, nome, *args, **kwargs):
+        with self.lock:
+            metrica = self.metricas.get(nome)
+            if metrica is None:
+                metrica = self.metricas[nome] = classe(nome, *args, **kwargs)
+                if not metrica.rotulos:
+                    metrica.labels()  # métricas sem rótulos aparecem zeradas desde o início
+            elif not isinstance(metrica, classe):
+                raise ValueError(f'Métrica {nome} já registrada como {metrica.tipo}')
+            return metrica
+
+    def counter(self, nome, ajuda, rotulos=()):
+        return self._get(Counter, nome, ajuda, rotulos)
+
+    def gauge(self, nome, ajuda, rotulos=()):
+        return self._get(Gauge, nome, ajuda, rotulos)
+
+    def histogram(self, nome, ajuda, rotulos=(), buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, nome, ajuda, rotulos, buckets)
+
+    def render(self):
+        """
+        Todas as métricas no formato texto de exposição do Prometheus.
+        """
+        with self.lock:
+            metricas = sorted(self.metricas.values(), key=lambda m: m.nome)
+        return '\n'.join(m.render() for m in metricas) + '\n'
+
+
+REGISTRY = Registry()
+
+LOCK_WAIT = REGISTRY.histogram('minibit_lock_wait_seconds', 'Tempo de espera para adquirir cada lock instrumentado',
+                               ('lock',), buckets=LOCK_BUCKETS)
+
+
+class TimedLock:
+    """
+    Envolve um Lock/RLock medindo quanto tempo cada acquire esperou (minibit_lock_wait_seconds).
+    A tentativa sem bloqueio vem primeiro, então o caso sem disputa custa só uma observação;
+    a contagem é feita já com o lock adquirido, sem lock extra. Quando o TimedLock é coletado
+    (por exemplo, o estado de um swarm descartado pelo tracker), suas contagens vão para a série comum.
+    """
+
+    def __init__(self, lock, nome):
+        self._lock = lock
+        self.nome = nome
+        self.serie = LOCK_WAIT.attach(nome)
+        weakref.finalize(self, LOCK_WAIT.detach, self.serie, nome)
+
+    def acquire(self, blocking=True, timeout=-1):
+        if self._lock.acquire(False):
+            self.serie.observe(0.0)
+            return True
+        if not blocking:
+            return False
+        inicio = time.perf_counter()
+        if not self._lock.acquire(True, timeout):
+            return False
+        self.serie.observe(time.perf_counter() - inicio)
+        return True
+
+    def release(self):
+        self._lock.release()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc):
+        self._lock.release()
+
+
+def start_metrics_server(porta, host='localhost', registry=REGISTRY):
+    """
+    Serve as métricas por HTTP (GET /metrics) em uma thread daemon. Retorna o servidor.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            corpo = registry.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def log_message(self, *args):
+            pass  # cada coleta não precisa ir para o log
+
+    servidor = ThreadingHTTPServer((host, porta), Handler)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, name='metrics', daemon=True).start()
+    return servidor
@@ -1,210 +1,191 @@
+import asyncio
 import socket
 import threading
-import random
 import time
 import os
 import json
-from utils import dividir_pasta_em_blocos, reconstruir_arquivo, gerar_log, salvar_contagem_blocos
+from logger import gerar_log, configurar_log, log_pending, NIVEIS, FORMATOS, FORMATO_TEXTO, DEBUG, WARNING
+from storage import STORAGES, STORAGE_ARQUIVO, TAMANHO_BLOCO
+from hashing import new_hash_pool
+from scheduler import RequestBudget, MAX_OUTSTANDING, ENDGAME_THRESHOLD
+from swarm import Swarm, BYTES
+from choker import UNCHOKE_SLOTS
+from ratelimit import RateLimiter, SEM_LIMITE
+from cache import PieceCache, CACHE_SIZE
+from dht import DHTNode, DHT_PORT_BASE
+from codec import CODECS, parse_codecs
+from wire import (ConnectionPool, AsyncConnectionPool, ServerConnection, AsyncServerConnection, PIPELINE_DEPTH,
+                  read_frame, read_frame_async, send_frame, send_frame_buffer, encode_frame, encode_frame_header)
+from metrics import REGISTRY, start_metrics_server
 
 TRACKER_HOST = 'localhost'
 TRACKER_PORT = 5000
 PEER_PORT_BASE = 6000
 
+# Porta do endpoint HTTP de métricas (Prometheus) do peer X: METRICS_PORT_BASE + X
+METRICS_PORT_BASE = 7000
+
+# Espera (segundos) entre subir o servidor e começar os downloads, para os outros peers subirem
+START_DELAY = 10
+
+# Comandos trocados entre peers (os demais aparecem como 'outro' nas métricas)
+COMANDOS = ('HELLO', 'REQUEST', 'GET_BLOCKS', 'GET_HAVES', 'PEX')
+
+BYTES_OUT = BYTES.labels('out')
+MESSAGE_SECONDS = REGISTRY.histogram('minibit_peer_message_seconds',
+                                     'Tempo para atender cada mensagem recebida de outro peer', ('comando',))
+CONNECTIONS = REGISTRY.gauge('minibit_peer_connections', 'Conexões de outros peers sendo atendidas')
+TRACKER_SECONDS = REGISTRY.histogram('minibit_tracker_call_seconds', 'Duração das requisições ao tracker',
+                                     ('comando',))
+TRACKER_ERRORS = REGISTRY.counter('minibit_tracker_call_errors_total', 'Requisições ao tracker que falharam',
+                                  ('comando',))
+
+# Pasta com o metadata.json do swarm principal, publicado pelo peer 0
+SEED_DIR = 'blocos_peer_0'
+
+# Modos de execução: threads (original, mantido para comparação) ou loop de eventos asyncio
+MODO_THREAD = 'thread'
+MODO_ASYNCIO = 'asyncio'
+MODOS = (MODO_THREAD, MODO_ASYNCIO)
+
 class Peer:
-    def __init__(self, peer_id, arquivo_original='arquivos/'):
+    def __init__(self, peer_id, arquivo_original='arquivos/', queue_depth=PIPELINE_DEPTH,
+                 max_outstanding=MAX_OUTSTANDING, endgame_threshold=ENDGAME_THRESHOLD,
+                 storage=STORAGE_ARQUIVO, piece_size=TAMANHO_BLOCO, seeds=(), torrents=(),
+                 unchoke_slots=UNCHOKE_SLOTS, max_upload=SEM_LIMITE, max_download=SEM_LIMITE,
+                 max_upload_per_peer=SEM_LIMITE, max_download_per_peer=SEM_LIMITE, metrics_port=None,
+                 start_delay=START_DELAY, cache_size=CACHE_SIZE, dht_port=None, dht_bootstrap=(), use_tracker=True,
+                 super_seed=False, compress=None, compress_swarms=()):
         """
         Inicializa um peer com informações básicas, como diretório de blocos e porta específica.
+        queue_depth define quantas requisições podem ficar em voo por conexão,
+        max_outstanding o limite de requisições de bloco em voo somando todos os swarms,
+        storage o tipo de armazenamento dos blocos ('arquivo' ou 'blocos') e
+        piece_size o tamanho de cada bloco (peça) usado pelo seed ao dividir o arquivo e
+        unchoke_slots quantos peers cada swarm desbloqueia pela taxa medida (além do otimista).
+        Os limites max_* de banda são em bytes/s (0 = sem limite), para o peer todo e por conexão.
+        metrics_port é a porta do endpoint de métricas (padrão METRICS_PORT_BASE + peer_id, 0 = desligado)
+        e start_delay a espera, em segundos, entre subir o servidor e começar os downloads.
+        cache_size limita, em bytes, o cache de peças em memória usado para servir REQUESTs (0 = desligado).
+        dht_port liga um nó DHT nesta porta UDP (None = sem DHT), que entra na rede pelos endereços
+        de dht_bootstrap; com use_tracker falso, os peers são descobertos só pela DHT e por PEX.
+        Com super_seed, os swarms semeados por este peer revelam uma peça por vez a cada
+        downloader (superseed.py), em vez do bitfield completo.
+        compress é o codec (codec.py) usado para comprimir os blocos servidos a quem o aceita
+        (None = sem compressão), nos swarms de compress_swarms (nomes; vazio = todos).
+
+        Além do swarm principal (arquivo_original semeado pelo peer 0 e baixado pelos demais),
+        o peer semeia cada pasta de seeds e baixa cada torrent (pasta com o metadata.json de
+        outro seed). Todos os swarms compartilham a porta, o pool de conexões e o limite de
+        requisições em voo.
         """
         self.peer_id = peer_id
-        self.bloco_dir = f'blocos_peer_{peer_id}'
-        self.arquivo_original = arquivo_original
-        self.blocks = set()
-        self.known_peers = set()
-        self.peer_blocks_map = {}
-        self.unchoked_peers = set()
-        self.choked_peers = set()
-        self.lock = threading.RLock()  # Troquei para RLock
         self.port = PEER_PORT_BASE + peer_id
+        self.queue_depth = queue_depth
+        self.max_outstanding = max_outstanding
+        self.endgame_threshold = endgame_threshold
+        self.unchoke_slots = unchoke_slots
+        self.metrics_port = METRICS_PORT_BASE + peer_id if metrics_port is None else metrics_port
+        self.start_delay = start_delay
+        # HELLO identifica este peer (pela porta de escuta) em cada conexão que ele abre
+        # e lista os codecs que ele sabe descomprimir, para o outro lado poder comprimir os blocos
+        self.hello = f"HELLO {self.port} {','.join(CODECS)}"
+        self.compress = compress
+        self.compress_swarms = set(compress_swarms)
+
+        # Limites de banda (token buckets) globais e por conexão, ajustáveis com o peer rodando
+        self.upload_limiter = RateLimiter('upload', max_upload, max_upload_per_peer)
+        self.download_limiter = RateLimiter('download', max_download, max_download_per_peer)
+        self.limits_file = f'limites_peer_{peer_id}.json'
+        self.limits_mtime = None
+
+        # HAVEs empurrados pelos peers chegam pelas conexões do pool (quadros de id 0)
+        self.pool = ConnectionPool(queue_depth=queue_depth, hello=self.hello, limiter=self.download_limiter,
+                                   on_push=self.handle_push)
+        self.async_pool = None  # criado dentro do loop de eventos no modo asyncio
+        self.budget = RequestBudget(max_outstanding)
+        self.hash_pool = new_hash_pool()
+        # Peças servidas recentemente, compartilhadas por todas as conexões e swarms
+        self.piece_cache = PieceCache(cache_size)
+        self.storage = storage
+        self.super_seed = super_seed
+
+        # Nó DHT opcional, criado em start_dht
+        self.dht_port = dht_port
+        self.dht_bootstrap = [tuple(e) for e in dht_bootstrap]
+        self.dht = None
+        self.use_tracker = use_tracker
+
+        # Swarms deste peer; indexados pelo info-hash depois de preparados
+        if peer_id == 0:
+            principal = Swarm(self, origem=arquivo_original, bloco_dir=f'blocos_peer_{peer_id}',
+                              arquivo_saida=f'reconstruido_peer_{peer_id}.txt', piece_size=piece_size)
+        else:
+            principal = Swarm(self, metadados_dir=SEED_DIR, bloco_dir=f'blocos_peer_{peer_id}',
+                              arquivo_saida=f'reconstruido_peer_{peer_id}.txt')
+        self.pending_swarms = [principal]
+        self.pending_swarms += [Swarm(self, origem=pasta, piece_size=piece_size) for pasta in seeds]
+        self.pending_swarms += [Swarm(self, metadados_dir=pasta) for pasta in torrents]
+        self.swarms = {}
 
-        self.block_count_file = 'blocos_peer_0/block_count.txt'
-        self.BLOCKS_TOTAL = None
-        self.BLOCKS = []
-
-    def set_blocks_total_dynamic(self, max_retries=10, retry_delay=3):
-        """
-        Define dinamicamente o total de blocos lendo do arquivo block_count.txt.
-        """
-        attempts = 0
-        while attempts < max_retries:
-            try:
-                if self.peer_id == 0:
-                    blocos = [f for f in os.listdir(self.bloco_dir) if f.startswith('block_') and f != 'block_count.txt']
-                    total = len(blocos)
-                    salvar_contagem_blocos(self.bloco_dir)
-                    self.BLOCKS_TOTAL = total
-                    self.BLOCKS = [f'block_{i}' for i in range(total)]
-                    gerar_log(f"[Peer {self.peer_id}] Salvou total de blocos: {total}")
-                    return True
-                else:
-                    if os.path.exists(self.block_count_file):
-                        with open(self.block_count_file, 'r') as f:
-                            total = int(f.read().strip())
-                        self.BLOCKS_TOTAL = total
-                        self.BLOCKS = [f'block_{i}' for i in range(total)]
-                        gerar_log(f"[Peer {self.peer_id}] Leu total de blocos: {total}")
-                        return True
-                    else:
-                        gerar_log(f"[Peer {self.peer_id}] Arquivo {self.block_count_file} não encontrado. Tentando novamente ({attempts+1}/{max_retries})...")
-                        attempts += 1
-                        time.sleep(retry_delay)
-            except Exception as e:
-                gerar_log(f"[Peer {self.peer_id}] Erro ao ler/definir total de blocos: {e}")
-                attempts += 1
-                time.sleep(retry_delay)
-        gerar_log(f"[Peer {self.peer_id}] Falhou ao definir total de blocos após {max_retries} tentativas.")
-        return False
-
-    def load_blocks(self, max_retries=10, retry_delay=3):
-        """
-        Carrega blocos existentes no diretório local do peer.
-        """
-        attempts = 0
-        while attempts < max_retries:
-            if not os.path.exists(self.bloco_dir):
-                os.makedirs(self.bloco_dir)
-            blocos = [f for f in os.listdir(self.bloco_dir) if f.startswith('block_') and f != 'block_count.txt']
-            if blocos:
-                self.blocks = set(blocos)
-                gerar_log(f"[Peer {self.peer_id}] Carregou {len(self.blocks)} blocos locais.")
-                return True
-            else:
-                gerar_log(f"[Peer {self.peer_id}] Nenhum bloco local encontrado. Tentando novamente ({attempts+1}/{max_retries})...")
-                attempts += 1
-                time.sleep(retry_delay)
-        gerar_log(f"[Peer {self.peer_id}] Não encontrou blocos locais após {max_retries} tentativas.")
-        return False
-
-    def save_block(self, block_name, data):
-        """
-        Salva bloco recebido no diretório local.
-        """
-        caminho = os.path.join(self.bloco_dir, block_name)
-        with open(caminho, 'wb') as f:
-            f.write(data)
-        with self.lock:
-            self.blocks.add(block_name)
-        gerar_log(f"[Peer {self.peer_id}] Salvou bloco {block_name}")
-
-    def reconstruct_file(self):
-        """
-        Reconstrói arquivo original a partir dos blocos recebidos.
-        """
-        with self.lock:
-            total_blocks = len(self.blocks)
-            blocks_total = self.BLOCKS_TOTAL
-        if total_blocks == blocks_total:
-            reconstruir_arquivo(self.bloco_dir, f'reconstruido_peer_{self.peer_id}.txt')
-            gerar_log(f"[Peer {self.peer_id}] Arquivo reconstruído com sucesso.")
+        # Contadores de bytes servidos (zero-copy via sendfile, copiados pelo Python, do cache em memória
+        # ou comprimidos)
+        self.stats = {'bytes_zero_copy': 0, 'bytes_copiados': 0, 'bytes_cache': 0, 'bytes_comprimidos': 0}
+        self.stats_lock = threading.Lock()
 
-    def register_to_tracker(self, max_retries=10, retry_delay=3):
+    def tracker_call(self, comando, corpo=b'', timeout=5):
         """
-        Registra o peer e seus blocos no tracker.
+        Envia uma requisição ao tracker em um quadro (wire.py) e retorna (resposta, corpo).
         """
-        retries = 0
-        while retries < max_retries:
-            try:
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                    s.settimeout(5)
-                    s.connect((TRACKER_HOST, TRACKER_PORT))
-                    with self.lock:
-                        blocks_str = ','.join(self.blocks)
-                    message = f'REGISTER {self.port} {blocks_str}'
-                    s.sendall(message.encode())
-                    resp = s.recv(1024).decode()
-                    if resp != 'OK':
-                        gerar_log(f"[Peer {self.peer_id}] Tracker não confirmou registro.")
-                        return False
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                    s.settimeout(5)
-                    s.connect((TRACKER_HOST, TRACKER_PORT))
-                    s.sendall(b'GET_PEERS')
-                    data = s.recv(4096).decode()
-                    info = json.loads(data)
-                    peers = info['peers']
-                    suggested_blocks = info['suggested_blocks']
-                    with self.lock:
-                        self.known_peers = set([tuple(p) for p in peers if tuple(p)[1] != self.port])
-                        self.suggested_blocks = suggested_blocks
-                gerar_log(f"[Peer {self.peer_id}] Peers conhecidos: {self.known_peers}")
-                gerar_log(f"[Peer {self.peer_id}] Blocos sugeridos pelo tracker: {self.suggested_blocks}")
-                return True
-            except Exception as e:
-                gerar_log(f"[Peer {self.peer_id}] Falha ao conectar tracker: {e}. Tentando novamente ({retries+1}/{max_retries})")
-                retries += 1
-                time.sleep(retry_delay)
-        gerar_log(f"[Peer {self.peer_id}] Não conseguiu conectar ao tracker após {max_retries} tentativas.")
-        return False
+        nome = comando.split(' ', 1)[0]
+        try:
+            with TRACKER_SECONDS.labels(nome).time():
+                with socket.create_connection((TRACKER_HOST, TRACKER_PORT), timeout=timeout) as s:
+                    send_frame(s, 0, comando, corpo)
+                    frame = read_frame(s)
+            if frame is None:
+                raise ConnectionError("Tracker encerrou a conexão sem responder")
+        except Exception:
+            TRACKER_ERRORS.labels(nome).inc()
+            raise
+        _, resposta, dados = frame
+        return resposta, dados
+
+    async def tracker_call_async(self, comando, corpo=b'', timeout=5):
+        """
+        Versão asyncio de tracker_call.
+        """
+        nome = comando.split(' ', 1)[0]
+        inicio = time.perf_counter()
+        writer = None
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(TRACKER_HOST, TRACKER_PORT), timeout)
+            writer.write(encode_frame(0, comando, corpo))
+            await writer.drain()
+            frame = await asyncio.wait_for(read_frame_async(reader), timeout)
+            if frame is None:
+                raise ConnectionError("Tracker encerrou a conexão sem responder")
+        except Exception:
+            TRACKER_ERRORS.labels(nome).inc()
+            raise
+        finally:
+            TRACKER_SECONDS.labels(nome).observe(time.perf_counter() - inicio)
+            if writer is not None:
+                writer.close()
+        _, resposta, dados = frame
+        return resposta, dados
 
-    def update_peer_blocks(self):
+    async def peer_request_async(self, peer, comando, corpo=b''):
         """
-        Atualiza o mapa de blocos possuídos pelos peers conhecidos.
+        Envia uma requisição pela conexão assíncrona persistente com o peer e espera a resposta.
+        Em caso de erro a conexão é descartada do pool.
         """
-        for peer in list(self.known_peers):
-            try:
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                    s.settimeout(5)
-                    s.connect(peer)
-                    s.sendall(b'GET_BLOCKS')
-                    data = s.recv(4096).decode()
-                    blocks = set(b for b in data.split(',') if b) if data else set()
-                    with self.lock:
-                        self.peer_blocks_map[peer] = blocks
-                    gerar_log(f"[Peer {self.peer_id}] Atualizou blocos do peer {peer}: {blocks}")
-            except Exception as e:
-                gerar_log(f"[Peer {self.peer_id}] Erro ao atualizar blocos do peer {peer}: {e}")
-                with self.lock:
-                    if peer in self.peer_blocks_map:
-                        del self.peer_blocks_map[peer]
-                    if peer in self.known_peers:
-                        self.known_peers.remove(peer)
-
-    def calculate_rarest_blocks(self):
-        """
-        Calcula e retorna os blocos mais raros na rede.
-        """
-        frequency = {}
-        with self.lock:
-            for blocks in self.peer_blocks_map.values():
-                for b in blocks:
-                    frequency[b] = frequency.get(b, 0) + 1
-        with self.lock:
-            missing_blocks = set(self.BLOCKS) - self.blocks
-        freq_missing = {b: frequency.get(b, 0) for b in missing_blocks}
-        rarest = sorted(freq_missing.items(), key=lambda x: x[1])
-        return [b for b, _ in rarest]
-
-    def select_peers_for_unchoke(self):
-        """
-        Seleciona peers para desbloquear baseado nos blocos raros que eles têm.
-        """
-        with self.lock:
-            rarest_blocks = self.calculate_rarest_blocks()
-            peer_scores = {}
-            for peer, blocks in self.peer_blocks_map.items():
-                score = sum((len(rarest_blocks) - rarest_blocks.index(b)) for b in blocks if b in rarest_blocks)
-                peer_scores[peer] = score
-            sorted_peers = sorted(peer_scores.items(), key=lambda x: x[1], reverse=True)
-            fixed_unchoked = set([p for p, _ in sorted_peers[:4]])
-            other_peers = list(self.known_peers - fixed_unchoked)
-            optimistic = set()
-            if other_peers:
-                optimistic.add(random.choice(other_peers))
-            self.unchoked_peers = fixed_unchoked | optimistic
-            self.choked_peers = self.known_peers - self.unchoked_peers
-
-            gerar_log(f"[Peer {self.peer_id}] Peers fixos desbloqueados: {fixed_unchoked}")
-            gerar_log(f"[Peer {self.peer_id}] Peer otimista desbloqueado: {optimistic}")
-            gerar_log(f"[Peer {self.peer_id}] Peers choked (bloqueados): {self.choked_peers}")
+        try:
+            conn = await self.async_pool.get(peer)
+            return await conn.request(comando, corpo)
+        except Exception:
+            self.async_pool.discard(peer)
+            raise
 
     def unchoke_loop(self):
         """
@@ -213,214 +194,530 @@ class Peer:
         gerar_log(f"[Peer {self.peer_id}] Iniciando unchoke loop")
         while True:
             try:
-                self.update_peer_blocks()
-                self.select_peers_for_unchoke()
-                gerar_log(f"[Peer {self.peer_id}] Peers desbloqueados: {self.unchoked_peers}")
+                for swarm in list(self.swarms.values()):
+                    swarm.select_peers_for_unchoke()
+                    swarm.exchange_peers()
+                    swarm.save_resume()
+                    swarm.log_compression()
+                gerar_log(f"[Peer {self.peer_id}] Bytes servidos: {self.stats}; cache: {self.piece_cache.stats()}")
+                if self.dht is not None:
+                    gerar_log(f"[Peer {self.peer_id}] DHT: {self.dht.stats()}")
+                self.reload_rate_limits()
+                self.log_bandwidth()
             except Exception as e:
                 gerar_log(f"[Peer {self.peer_id}] Erro na unchoke_loop: {e}")
             time.sleep(10)
 
-    def check_have(self, peer, block):
+    async def unchoke_loop_async(self):
         """
-        Verifica se um peer específico tem um bloco desejado.
+        Versão asyncio de unchoke_loop.
         """
-        try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.settimeout(5)
-                s.connect(peer)
-                s.sendall(f'HAVE {block}'.encode())
-                response = s.recv(1024).decode()
-                return response == 'YES'
-        except Exception as e:
-            gerar_log(f"[Peer {self.peer_id}] Erro checando HAVE do bloco {block} no peer {peer}: {e}")
-            return False
+        gerar_log(f"[Peer {self.peer_id}] Iniciando unchoke loop (asyncio)")
+        while True:
+            try:
+                for swarm in list(self.swarms.values()):
+                    swarm.select_peers_for_unchoke()
+                    await swarm.exchange_peers_async()
+                    await asyncio.to_thread(swarm.save_resume)
+                    swarm.log_compression()
+                gerar_log(f"[Peer {self.peer_id}] Bytes servidos: {self.stats}; cache: {self.piece_cache.stats()}")
+                if self.dht is not None:
+                    gerar_log(f"[Peer {self.peer_id}] DHT: {self.dht.stats()}")
+                self.reload_rate_limits()
+                self.log_bandwidth()
+            except Exception as e:
+                gerar_log(f"[Peer {self.peer_id}] Erro na unchoke_loop: {e}")
+            await asyncio.sleep(10)
 
-    def request_block(self, peer, block):
+    def log_bandwidth(self):
         """
-        Solicita um bloco específico a um peer desbloqueado.
+        Registra a taxa atual de upload e download e, em nível DEBUG, a de cada conexão.
         """
-        try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.settimeout(10)
-                s.connect(peer)
-                s.sendall(f'REQUEST {block}'.encode())
-                data = b""
-                while True:
-                    part = s.recv(4096)
-                    if not part:
-                        break
-                    data += part
-                if data:
-                    self.save_block(block, data)
-                    gerar_log(f"[Peer {self.peer_id}] Baixou {block} do peer {peer}")
-                    self.reconstruct_file()
-                    return True
-                else:
-                    gerar_log(f"[Peer {self.peer_id}] Dados recebidos vazios para bloco {block} do peer {peer}")
-                    return False
-        except Exception as e:
-            gerar_log(f"[Peer {self.peer_id}] Erro ao baixar bloco {block} de {peer}: {e}")
-            return False
+        gerar_log(f"[Peer {self.peer_id}] Banda: {self.upload_limiter}; {self.download_limiter}")
+        gerar_log("[Peer %s] Banda por conexão: upload %s; download %s", self.peer_id, self.upload_limiter.rates(),
+                  self.download_limiter.rates(), nivel=DEBUG)
 
-    def try_download_block(self, peer, max_retries=3):
+    def set_rate_limits(self, upload=None, download=None, upload_per_peer=None, download_per_peer=None):
         """
-        Tenta baixar blocos sugeridos ou raros de um peer específico.
+        Altera os limites de banda (bytes/s, 0 = sem limite) com o peer rodando; None mantém o atual.
         """
-        with self.lock:
-            suggested_blocks = list(self.suggested_blocks) if hasattr(self, 'suggested_blocks') else []
-            current_blocks = set(self.blocks)
+        self.upload_limiter.set_limits(upload, upload_per_peer)
+        self.download_limiter.set_limits(download, download_per_peer)
+        gerar_log(f"[Peer {self.peer_id}] Novos limites de banda: {self.upload_limiter}; {self.download_limiter}")
 
-        if suggested_blocks:
-            blocks_to_try = [b for b in suggested_blocks if b not in current_blocks]
-            if not blocks_to_try:
-                blocks_to_try = self.calculate_rarest_blocks()
-        else:
-            blocks_to_try = self.calculate_rarest_blocks()
-
-        if not blocks_to_try:
-            gerar_log(f"[Peer {self.peer_id}] Nenhum bloco para tentar baixar do peer {peer}")
+    def reload_rate_limits(self):
+        """
+        Aplica os limites de limites_peer_X.json (chaves upload, download, upload_per_peer e
+        download_per_peer) quando o arquivo muda, permitindo ajustá-los de fora do processo.
+        """
+        try:
+            mtime = os.path.getmtime(self.limits_file)
+        except OSError:
             return
-
-        gerar_log(f"[Peer {self.peer_id}] Tentando baixar blocos {blocks_to_try} do peer {peer}")
-
-        for block in blocks_to_try:
-            gerar_log(f"[Peer {self.peer_id}] Verificando se peer {peer} tem bloco {block}")
-            have = self.check_have(peer, block)
-            if have:
-                with self.lock:
-                    is_unchoked = peer in self.unchoked_peers
-                if is_unchoked:
-                    success = self.request_block(peer, block)
-                    if success:
-                        return
-                else:
-                    gerar_log(f"[Peer {self.peer_id}] Peer {peer} está choked, não pode pedir bloco")
-                    return
-            else:
-                gerar_log(f"[Peer {self.peer_id}] Peer {peer} não tem bloco {block}")
-
-        gerar_log(f"[Peer {self.peer_id}] Nenhum bloco baixado do peer {peer} nesta tentativa.")
+        if mtime == self.limits_mtime:
+            return
+        self.limits_mtime = mtime
+        try:
+            with open(self.limits_file) as f:
+                limites = json.load(f)
+            self.set_rate_limits(**limites)
+        except (ValueError, TypeError) as e:
+            gerar_log(f"[Peer {self.peer_id}] Arquivo de limites inválido {self.limits_file}: {e}")
 
     def server_thread(self):
         """
         Inicia o servidor local do peer para atender requisições.
+        Cada conexão aceita é persistente e atendida por uma única thread.
         """
         server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         server.bind(('localhost', self.port))
         server.listen()
         gerar_log(f"[Peer {self.peer_id}] Servidor ouvindo na porta {self.port}")
         while True:
             conn, addr = server.accept()
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
             threading.Thread(target=self.handle_peer_connection, args=(conn,), daemon=True).start()
 
     def handle_peer_connection(self, conn):
         """
-        Trata requisições recebidas de outros peers.
+        Trata as requisições de uma conexão persistente com outro peer até ela ser encerrada.
+        As respostas levam o mesmo id da requisição, permitindo pipelining no cliente.
+        O HELLO inicial diz qual peer está do outro lado, para o choker de cada swarm.
+        Depois do GET_BLOCKS (ou GET_HAVES) de um swarm, a conexão passa a receber os HAVEs
+        dos blocos que este peer obtiver nele.
         """
+        remoto = None
+        link = ServerConnection(conn)
+        CONNECTIONS.labels().inc()
         try:
-            msg = conn.recv(1024).decode()
-            gerar_log(f"[Peer {self.peer_id}] Mensagem recebida no handle_peer_connection: {msg}")
-            if msg.startswith('GET_BLOCKS'):
-                with self.lock:
-                    data = ','.join(self.blocks)
-                conn.send(data.encode())
-            elif msg.startswith('HAVE'):
-                block = msg.split()[1]
-                with self.lock:
-                    if block in self.blocks:
-                        gerar_log(f"[Peer {self.peer_id}] Respondendo YES para HAVE {block}")
-                        conn.send(b'YES')
-                    else:
-                        gerar_log(f"[Peer {self.peer_id}] Respondendo NO para HAVE {block}")
-                        conn.send(b'NO')
-            elif msg.startswith('REQUEST'):
-                block = msg.split()[1]
-                with self.lock:
-                    if block in self.blocks:
-                        caminho = os.path.join(self.bloco_dir, block)
-                        with open(caminho, 'rb') as f:
-                            data = f.read()
-                        gerar_log(f"[Peer {self.peer_id}] Enviando bloco {block}")
-                        conn.sendall(data)
-                        conn.shutdown(socket.SHUT_WR)  # Envia FIN para sinalizar fim
-                    else:
-                        gerar_log(f"[Peer {self.peer_id}] Bloco {block} solicitado não disponível")
-                        conn.send(b'NOT_AVAILABLE')
-            else:
-                gerar_log(f"[Peer {self.peer_id}] Comando desconhecido: {msg}")
-                conn.send(b'UNKNOWN_COMMAND')
+            while True:
+                frame = read_frame(conn)
+                if frame is None:
+                    break
+                req_id, msg, corpo = frame
+                inicio = time.perf_counter()
+                if msg.startswith('HELLO'):
+                    remoto = link.remoto = self.hello_identity(msg, conn.getpeername()[0])
+                    link.codecs = parse_codecs(msg)
+                elif msg.startswith('REQUEST'):
+                    self.serve_block(link, req_id, msg, remoto)
+                else:
+                    # Com o lock, nenhum HAVE sai antes da resposta com o bitfield que ele complementa
+                    with link.lock:
+                        resposta, dados = self.handle_peer_message(msg, corpo, link)
+                        send_frame(conn, req_id, resposta, dados)
+                self.observe_message(msg, inicio)
         except Exception as e:
-            gerar_log(f"[Peer {self.peer_id}] Erro na conexão: {e}")
+            gerar_log("[Peer %s] Erro na conexão: %s", self.peer_id, e, nivel=WARNING)
         finally:
+            CONNECTIONS.labels().dec()
+            self.drop_subscriber(link)
             conn.close()
+            self.upload_limiter.forget(remoto)
+
+    async def serve_async(self):
+        """
+        Servidor asyncio do peer: todas as conexões são atendidas pelo mesmo loop de eventos.
+        """
+        server = await asyncio.start_server(self.handle_peer_connection_async, 'localhost', self.port,
+                                            reuse_address=True)
+        gerar_log(f"[Peer {self.peer_id}] Servidor asyncio ouvindo na porta {self.port}")
+        async with server:
+            await server.serve_forever()
+
+    async def handle_peer_connection_async(self, reader, writer):
+        """
+        Versão asyncio de handle_peer_connection. Blocos (REQUEST) saem direto do disco
+        com loop.sendfile; as demais mensagens são respondidas direto da memória.
+        """
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        remoto = None
+        link = AsyncServerConnection(writer)
+        CONNECTIONS.labels().inc()
+        try:
+            while True:
+                frame = await read_frame_async(reader)
+                if frame is None:
+                    break
+                req_id, msg, corpo = frame
+                inicio = time.perf_counter()
+                if msg.startswith('HELLO'):
+                    remoto = link.remoto = self.hello_identity(msg, writer.get_extra_info('peername')[0])
+                    link.codecs = parse_codecs(msg)
+                elif msg.startswith('REQUEST'):
+                    await self.serve_block_async(link, req_id, msg, remoto)
+                else:
+                    async with link.lock:
+                        resposta, dados = self.handle_peer_message(msg, corpo, link)
+                        writer.write(encode_frame(req_id, resposta, dados))
+                        await writer.drain()
+                self.observe_message(msg, inicio)
+        except asyncio.CancelledError:
+            pass  # loop de eventos encerrando
+        except Exception as e:
+            gerar_log("[Peer %s] Erro na conexão: %s", self.peer_id, e, nivel=WARNING)
+        finally:
+            CONNECTIONS.labels().dec()
+            self.drop_subscriber(link)
+            writer.close()
+            self.upload_limiter.forget(remoto)
+
+    def observe_message(self, msg, inicio):
+        """
+        Registra em minibit_peer_message_seconds quanto tempo levou atender a mensagem.
+        """
+        comando = msg.split(' ', 1)[0]
+        MESSAGE_SECONDS.labels(comando if comando in COMANDOS else 'outro').observe(time.perf_counter() - inicio)
+
+    def hello_identity(self, msg, ip):
+        """
+        Endereço (ip, porta de escuta) do peer que enviou 'HELLO porta [codecs]', o mesmo usado pelo tracker.
+        """
+        identidade = (ip, int(msg.split()[1]))
+        gerar_log("[Peer %s] Conexão identificada como %s", self.peer_id, identidade, nivel=DEBUG)
+        return identidade
+
+    def handle_peer_message(self, msg, corpo=b'', link=None):
+        """
+        Processa uma mensagem recebida de outro peer e retorna (resposta, corpo da resposta).
+        Toda mensagem traz o info-hash do swarm logo depois do comando. link é a conexão
+        de onde veio a mensagem, inscrita nos HAVEs do swarm ao pedir o bitfield.
+        """
+        gerar_log("[Peer %s] Mensagem recebida no handle_peer_connection: %s", self.peer_id, msg, nivel=DEBUG)
+        partes = msg.split()
+        swarm = self.swarms.get(partes[1]) if len(partes) > 1 else None
+        if swarm is None:
+            gerar_log("[Peer %s] Swarm desconhecido: %s", self.peer_id, msg, nivel=WARNING)
+            return 'UNKNOWN_SWARM', b''
+        return swarm.handle_message(partes, corpo, link)
+
+    def handle_push(self, peer, msg, corpo=b''):
+        """
+        Trata um quadro sem resposta recebido por uma conexão do pool: 'HAVE info_hash bloco versão',
+        enviado pelo peer assim que obtém um bloco. Chamado pela leitora da conexão.
+        """
+        partes = msg.split()
+        swarm = self.swarms.get(partes[1]) if len(partes) > 3 and partes[0] == 'HAVE' else None
+        if swarm is None:
+            gerar_log("[Peer %s] Mensagem inesperada de %s: %s", self.peer_id, peer, msg, nivel=WARNING)
+            return
+        try:
+            swarm.apply_have(peer, int(partes[2]), int(partes[3]))
+        except (ValueError, IndexError) as e:
+            gerar_log("[Peer %s] HAVE inválido de %s: %s (%s)", self.peer_id, peer, msg, e, nivel=WARNING)
+
+    def drop_subscriber(self, link):
+        """
+        Tira dos HAVEs de todos os swarms uma conexão que foi encerrada.
+        """
+        link.closed = True
+        for swarm in list(self.swarms.values()):
+            swarm.unsubscribe(link)
+
+    def swarm_codec(self, nome):
+        """
+        Codec usado para comprimir os blocos servidos no swarm nome, ou None se ele não comprime.
+        """
+        if self.compress is None or (self.compress_swarms and nome not in self.compress_swarms):
+            return None
+        return CODECS[self.compress]
+
+    def requested_chunk(self, msg, remoto=None, codecs=()):
+        """
+        Encaminha um 'REQUEST info_hash bloco [offset tamanho]' do peer remoto ao swarm e retorna
+        (swarm, resposta, arquivo, inicio, tamanho). Se a resposta não for 'DATA' nem 'ZDATA', não
+        há arquivo a enviar. codecs são os que o peer remoto aceita (do HELLO).
+        """
+        gerar_log("[Peer %s] Mensagem recebida no handle_peer_connection: %s", self.peer_id, msg, nivel=DEBUG)
+        partes = msg.split()
+        swarm = self.swarms.get(partes[1]) if len(partes) > 2 else None
+        if swarm is None:
+            gerar_log("[Peer %s] Swarm desconhecido: %s", self.peer_id, msg, nivel=WARNING)
+            return None, 'UNKNOWN_SWARM', None, 0, 0
+        return (swarm, *swarm.requested_chunk(partes, remoto, codecs))
+
+    async def requested_chunk_async(self, msg, remoto=None, codecs=()):
+        """
+        Versão asyncio de requested_chunk. Se o trecho não está pronto no cache, ler a peça do
+        disco, esperar outra conexão que a está lendo ou comprimir bloquearia o loop de eventos:
+        nesse caso o trecho é preparado numa thread.
+        """
+        partes = msg.split()
+        swarm = self.swarms.get(partes[1]) if len(partes) > 2 else None
+        if swarm is not None and not swarm.chunk_cached(partes, codecs):
+            return await asyncio.to_thread(self.requested_chunk, msg, remoto, codecs)
+        return self.requested_chunk(msg, remoto, codecs)
+
+    def serve_block(self, link, req_id, msg, remoto=None):
+        """
+        Responde um REQUEST enviando o trecho do bloco a partir do cache de peças (memoryview,
+        sem cópia) ou direto do armazenamento para o socket (os.sendfile), sem passar os bytes
+        pelo Python. Trechos comprimidos (ZDATA) também saem da memória. Peers bloqueados pelo
+        choker recebem CHOKED.
+        O envio espera o limite de upload global e o da conexão; só os bytes enviados de fato
+        contam para a taxa de upload usada pelo choker (count_served).
+        """
+        swarm, resposta, arquivo, inicio, tamanho = self.requested_chunk(msg, remoto, link.codecs)
+        if arquivo is None:
+            link.send(req_id, resposta)
+            return
+        self.upload_limiter.acquire(remoto, tamanho)
+        conn = link.sock
+        if isinstance(arquivo, memoryview):
+            with link.lock:
+                send_frame_buffer(conn, req_id, resposta, arquivo)
+            contador = 'bytes_cache' if resposta == 'DATA' else 'bytes_comprimidos'
+            self.count_served(swarm, remoto, tamanho, tamanho, contador)
+            return
+        with arquivo, link.lock:
+            conn.sendall(encode_frame_header(req_id, resposta, tamanho))
+            enviados = conn.sendfile(arquivo, inicio, tamanho)
+        self.count_served(swarm, remoto, enviados, tamanho)
+
+    async def serve_block_async(self, link, req_id, msg, remoto=None):
+        """
+        Versão asyncio de serve_block, usando loop.sendfile sobre o transporte da conexão.
+        """
+        swarm, resposta, arquivo, inicio, tamanho = await self.requested_chunk_async(msg, remoto, link.codecs)
+        if arquivo is None:
+            await link.send(req_id, resposta)
+            return
+        await self.upload_limiter.acquire_async(remoto, tamanho)
+        writer = link.writer
+        if isinstance(arquivo, memoryview):
+            async with link.lock:
+                writer.write(encode_frame_header(req_id, resposta, tamanho))
+                writer.write(arquivo)
+                await writer.drain()
+            contador = 'bytes_cache' if resposta == 'DATA' else 'bytes_comprimidos'
+            self.count_served(swarm, remoto, tamanho, tamanho, contador)
+            return
+        with arquivo:
+            async with link.lock:
+                writer.write(encode_frame_header(req_id, resposta, tamanho))
+                enviados = await asyncio.get_running_loop().sendfile(writer.transport, arquivo, inicio, tamanho)
+        self.count_served(swarm, remoto, enviados, tamanho)
+
+    def count_served(self, swarm, remoto, enviados, tamanho, contador=None):
+        if enviados != tamanho:
+            # O quadro já anunciou o tamanho: a conexão não pode continuar
+            raise ConnectionError(f"sendfile enviou {enviados} de {tamanho} bytes")
+        if contador is None:
+            contador = 'bytes_zero_copy' if hasattr(os, 'sendfile') else 'bytes_copiados'
+        with self.stats_lock:
+            self.stats[contador] += enviados
+        BYTES_OUT.inc(enviados)
+        swarm.choker.record_upload(remoto, enviados)
+
+    def start_metrics(self):
+        """
+        Registra as métricas lidas do estado do peer (filas, requisições em voo, taxas) e abre o
+        endpoint HTTP em metrics_port, no formato de texto do Prometheus.
+        """
+        if not self.metrics_port:
+            return
+        REGISTRY.gauge('minibit_requests_in_flight', 'Requisições de bloco em voo somando todos os swarms'
+                       ).set_function(lambda: self.budget.em_voo)
+        REGISTRY.gauge('minibit_outbound_connections', 'Conexões persistentes abertas com outros peers'
+                       ).set_function(lambda: len((self.async_pool or self.pool).conexoes))
+        REGISTRY.gauge('minibit_log_queue', 'Registros de log esperando a thread escritora').set_function(log_pending)
+        REGISTRY.gauge('minibit_bandwidth_bytes_per_second', 'Taxa atual de upload e download do peer',
+                       ('direcao',)).set_function(lambda: {('out',): self.upload_limiter.rate(),
+                                                           ('in',): self.download_limiter.rate()})
+        REGISTRY.gauge('minibit_swarm_blocks', 'Blocos que o peer tem em cada swarm', ('swarm',)).set_function(
+            lambda: {(s.nome,): s.block_count() for s in list(self.swarms.values())})
+        REGISTRY.gauge('minibit_swarm_outstanding', 'Requisições em voo do scheduler de cada swarm',
+                       ('swarm',)).set_function(
+            lambda: {(s.nome,): s.scheduler.outstanding() for s in list(self.swarms.values())})
+        cache = self.piece_cache
+        REGISTRY.counter('minibit_piece_cache_hits_total', 'Pedidos servidos com a peça já no cache'
+                         ).set_function(lambda: cache.hits)
+        REGISTRY.counter('minibit_piece_cache_misses_total', 'Pedidos que precisaram ler a peça do armazenamento'
+                         ).set_function(lambda: cache.misses)
+        REGISTRY.counter('minibit_piece_cache_evictions_total', 'Peças removidas do cache para liberar espaço'
+                         ).set_function(lambda: cache.evictions)
+        REGISTRY.gauge('minibit_piece_cache_bytes', 'Bytes de peças no cache').set_function(lambda: cache.tamanho)
+        REGISTRY.gauge('minibit_dht_nodes', 'Nós na tabela de roteamento da DHT').set_function(
+            lambda: len(self.dht.tabela) if self.dht is not None else 0)
+        try:
+            start_metrics_server(self.metrics_port)
+            gerar_log(f"[Peer {self.peer_id}] Métricas em http://localhost:{self.metrics_port}/metrics")
+        except OSError as e:
+            gerar_log("[Peer %s] Não foi possível abrir a porta de métricas %s: %s", self.peer_id, self.metrics_port, e,
+                      nivel=WARNING)
+
+    def start_dht(self):
+        """
+        Sobe o nó DHT em dht_port (UDP) e entra na rede pelos nós de dht_bootstrap. Um peer
+        sem bootstrap (o primeiro da rede) espera os outros o encontrarem.
+        """
+        if self.dht_port is None:
+            return
+        try:
+            self.dht = DHTNode(self.dht_port, nome=f'Peer {self.peer_id} DHT')
+        except OSError as e:
+            gerar_log("[Peer %s] Não foi possível abrir a porta da DHT %s: %s", self.peer_id, self.dht_port, e,
+                      nivel=WARNING)
+            return
+        nos = self.dht.bootstrap(self.dht_bootstrap)
+        gerar_log(f"[Peer {self.peer_id}] DHT na porta UDP {self.dht.endereco[1]}, {nos} nós conhecidos")
 
-    def run(self):
+    def prepare(self):
+        """
+        Prepara cada swarm (divisão dos arquivos nos seeds, manifesto, blocos locais) e os
+        registra pelo info-hash. Swarms que falham são deixados de fora.
+        """
+        for swarm in self.pending_swarms:
+            if swarm.prepare():
+                self.swarms[swarm.info_hash] = swarm
+                gerar_log(f"[Peer {self.peer_id}] Swarm {swarm.nome} pronto (info-hash {swarm.info_hash})")
+            else:
+                gerar_log(f"[Peer {self.peer_id}] Swarm {swarm.label()} ignorado.")
+        if not self.swarms:
+            gerar_log(f"[Peer {self.peer_id}] Nenhum swarm preparado, encerrando.")
+            return False
+        return True
+
+    def run(self, modo=MODO_THREAD):
         """
         Método principal para inicializar o peer e começar o processo de download e compartilhamento.
+        modo escolhe entre o motor com threads (padrão) e o loop de eventos asyncio.
+        Cada swarm roda seu próprio loop; o peer encerra quando todos terminam.
         """
+        if modo == MODO_ASYNCIO:
+            return asyncio.run(self.run_async())
+
         gerar_log(f"[Peer {self.peer_id}] Iniciando execução principal")
-        if self.peer_id == 0:
-            dividir_pasta_em_blocos(self.arquivo_original, self.bloco_dir, tamanho_bloco=1024)
-        if not self.set_blocks_total_dynamic():
-            gerar_log(f"[Peer {self.peer_id}] Falha ao definir total de blocos, encerrando.")
-            return
-        if not self.load_blocks():
-            gerar_log(f"[Peer {self.peer_id}] Erro ao carregar blocos locais, encerrando.")
+        if not self.prepare():
             return
+        self.start_metrics()
+        self.start_dht()
 
         threading.Thread(target=self.server_thread, daemon=True).start()
         threading.Thread(target=self.unchoke_loop, daemon=True).start()
         gerar_log(f"[Peer {self.peer_id}] Threads de servidor e unchoke iniciadas")
 
-        time.sleep(10)  # <<<<< Aqui espera inicial
+        time.sleep(self.start_delay)  # <<<<< Aqui espera inicial
 
-        max_attempts = 10
-        attempts = 0
+        threads = [threading.Thread(target=swarm.run, daemon=True) for swarm in self.swarms.values()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for swarm in self.swarms.values():
+            swarm.close()
 
-        while True:
-            if self.BLOCKS_TOTAL is None:
-                gerar_log(f"[Peer {self.peer_id}] BLOCKS_TOTAL indefinido, tentando novamente...")
-                if not self.set_blocks_total_dynamic():
-                    time.sleep(5)
-                    continue
-
-            with self.lock:
-                blocks_count = len(self.blocks)
-                blocks_total = self.BLOCKS_TOTAL
-
-            if blocks_count == blocks_total:
-                if self.peer_id != 0:
-                    gerar_log(f"[Peer {self.peer_id}] Arquivo completo! Encerrando...")
-                    break
-                else:
-                    gerar_log(f"[Peer {self.peer_id}] Arquivo completo, permanecendo online para servir os blocos.")
-
-            if not self.register_to_tracker():
-                gerar_log(f"[Peer {self.peer_id}] Não conseguiu conectar tracker, tentando novamente...")
-                time.sleep(5)
-                continue
+    async def run_async(self):
+        """
+        Versão asyncio de run: servidor, unchoke loop, consultas ao tracker e downloads
+        de todos os swarms compartilham um único loop de eventos.
+        """
+        gerar_log(f"[Peer {self.peer_id}] Iniciando execução principal (asyncio)")
+        if not await asyncio.to_thread(self.prepare):
+            return
+        self.start_metrics()
+        await asyncio.to_thread(self.start_dht)
 
-            with self.lock:
-                peers_list = list(self.known_peers)
+        self.async_pool = AsyncConnectionPool(queue_depth=self.queue_depth, hello=self.hello,
+                                              limiter=self.download_limiter, on_push=self.handle_push)
+        tarefas = [asyncio.create_task(self.serve_async()), asyncio.create_task(self.unchoke_loop_async())]
+        gerar_log(f"[Peer {self.peer_id}] Tarefas de servidor e unchoke iniciadas")
 
-            gerar_log(f"[Peer {self.peer_id}] Peers disponíveis: {peers_list}")
-            if not peers_list:
-                gerar_log(f"[Peer {self.peer_id}] Nenhum peer conhecido, aguardando...")
-                time.sleep(5)
-                continue
+        await asyncio.sleep(self.start_delay)
 
-            peer = random.choice(peers_list)
-            gerar_log(f"[Peer {self.peer_id}] Tentando baixar bloco de peer {peer}")
-            self.try_download_block(peer)
-            time.sleep(3)
+        try:
+            await asyncio.gather(*(swarm.run_async() for swarm in self.swarms.values()))
+        finally:
+            # Fecha as conexões antes de cancelar, para que os chunks pendentes terminem
+            # com erro em vez de ficarem para o encerramento do loop
+            self.async_pool.close_all()
+            for swarm in self.swarms.values():
+                tarefas += list(swarm.scheduler.tasks_async)
+            for tarefa in tarefas:
+                tarefa.cancel()
+            await asyncio.gather(*tarefas, return_exceptions=True)
+            for swarm in self.swarms.values():
+                swarm.close()
 
 
 if __name__ == '__main__':
+    import argparse
     import sys
-    peer_id = int(sys.argv[1]) if len(sys.argv) > 1 else 0
-    peer = Peer(peer_id)
+    parser = argparse.ArgumentParser(description='Peer MiniBit')
+    parser.add_argument('peer_id', type=int, nargs='?', default=0)
+    parser.add_argument('--modo', choices=MODOS, default=MODO_THREAD,
+                        help='motor de rede: threads (padrão) ou asyncio')
+    parser.add_argument('--queue-depth', type=int, default=PIPELINE_DEPTH,
+                        help='requisições em voo por conexão')
+    parser.add_argument('--max-outstanding', type=int, default=MAX_OUTSTANDING,
+                        help='limite global de requisições de bloco em voo')
+    parser.add_argument('--endgame', type=int, default=ENDGAME_THRESHOLD,
+                        help='blocos restantes para entrar em endgame')
+    parser.add_argument('--storage', choices=STORAGES, default=STORAGE_ARQUIVO,
+                        help='armazenamento dos blocos: arquivo único pré-alocado ou um arquivo por bloco')
+    parser.add_argument('--piece-size', type=int, default=TAMANHO_BLOCO,
+                        help='tamanho de cada bloco (peça) em bytes, usado pelo seed ao dividir o arquivo')
+    parser.add_argument('--seed', action='append', default=[], metavar='PASTA',
+                        help='semeia também os arquivos desta pasta em um swarm próprio (pode repetir)')
+    parser.add_argument('--torrent', action='append', default=[], metavar='PASTA',
+                        help='baixa também o swarm descrito pelo metadata.json desta pasta (pode repetir)')
+    parser.add_argument('--unchoke-slots', type=int, default=UNCHOKE_SLOTS,
+                        help='peers desbloqueados pela taxa medida em cada swarm, além do slot otimista')
+    parser.add_argument('--max-upload', type=int, default=SEM_LIMITE,
+                        help='limite global de upload em bytes/s (0 = sem limite)')
+    parser.add_argument('--max-download', type=int, default=SEM_LIMITE,
+                        help='limite global de download em bytes/s (0 = sem limite)')
+    parser.add_argument('--max-upload-per-peer', type=int, default=SEM_LIMITE,
+                        help='limite de upload por conexão em bytes/s (0 = sem limite)')
+    parser.add_argument('--max-download-per-peer', type=int, default=SEM_LIMITE,
+                        help='limite de download por conexão em bytes/s (0 = sem limite)')
+    parser.add_argument('--super-seed', action='store_true',
+                        help='super-seeding nos arquivos semeados: uma peça por vez para cada downloader')
+    parser.add_argument('--compress', choices=sorted(CODECS), default=None,
+                        help='comprime os blocos servidos a peers que aceitam o codec (pula os que não diminuem)')
+    parser.add_argument('--compress-swarm', action='append', default=[], metavar='NOME',
+                        help='comprime só neste swarm (pode repetir; padrão: todos)')
+    parser.add_argument('--dht', action='store_true',
+                        help=f'liga o nó DHT na porta UDP {DHT_PORT_BASE} + peer_id')
+    parser.add_argument('--dht-port', type=int, default=None,
+                        help='porta UDP do nó DHT (implica --dht)')
+    parser.add_argument('--dht-bootstrap', action='append', default=None, metavar='HOST:PORTA',
+                        help=f'nó para entrar na DHT (pode repetir; padrão: o nó do peer 0, 127.0.0.1:{DHT_PORT_BASE})')
+    parser.add_argument('--no-tracker', action='store_true',
+                        help='não usa o tracker: peers descobertos só pela DHT e por PEX (exige --dht)')
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help='porta do endpoint HTTP de métricas (padrão 7000 + peer_id, 0 = desligado)')
+    parser.add_argument('--start-delay', type=float, default=START_DELAY,
+                        help='segundos entre subir o servidor e começar os downloads')
+    parser.add_argument('--cache-size', type=int, default=CACHE_SIZE,
+                        help='bytes do cache de peças em memória usado ao servir blocos (0 = desligado)')
+    parser.add_argument('--log-level', choices=NIVEIS, default='info',
+                        help='nível mínimo dos registros de log')
+    parser.add_argument('--log-format', choices=FORMATOS, default=FORMATO_TEXTO,
+                        help='formato do log: texto ou uma linha JSON por registro')
+    parser.add_argument('--log-file', metavar='ARQUIVO',
+                        help='arquivo que também recebe os registros de log')
+    args = parser.parse_args()
+    configurar_log(args.log_level, args.log_format, args.log_file)
+    dht_port = args.dht_port if args.dht_port is not None else DHT_PORT_BASE + args.peer_id if args.dht else None
+    if args.no_tracker and dht_port is None:
+        parser.error('--no-tracker exige --dht')
+    if args.dht_bootstrap is None:
+        args.dht_bootstrap = [] if args.peer_id == 0 else [f'127.0.0.1:{DHT_PORT_BASE}']
+    dht_bootstrap = [(host, int(porta)) for host, porta in (e.rsplit(':', 1) for e in args.dht_bootstrap)]
+    peer = Peer(args.peer_id, queue_depth=args.queue_depth, max_outstanding=args.max_outstanding,
+                endgame_threshold=args.endgame, storage=args.storage, piece_size=args.piece_size,
+                seeds=args.seed, torrents=args.torrent, unchoke_slots=args.unchoke_slots,
+                max_upload=args.max_upload, max_download=args.max_download,
+                max_upload_per_peer=args.max_upload_per_peer, max_download_per_peer=args.max_download_per_peer,
+                metrics_port=args.metrics_port, start_delay=args.start_delay, cache_size=args.cache_size,
+                dht_port=dht_port, dht_bootstrap=dht_bootstrap, use_tracker=not args.no_tracker,
+                super_seed=args.super_seed, compress=args.compress, compress_swarms=args.compress_swarm)
     try:
-        peer.run()
+        peer.run(modo=args.modo)
     except KeyboardInterrupt:
         gerar_log(f"[Peer {peer.peer_id}] Encerrado manualmente com CTRL+C. Até mais!")
         sys.exit(0)
\ No newline at end of file
@@ -0,0 +1,49 @@
+import socket
+import struct
+
+# Endereço compacto de um peer na troca de peers (PEX): IPv4 (4 bytes) + porta (2 bytes)
+ENDERECO = struct.Struct('!4sH')
+
+# Intervalo (segundos) entre duas rodadas de PEX de um swarm
+PEX_INTERVAL = 30
+
+# Peers consultados em cada rodada de PEX, sorteados entre as conexões com handshake
+PEX_FANOUT = 4
+
+# Máximo de endereços enviados em uma mensagem PEX
+PEX_MAX = 50
+
+# Só são repassados peers com quem houve contato direto nos últimos PEX_TTL segundos
+PEX_TTL = 120
+
+# Limite de peers conhecidos por swarm; além dele, endereços recebidos por PEX são ignorados
+MAX_KNOWN_PEERS = 80
+
+# Com pelo menos PEX_TARGET peers conhecidos, o tracker só recebe um anúncio a cada
+# PEX_ANNOUNCE_INTERVAL segundos (para continuar apresentando este peer a quem está chegando),
+# limitado a PEX_ANNOUNCE_TTL_FRACTION do ttl informado pelo tracker, para o peer não expirar lá
+PEX_TARGET = 8
+PEX_ANNOUNCE_INTERVAL = 300
+PEX_ANNOUNCE_TTL_FRACTION = 0.6
+
+
+def encode_peers(peers):
+    """
+    Codifica uma lista de endereços (ip, porta) em 6 bytes por peer. Endereços que não são
+    IPv4 ficam de fora.
+    """
+    partes = []
+    for ip, porta in peers:
+        try:
+            partes.append(ENDERECO.pack(socket.inet_aton(ip), porta))
+        except (OSError, struct.error):
+            continue
+    return b''.join(partes)
+
+
+def decode_peers(dados):
+    """
+    Lista de endereços (ip, porta) de um corpo PEX; bytes que sobram no final são ignorados.
+    """
+    fim = len(dados) - len(dados) % ENDERECO.size
+    return [(socket.inet_ntoa(ip), porta) for ip, porta in ENDERECO.iter_unpack(dados[:fim])]
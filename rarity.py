@@ -0,0 +1,80 @@
+class RarityIndex:
+    """
+    Disponibilidade de cada bloco na rede, mantida de forma incremental.
+
+    contagem[b] é quantos peers anunciaram o bloco b e buckets[c] é o conjunto de blocos
+    com contagem c, então cada evento (um peer ganhou ou perdeu um bloco) custa O(1) e a
+    lista dos mais raros sai percorrendo os buckets em ordem, sem recontar nem ordenar.
+    Blocos que o próprio peer já tem (mark_owned) continuam contados, mas saem dos buckets.
+    """
+
+    def __init__(self, total):
+        self.total = total
+        self.contagem = [0] * total
+        self.buckets = [set(range(total))]
+        self.owned = set()
+
+    def _move(self, block, nova):
+        if block not in self.owned:
+            self.buckets[self.contagem[block]].discard(block)
+            while len(self.buckets) <= nova:
+                self.buckets.append(set())
+            self.buckets[nova].add(block)
+        self.contagem[block] = nova
+
+    def add(self, block):
+        """
+        Um peer passou a ter o bloco.
+        """
+        self._move(block, self.contagem[block] + 1)
+
+    def remove(self, block):
+        """
+        Um peer deixou de anunciar o bloco (saiu da rede ou trocou de bitfield).
+        """
+        if self.contagem[block] > 0:
+            self._move(block, self.contagem[block] - 1)
+
+    def add_all(self, blocks):
+        for b in blocks:
+            self.add(b)
+
+    def remove_all(self, blocks):
+        for b in blocks:
+            self.remove(b)
+
+    def mark_owned(self, block):
+        """
+        O próprio peer obteve o bloco: ele deixa de ser candidato a download.
+        """
+        if block not in self.owned:
+            self.buckets[self.contagem[block]].discard(block)
+            self.owned.add(block)
+
+    def mark_missing(self, block):
+        if block in self.owned:
+            self.owned.discard(block)
+            self.buckets[self.contagem[block]].add(block)
+
+    def count(self, block):
+        return self.contagem[block]
+
+    def rarest(self, limite=None, minimo=0, prioridade=()):
+        """
+        Blocos ainda não obtidos, do mais raro para o mais comum. Com minimo=1 ficam de fora
+        os blocos que nenhum peer anunciou; limite corta a lista nos primeiros blocos.
+        Os blocos de prioridade (poucos, como os sugeridos pelo tracker) vêm na frente, também
+        em ordem de raridade; só eles são ordenados, o resto sai dos buckets.
+        """
+        prioridade = {b for b in prioridade
+                      if 0 <= b < self.total and b not in self.owned and self.contagem[b] >= minimo}
+        resultado = sorted(prioridade, key=self.contagem.__getitem__)
+        if limite is not None and len(resultado) >= limite:
+            return resultado[:limite]
+        for c in range(minimo, len(self.buckets)):
+            for b in self.buckets[c]:
+                if limite is not None and len(resultado) >= limite:
+                    return resultado
+                if b not in prioridade:
+                    resultado.append(b)
+        return resultado
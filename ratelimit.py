@@ -0,0 +1,150 @@
+import asyncio
+import threading
+import time
+from collections import deque
+
+# Sem limite: taxa 0 (ou None) deixa o balde sempre cheio
+SEM_LIMITE = 0
+
+# Janela (segundos) usada para informar a taxa atual de cada limitador, somada por fatias de 1 s
+JANELA_TAXA = 5
+
+
+class TokenBucket:
+    """
+    Balde de fichas: enche a taxa bytes por segundo até rajada bytes. Cada transferência
+    reserva suas fichas e, se o balde ficar negativo, espera o tempo necessário para pagar a
+    dívida; assim um chunk maior que a rajada passa, mas a taxa média fica no limite.
+    """
+
+    def __init__(self, taxa=SEM_LIMITE, rajada=None):
+        self.lock = threading.Lock()
+        self.taxa = 0
+        self.rajada = 0
+        self.fichas = 0.0
+        self.atualizado = time.monotonic()
+        self.fatias = deque()  # [segundo, bytes] de cada fatia da janela, para informar a taxa
+        self.na_janela = 0  # soma dos bytes das fatias
+        self.set_rate(taxa, rajada)
+
+    def set_rate(self, taxa, rajada=None):
+        """
+        Altera a taxa (bytes/s, 0 = sem limite) com o limitador em uso.
+        """
+        with self.lock:
+            self._refill(time.monotonic())
+            self.taxa = taxa or SEM_LIMITE
+            self.rajada = rajada or self.taxa
+            self.fichas = min(self.fichas, self.rajada) if self.taxa else 0.0
+
+    def _refill(self, agora):
+        if self.taxa:
+            self.fichas = min(self.rajada, self.fichas + (agora - self.atualizado) * self.taxa)
+        self.atualizado = agora
+
+    def _trim(self, segundo):
+        # Descarta as fatias que saíram da janela; no máximo JANELA_TAXA ficam guardadas
+        while self.fatias and self.fatias[0][0] <= segundo - JANELA_TAXA:
+            self.na_janela -= self.fatias.popleft()[1]
+
+    def _count(self, agora, nbytes):
+        segundo = int(agora)
+        self._trim(segundo)
+        if self.fatias and self.fatias[-1][0] == segundo:
+            self.fatias[-1][1] += nbytes
+        else:
+            self.fatias.append([segundo, nbytes])
+        self.na_janela += nbytes
+
+    def reserve(self, nbytes):
+        """
+        Reserva nbytes e retorna quantos segundos esperar antes de transferi-los.
+        """
+        with self.lock:
+            agora = time.monotonic()
+            self._count(agora, nbytes)
+            if not self.taxa:
+                return 0.0
+            self._refill(agora)
+            self.fichas -= nbytes
+            return max(0.0, -self.fichas / self.taxa)
+
+    def rate(self):
+        """
+        Taxa atual (bytes/s) medida na janela JANELA_TAXA.
+        """
+        with self.lock:
+            self._trim(int(time.monotonic()))
+            return self.na_janela / JANELA_TAXA
+
+
+class RateLimiter:
+    """
+    Limite de banda em uma direção (upload ou download): um balde global para o peer todo e
+    um balde por conexão. Uma transferência espera o maior dos dois tempos.
+    """
+
+    def __init__(self, nome, taxa_global=SEM_LIMITE, taxa_conexao=SEM_LIMITE):
+        self.nome = nome
+        self.taxa_conexao = taxa_conexao
+        self.global_bucket = TokenBucket(taxa_global)
+        self.conexoes = {}
+        self.lock = threading.Lock()
+
+    def _bucket(self, conexao):
+        with self.lock:
+            bucket = self.conexoes.get(conexao)
+            if bucket is None:
+                bucket = self.conexoes[conexao] = TokenBucket(self.taxa_conexao)
+            return bucket
+
+    def delay(self, conexao, nbytes):
+        return max(self._bucket(conexao).reserve(nbytes), self.global_bucket.reserve(nbytes))
+
+    def acquire(self, conexao, nbytes):
+        """
+        Bloqueia até nbytes poderem ser transferidos pela conexão.
+        """
+        espera = self.delay(conexao, nbytes)
+        if espera:
+            time.sleep(espera)
+
+    async def acquire_async(self, conexao, nbytes):
+        """
+        Versão asyncio de acquire.
+        """
+        espera = self.delay(conexao, nbytes)
+        if espera:
+            await asyncio.sleep(espera)
+
+    def set_limits(self, taxa_global=None, taxa_conexao=None):
+        """
+        Altera os limites em tempo de execução; None mantém o limite atual.
+        """
+        if taxa_global is not None:
+            self.global_bucket.set_rate(taxa_global)
+        if taxa_conexao is not None:
+            with self.lock:
+                self.taxa_conexao = taxa_conexao
+                buckets = list(self.conexoes.values())
+            for bucket in buckets:
+                bucket.set_rate(taxa_conexao)
+
+    def forget(self, conexao):
+        with self.lock:
+            self.conexoes.pop(conexao, None)
+
+    def rate(self):
+        return self.global_bucket.rate()
+
+    def rates(self):
+        """
+        Taxa atual (bytes/s) de cada conexão com tráfego na janela.
+        """
+        with self.lock:
+            conexoes = list(self.conexoes.items())
+        return {c: round(t) for c, b in conexoes if (t := b.rate())}
+
+    def __repr__(self):
+        limite = self.global_bucket.taxa or 'sem limite'
+        return f'{self.nome}: {round(self.rate())} B/s (limite {limite}, por conexão {self.taxa_conexao or "sem limite"})'
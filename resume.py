@@ -0,0 +1,87 @@
+import os
+import struct
+import time
+from bitfield import Bitfield
+from utils import gravar_atomico
+
+# Arquivo de resume de cada swarm, na pasta de blocos do peer
+ARQUIVO_RESUME = 'resume.bin'
+
+# Cabeçalho: assinatura, versão do formato, total de peças, info-hash (SHA-1) e instante da gravação
+CABECALHO = struct.Struct('!4sHI20sQ')
+ASSINATURA = b'MBRS'
+VERSAO = 1
+
+# Registro de cada peça presente: hash SHA-256 do manifesto e mtime (ns) da peça no disco
+PECA = struct.Struct('!32sQ')
+
+
+class ResumeState:
+    """
+    Estado de um swarm gravado em disco para um reinício rápido: o bitfield das peças
+    verificadas e, para cada uma, o hash e o mtime com que foi verificada.
+
+    Ao reiniciar, as peças do resume cujo mtime e hash ainda batem são aceitas sem reler o
+    disco; só as demais (gravadas depois do último resume, alteradas ou de outro manifesto)
+    precisam ser verificadas de novo.
+    """
+
+    def __init__(self, blocks, registros, info_hash, salvo_em):
+        self.blocks = blocks
+        self.registros = registros  # índice -> (hash hexadecimal, mtime em ns)
+        self.info_hash = info_hash
+        self.salvo_em = salvo_em
+
+    def to_bytes(self):
+        corpo = [CABECALHO.pack(ASSINATURA, VERSAO, self.blocks.tamanho, bytes.fromhex(self.info_hash),
+                                self.salvo_em), self.blocks.to_bytes()]
+        for b in self.blocks:
+            digest, mtime = self.registros[b]
+            corpo.append(PECA.pack(bytes.fromhex(digest), mtime))
+        return b''.join(corpo)
+
+    @classmethod
+    def from_bytes(cls, dados):
+        assinatura, versao, total, info_hash, salvo_em = CABECALHO.unpack_from(dados)
+        if assinatura != ASSINATURA or versao != VERSAO:
+            raise ValueError("Arquivo de resume em formato desconhecido")
+        inicio = CABECALHO.size
+        tamanho_bitfield = (total + 7) // 8
+        blocks = Bitfield.from_bytes(total, dados[inicio:inicio + tamanho_bitfield])
+        inicio += tamanho_bitfield
+        registros = {}
+        for b in blocks:
+            digest, mtime = PECA.unpack_from(dados, inicio)
+            registros[b] = (digest.hex(), mtime)
+            inicio += PECA.size
+        return cls(blocks, registros, info_hash.hex(), salvo_em)
+
+    def trusted(self, piece_hashes, store):
+        """
+        Peças do resume que continuam válidas: mesmo hash no manifesto e mesmo mtime no disco.
+        """
+        return {b for b in self.blocks
+                if self.registros[b][0] == piece_hashes[b] and store.piece_mtime(b) == self.registros[b][1]}
+
+
+def save_resume(bloco_dir, info_hash, blocks, piece_hashes, store):
+    """
+    Grava o resume do swarm de forma atômica (temporário + rename).
+    """
+    registros = {b: (piece_hashes[b], store.piece_mtime(b) or 0) for b in blocks}
+    estado = ResumeState(blocks, registros, info_hash, time.time_ns())
+    gravar_atomico(os.path.join(bloco_dir, ARQUIVO_RESUME), estado.to_bytes())
+
+
+def load_resume(bloco_dir, info_hash, total):
+    """
+    Lê o resume do swarm; None se não existe, está corrompido ou é de outro swarm.
+    """
+    try:
+        with open(os.path.join(bloco_dir, ARQUIVO_RESUME), 'rb') as f:
+            estado = ResumeState.from_bytes(f.read())
+    except (OSError, ValueError, struct.error):
+        return None
+    if estado.info_hash != info_hash or estado.blocks.tamanho != total:
+        return None
+    return estado
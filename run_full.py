@@ -3,8 +3,14 @@ import time
 import sys
 import signal
 from datetime import datetime
+from bench import aguardar_porta
+from peer import PEER_PORT_BASE, TRACKER_PORT
 
 NUM_PEERS = 5  # total de peers (incluindo peer 0)
+MODO = 'thread'  # motor de rede dos peers e do tracker: 'thread' ou 'asyncio'
+STORAGE = 'arquivo'  # armazenamento dos blocos: 'arquivo' (único, pré-alocado) ou 'blocos'
+PIECE_SIZE = 256 * 1024  # tamanho de cada bloco (peça) em bytes, definido pelo seed
+SUPER_SEED = False  # peer 0 com --super-seed no lugar da distribuição inicial do dist_block
 
 def run_command(cmd, wait=True):
     print(f"[RUN] Executando: {' '.join(cmd)}")
@@ -18,22 +24,27 @@ def main():
     inicio = datetime.now()
 
     print("[RUN] Passo 1: Peer 0 iniciando e dividindo arquivo...")
-    peer0_proc = run_command([sys.executable, 'peer.py', '0'], wait=False)
-    time.sleep(5)
+    peer0_cmd = [sys.executable, 'peer.py', '0', '--modo', MODO, '--storage', STORAGE, '--piece-size', str(PIECE_SIZE)]
+    peer0_proc = run_command(peer0_cmd + ['--super-seed'] if SUPER_SEED else peer0_cmd, wait=False)
+    # O servidor do peer 0 só sobe depois que os blocos e o metadata.json estão prontos
+    aguardar_porta(PEER_PORT_BASE, timeout=120, processo=peer0_proc, descricao='peer 0')
 
-    print("[RUN] Passo 2: Distribuindo blocos para peers...")
-    run_command([sys.executable, 'dist_block.py'])
+    if SUPER_SEED:
+        # Com super-seeding o próprio seed distribui as primeiras peças
+        print("[RUN] Passo 2: Super-seeding no peer 0, sem distribuição inicial de blocos")
+    else:
+        print("[RUN] Passo 2: Distribuindo blocos para peers...")
+        run_command([sys.executable, 'dist_block.py', '--storage', STORAGE])
 
     print("[RUN] Passo 3: Iniciando tracker...")
-    tracker_proc = run_command([sys.executable, 'tracker.py'], wait=False)
-    time.sleep(2)
+    tracker_proc = run_command([sys.executable, 'tracker.py', '--modo', MODO], wait=False)
+    aguardar_porta(TRACKER_PORT, processo=tracker_proc, descricao='tracker')
 
     print("[RUN] Passo 4: Iniciando peers restantes...")
     peer_procs = [peer0_proc]
     for peer_id in range(1, NUM_PEERS):
-        proc = run_command([sys.executable, 'peer.py', str(peer_id)], wait=False)
+        proc = run_command([sys.executable, 'peer.py', str(peer_id), '--modo', MODO, '--storage', STORAGE], wait=False)
         peer_procs.append(proc)
-        time.sleep(1)
 
     print("[RUN] Sistema MiniBit iniciado com sucesso! CTRL+C para encerrar.")
 
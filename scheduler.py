@@ -0,0 +1,363 @@
+import asyncio
+import functools
+import queue
+import threading
+import time
+from logger import gerar_log, DEBUG, WARNING
+from metrics import REGISTRY
+
+# Limite global padrão de requisições de bloco em voo
+MAX_OUTSTANDING = 32
+
+# Quantidade de blocos restantes a partir da qual o scheduler entra em endgame
+ENDGAME_THRESHOLD = 4
+
+# Máximo de peers pedindo o mesmo bloco ao mesmo tempo no endgame
+ENDGAME_DUPLICATES = 2
+
+# Peso da amostra mais recente na média móvel de vazão de cada peer
+THROUGHPUT_ALPHA = 0.3
+
+BLOCK_FETCH_SECONDS = REGISTRY.histogram('minibit_block_fetch_seconds',
+                                         'Tempo entre o pedido de um bloco e a chegada do último chunk',
+                                         ('resultado',))
+EXPIRED_REQUESTS = REGISTRY.counter('minibit_block_requests_expired_total', 'Requisições de bloco que expiraram')
+
+
+class RequestBudget:
+    """
+    Limite de requisições de bloco em voo compartilhado pelos schedulers de todos os swarms
+    de um peer, para que um swarm não ocupe sozinho a banda do processo.
+    """
+
+    def __init__(self, limite=MAX_OUTSTANDING):
+        self.limite = limite
+        self.em_voo = 0
+        self.lock = threading.Lock()
+
+    def try_acquire(self):
+        with self.lock:
+            if self.em_voo >= self.limite:
+                return False
+            self.em_voo += 1
+            return True
+
+    def release(self):
+        with self.lock:
+            self.em_voo -= 1
+
+
+class DownloadScheduler:
+    """
+    Mantém várias requisições de bloco em voo, espalhadas entre todos os peers desbloqueados.
+
+    Os blocos são escolhidos pela raridade (calculate_rarest_blocks) e, para cada bloco,
+    o peer é escolhido pela vazão medida dividida pela quantidade de requisições que ele
+    já tem em voo. Nos últimos blocos (endgame) o mesmo bloco é pedido a mais de um peer.
+    Cada bloco pedido vira várias sub-requisições de chunk pela mesma conexão, e cada chunk
+    alimenta o hash incremental do bloco assim que chega.
+
+    Cada swarm tem seu scheduler; budget, se informado, é o RequestBudget do peer que limita
+    as requisições em voo somando todos os swarms.
+    """
+
+    def __init__(self, swarm, max_outstanding=MAX_OUTSTANDING, per_peer_limit=None,
+                 endgame_threshold=ENDGAME_THRESHOLD, request_timeout=10, budget=None):
+        self.swarm = swarm
+        self.budget = budget
+        self.max_outstanding = max_outstanding
+        self.per_peer_limit = per_peer_limit  # em blocos; None = derivado de queue_depth
+        self.endgame_threshold = endgame_threshold
+        self.request_timeout = request_timeout
+        self.inflight = {}    # bloco -> {peer: instante do envio}
+        self.per_peer = {}    # peer -> requisições em voo
+        self.throughput = {}  # peer -> bytes/s (média móvel)
+        self.lock = threading.Lock()
+        self.completed = queue.Queue()
+        self.completed_async = None
+        self.loop_async = None
+        self.wake_pending = False
+        self.tasks_async = set()
+
+    def outstanding(self):
+        with self.lock:
+            return sum(len(peers) for peers in self.inflight.values())
+
+    def peer_score(self, peer):
+        """
+        Vazão esperada de um novo pedido ao peer. Peers ainda não medidos recebem a
+        melhor vazão conhecida, para que sejam experimentados.
+        """
+        melhor = max(self.throughput.values(), default=1.0)
+        return self.throughput.get(peer, melhor) / (self.per_peer.get(peer, 0) + 1)
+
+    def next_requests(self):
+        """
+        Escolhe as próximas requisições (bloco, peer, instante do envio) até preencher o limite global.
+        """
+        with self.swarm.lock:
+            unchoked = self.swarm.available_peers()
+            blocks_map = {p: self.swarm.peer_blocks_map.get(p, set()) for p in unchoked}
+            suggested = getattr(self.swarm, 'suggested_blocks', ())
+        # Blocos sugeridos pelo tracker (mais raros na rede toda) vêm na frente, mantendo a ordem de raridade local
+        missing = self.swarm.calculate_rarest_blocks(suggested)
+        endgame = len(missing) <= self.endgame_threshold
+
+        escolhas = []
+        # Por padrão, cada peer recebe quantos blocos couberem na fila de chunks da conexão
+        limite_peer = self.per_peer_limit or max(1, self.swarm.queue_depth // self.swarm.chunks_per_block())
+        with self.lock:
+            livres = self.max_outstanding - sum(len(peers) for peers in self.inflight.values())
+            # Primeiro os blocos ainda não pedidos; no endgame, depois os duplicados
+            passes = (False, True) if endgame else (False,)
+            for duplicados in passes:
+                for block in missing:
+                    if livres <= 0:
+                        return escolhas
+                    ja_pedido = self.inflight.get(block, {})
+                    if bool(ja_pedido) != duplicados or len(ja_pedido) >= ENDGAME_DUPLICATES:
+                        continue
+                    candidatos = [p for p in unchoked
+                                  if block in blocks_map[p] and p not in ja_pedido
+                                  and self.per_peer.get(p, 0) < limite_peer]
+                    if not candidatos:
+                        continue
+                    if self.budget is not None and not self.budget.try_acquire():
+                        return escolhas
+                    escolhido = max(candidatos, key=self.peer_score)
+                    inicio = time.monotonic()
+                    self.inflight.setdefault(block, {})[escolhido] = inicio
+                    self.per_peer[escolhido] = self.per_peer.get(escolhido, 0) + 1
+                    escolhas.append((block, escolhido, inicio))
+                    livres -= 1
+        if endgame and escolhas:
+            gerar_log("[Peer %s] Endgame: pedindo %s", self.swarm.peer_id, [(b, p) for b, p, _ in escolhas])
+        return escolhas
+
+    def finish(self, block, peer, inicio, nbytes, elapsed, ok):
+        """
+        Registra o fim de uma requisição e atualiza a vazão medida do peer.
+        Requisições já encerradas (por exemplo, expiradas) são ignoradas.
+        """
+        with self.lock:
+            pedidos = self.inflight.get(block)
+            if pedidos is None or pedidos.get(peer) != inicio:
+                return
+            del pedidos[peer]
+            if not pedidos:
+                del self.inflight[block]
+            self.per_peer[peer] -= 1
+            if self.budget is not None:
+                self.budget.release()
+            if ok and elapsed > 0:
+                amostra = nbytes / elapsed
+                anterior = self.throughput.get(peer)
+                self.throughput[peer] = amostra if anterior is None else (
+                    THROUGHPUT_ALPHA * amostra + (1 - THROUGHPUT_ALPHA) * anterior)
+
+    def drop_inflight(self):
+        """
+        Encerra as requisições ainda em voo quando o swarm fica completo (em geral duplicatas
+        do endgame, cujas respostas ninguém mais vai ler) e devolve as vagas ao budget do peer,
+        para os outros swarms. Respostas que chegarem depois são ignoradas por finish.
+        """
+        with self.lock:
+            pendentes = sum(len(pedidos) for pedidos in self.inflight.values())
+            self.inflight.clear()
+            self.per_peer.clear()
+            if self.budget is not None:
+                for _ in range(pendentes):
+                    self.budget.release()
+        if pendentes:
+            gerar_log("[Peer %s] %d requisições em voo descartadas: %s completo", self.swarm.peer_id, pendentes,
+                      self.swarm.nome, nivel=DEBUG)
+
+    def expired(self):
+        """
+        Retorna os pares (bloco, peer) com requisições em voo há mais de request_timeout.
+        """
+        limite = time.monotonic() - self.request_timeout
+        with self.lock:
+            return [(block, p, inicio) for block, pedidos in self.inflight.items()
+                    for p, inicio in pedidos.items() if inicio < limite]
+
+    def process_result(self, block, peer, inicio, resposta, data, erro, digest=None):
+        """
+        Trata a resposta (ou o erro) de um REQUEST e libera a vaga da requisição.
+        Um bloco que falha na verificação de hash conta como falha e volta a ser pedido.
+        """
+        elapsed = time.monotonic() - inicio
+        if erro is not None:
+            BLOCK_FETCH_SECONDS.labels('erro').observe(elapsed)
+            gerar_log("[Peer %s] Erro ao baixar bloco %s de %s: %s", self.swarm.peer_id, block, peer, erro, nivel=WARNING)
+            self.finish(block, peer, inicio, 0, elapsed, False)
+            return False
+        with self.swarm.lock:
+            duplicado = block in self.swarm.blocks
+        if duplicado:
+            # Duplicata do endgame que chegou depois: só conta para a vazão do peer
+            BLOCK_FETCH_SECONDS.labels('duplicado').observe(elapsed)
+            self.finish(block, peer, inicio, len(data), elapsed, resposta == 'DATA')
+            return False
+        ok = self.swarm.handle_block_response(peer, block, resposta, data, digest)
+        BLOCK_FETCH_SECONDS.labels('ok' if ok else 'falha').observe(elapsed)
+        self.finish(block, peer, inicio, len(data), elapsed, ok)
+        return ok
+
+    def wake(self):
+        """
+        Interrompe a espera por respostas em run/run_async para que novas requisições sejam
+        escolhidas já (por exemplo, quando um peer anuncia um bloco que nos falta).
+        Pode ser chamado de qualquer thread; avisos seguidos viram uma só volta.
+        """
+        if self.wake_pending:
+            return
+        self.wake_pending = True
+        if self.completed_async is not None:
+            self.loop_async.call_soon_threadsafe(self.completed_async.put_nowait, None)
+        else:
+            self.completed.put(None)
+
+    def run(self, duracao):
+        """
+        Executa o download por até duracao segundos (ou até o arquivo ficar completo),
+        mantendo a fila de requisições cheia pelas conexões persistentes. Ao completar, as
+        requisições que sobraram liberam as suas vagas (drop_inflight).
+        """
+        fim = time.monotonic() + duracao
+        self.wake_pending = False
+        while time.monotonic() < fim and not self.swarm.is_complete():
+            for block, p, inicio in self.next_requests():
+                self._submit(block, p, inicio)
+            for block, p, inicio in self.expired():
+                gerar_log("[Peer %s] Requisição de %s ao peer %s expirou", self.swarm.peer_id, block, p, nivel=WARNING)
+                EXPIRED_REQUESTS.inc()
+                self.finish(block, p, inicio, 0, 0, False)
+                self.swarm.pool.discard(p)
+            try:
+                resultado = self.completed.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if resultado is None:
+                self.wake_pending = False  # wake: há blocos novos para pedir
+                continue
+            block, p, inicio, respostas, hasher = resultado
+            erro = next((r for r in respostas if isinstance(r, Exception)), None)
+            digest = None
+            if erro is not None:
+                self.swarm.pool.discard(p)
+                resposta, data = None, b''
+            else:
+                resposta, data = self.swarm.assemble_block(block, respostas)
+                if resposta == 'DATA':
+                    # Todos os chunks já foram entregues ao pool de hash; falta só o último update
+                    digest = hasher.digest.result()
+            self.process_result(block, p, inicio, resposta, data, erro, digest)
+        if self.swarm.is_complete():
+            self.drop_inflight()
+            while True:
+                try:
+                    self.completed.get_nowait()
+                except queue.Empty:
+                    break
+
+    def _submit(self, block, peer, inicio):
+        """
+        Envia os chunks do bloco pela conexão com o peer. Cada chunk recebido (descomprimido,
+        se veio como ZDATA) vai para o hash incremental do bloco; quando todos respondem (ou
+        falham), a lista de respostas vai para a fila de concluídos.
+        """
+        comandos = self.swarm.chunk_requests(block)
+        hasher = self.swarm.piece_hasher(block)
+        respostas = [None] * len(comandos)
+        restantes = [len(comandos)]
+        trava = threading.Lock()
+
+        def registrar(i, valor):
+            respostas[i] = valor
+            with trava:
+                restantes[0] -= 1
+                ultimo = restantes[0] == 0
+            if ultimo:
+                self.completed.put((block, peer, inicio, respostas, hasher))
+
+        def chunk_done(i, future):
+            try:
+                resposta, corpo = self.swarm.decode_chunk(*future.result())
+                if resposta == 'DATA':
+                    hasher.feed(i, corpo)
+                registrar(i, (resposta, corpo))
+            except Exception as e:
+                registrar(i, e)
+
+        enviados = 0
+        try:
+            conn = self.swarm.pool.get(peer)
+            for i, comando in enumerate(comandos):
+                conn.submit(comando).add_done_callback(functools.partial(chunk_done, i))
+                enviados += 1
+        except Exception as e:
+            self.swarm.pool.discard(peer)
+            for i in range(enviados, len(comandos)):
+                registrar(i, e)
+
+    async def run_async(self, duracao):
+        """
+        Versão asyncio de run: cada requisição é uma task sobre a conexão assíncrona do peer.
+        Requisições expiradas são tratadas como em run, e o bloco volta a ser pedido.
+        """
+        fim = time.monotonic() + duracao
+        if self.completed_async is None:
+            # Persistente entre rodadas: respostas atrasadas ainda liberam suas vagas
+            self.completed_async = asyncio.Queue()
+            self.loop_async = asyncio.get_running_loop()
+        concluidos = self.completed_async
+        tarefas = self.tasks_async
+        self.wake_pending = False
+
+        async def chunk(p, comando, i, hasher):
+            resposta, corpo = self.swarm.decode_chunk(*await self.swarm.peer_request_async(p, comando))
+            if resposta == 'DATA':
+                hasher.feed(i, corpo)
+            return resposta, corpo
+
+        async def buscar(block, p, inicio):
+            try:
+                hasher = self.swarm.piece_hasher(block)
+                respostas = await asyncio.gather(*(chunk(p, comando, i, hasher)
+                                                   for i, comando in enumerate(self.swarm.chunk_requests(block))),
+                                                 return_exceptions=True)
+                erro = next((r for r in respostas if isinstance(r, BaseException)), None)
+                if erro is not None:
+                    raise erro
+                resposta, data = self.swarm.assemble_block(block, respostas)
+                digest = await asyncio.wrap_future(hasher.digest) if resposta == 'DATA' else None
+                await concluidos.put((block, p, inicio, resposta, data, None, digest))
+            except Exception as e:
+                await concluidos.put((block, p, inicio, None, b'', e))
+
+        while time.monotonic() < fim and not self.swarm.is_complete():
+            for block, p, inicio in self.next_requests():
+                tarefa = asyncio.create_task(buscar(block, p, inicio))
+                tarefas.add(tarefa)
+                tarefa.add_done_callback(tarefas.discard)
+            for block, p, inicio in self.expired():
+                # Como em run: a vaga é liberada e a conexão fechada, o que encerra a task com erro
+                gerar_log("[Peer %s] Requisição de %s ao peer %s expirou", self.swarm.peer_id, block, p, nivel=WARNING)
+                EXPIRED_REQUESTS.inc()
+                self.finish(block, p, inicio, 0, 0, False)
+                self.swarm.peer.async_pool.discard(p)
+            try:
+                resultado = await asyncio.wait_for(concluidos.get(), 0.5)
+            except asyncio.TimeoutError:
+                continue
+            if resultado is None:
+                self.wake_pending = False
+                continue
+            await asyncio.to_thread(self.process_result, *resultado)
+        if self.swarm.is_complete():
+            for tarefa in list(tarefas):
+                tarefa.cancel()
+            self.drop_inflight()
+            while not concluidos.empty():
+                concluidos.get_nowait()
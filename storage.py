@@ -0,0 +1,225 @@
+import os
+import struct
+import time
+from utils import reconstruir_arquivo, gravar_atomico
+
+# Tamanho padrão de cada bloco (peça) em bytes; recomendado entre 256 KiB e 4 MiB
+TAMANHO_BLOCO = 256 * 1024
+
+# Tamanho de cada sub-requisição (chunk) de um bloco
+TAMANHO_CHUNK = 16 * 1024
+
+# Tipos de armazenamento disponíveis
+STORAGE_ARQUIVO = 'arquivo'  # arquivo único pré-alocado, escrito por offset (padrão)
+STORAGE_BLOCOS = 'blocos'    # um arquivo block_N por bloco (layout original)
+STORAGES = (STORAGE_ARQUIVO, STORAGE_BLOCOS)
+
+
+def block_name(index):
+    return f'block_{index}'
+
+
+def block_index(nome):
+    return int(nome.split('_')[1])
+
+
+class BlockStore:
+    """
+    Interface de armazenamento dos blocos de um peer.
+    """
+
+    def __init__(self, bloco_dir, arquivo_saida, total_blocos, tamanho_bloco=TAMANHO_BLOCO):
+        self.bloco_dir = bloco_dir
+        self.arquivo_saida = arquivo_saida
+        self.total_blocos = total_blocos
+        self.tamanho_bloco = tamanho_bloco
+        os.makedirs(bloco_dir, exist_ok=True)
+
+    def existing_blocks(self):
+        """
+        Retorna o conjunto de índices dos blocos já presentes no armazenamento.
+        """
+        raise NotImplementedError
+
+    def write_block(self, index, data):
+        raise NotImplementedError
+
+    def piece_mtime(self, index):
+        """
+        Carimbo (mtime em ns) da peça no disco, guardado no arquivo de resume para detectar
+        peças alteradas depois de verificadas. None se a peça não está presente.
+        """
+        raise NotImplementedError
+
+    def read_block(self, index):
+        raise NotImplementedError
+
+    def block_span(self, index):
+        """
+        Retorna (arquivo, offset, tamanho) para enviar o bloco direto do disco com sendfile.
+        O arquivo aberto deve ser fechado pelo chamador.
+        """
+        raise NotImplementedError
+
+    def finalize(self):
+        """
+        Chamado quando todos os blocos chegaram. Retorna o caminho do arquivo completo.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class PerBlockFileStore(BlockStore):
+    """
+    Layout original: cada bloco é um arquivo block_N no diretório do peer e o arquivo
+    final é reconstruído concatenando os blocos no fim do download.
+    """
+
+    def existing_blocks(self):
+        return set(block_index(f) for f in os.listdir(self.bloco_dir)
+                   if f.startswith('block_') and f != 'block_count.txt')
+
+    def write_block(self, index, data):
+        # Temporário + rename: um crash no meio da escrita nunca deixa um block_N truncado
+        gravar_atomico(os.path.join(self.bloco_dir, block_name(index)), data)
+
+    def piece_mtime(self, index):
+        try:
+            return os.stat(os.path.join(self.bloco_dir, block_name(index))).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def read_block(self, index):
+        with open(os.path.join(self.bloco_dir, block_name(index)), 'rb') as f:
+            return f.read()
+
+    def block_span(self, index):
+        arquivo = open(os.path.join(self.bloco_dir, block_name(index)), 'rb', buffering=0)
+        return arquivo, 0, os.fstat(arquivo.fileno()).st_size
+
+    def finalize(self):
+        reconstruir_arquivo(self.bloco_dir, self.arquivo_saida, self.total_blocos)
+        return self.arquivo_saida
+
+
+class PreallocatedFileStore(BlockStore):
+    """
+    Arquivo único pré-alocado com o tamanho final; cada bloco é escrito no seu offset com
+    os.pwrite, então o arquivo fica completo quando o último bloco chega, sem reconstrução.
+    Um mapa de presença no diretório do peer registra, para cada bloco, o instante em que
+    foi gravado (0 se ainda não chegou), usado como carimbo da peça no resume.
+    """
+
+    MAPA_PRESENCA = 'presentes.bin'
+    REGISTRO = struct.Struct('!Q')
+
+    def __init__(self, bloco_dir, arquivo_saida, total_blocos, tamanho_bloco=TAMANHO_BLOCO):
+        super().__init__(bloco_dir, arquivo_saida, total_blocos, tamanho_bloco)
+        self.fd = os.open(arquivo_saida, os.O_RDWR | os.O_CREAT, 0o644)
+        self.mapa_fd = os.open(os.path.join(bloco_dir, self.MAPA_PRESENCA), os.O_RDWR | os.O_CREAT, 0o644)
+        tamanho_mapa = os.fstat(self.mapa_fd).st_size
+        if tamanho_mapa == total_blocos and total_blocos:
+            self._convert_map()
+        elif tamanho_mapa != total_blocos * self.REGISTRO.size:
+            os.ftruncate(self.mapa_fd, total_blocos * self.REGISTRO.size)
+        # Instante da gravação mais recente; o arquivo com mtime maior foi alterado por fora
+        self.ultima_escrita = max(self._stamps(), default=0)
+        # O último bloco pode ser menor: o tamanho exato só é conhecido quando ele chega
+        if total_blocos and not self._present(total_blocos - 1):
+            self._preallocate(total_blocos * tamanho_bloco)
+
+    def _preallocate(self, tamanho):
+        if os.fstat(self.fd).st_size >= tamanho:
+            return
+        try:
+            os.posix_fallocate(self.fd, 0, tamanho)
+        except (AttributeError, OSError):
+            os.ftruncate(self.fd, tamanho)
+
+    def _convert_map(self):
+        # Mapa do formato anterior, um byte por bloco: os presentes ficam com o mtime do arquivo
+        antigo = os.pread(self.mapa_fd, self.total_blocos, 0)
+        carimbo = os.fstat(self.fd).st_mtime_ns
+        os.pwrite(self.mapa_fd, b''.join(self.REGISTRO.pack(carimbo if presente else 0) for presente in antigo), 0)
+
+    def _stamp(self, index):
+        registro = os.pread(self.mapa_fd, self.REGISTRO.size, index * self.REGISTRO.size)
+        return self.REGISTRO.unpack(registro)[0] if len(registro) == self.REGISTRO.size else 0
+
+    def _stamps(self):
+        mapa = os.pread(self.mapa_fd, self.total_blocos * self.REGISTRO.size, 0)
+        return [carimbo for carimbo, in self.REGISTRO.iter_unpack(mapa)]
+
+    def _present(self, index):
+        return self._stamp(index) != 0
+
+    def existing_blocks(self):
+        # Relê o mapa do disco: outro processo (dist_block) pode ter gravado blocos
+        return set(i for i, carimbo in enumerate(self._stamps()) if carimbo)
+
+    def write_block(self, index, data):
+        offset = index * self.tamanho_bloco
+        os.pwrite(self.fd, data, offset)
+        if index == self.total_blocos - 1:
+            os.ftruncate(self.fd, offset + len(data))
+        # O mapa só é marcado depois que os dados estão no arquivo, com um instante não
+        # anterior ao mtime que a escrita deixou nele
+        carimbo = time.time_ns()
+        os.pwrite(self.mapa_fd, self.REGISTRO.pack(carimbo), index * self.REGISTRO.size)
+        self.ultima_escrita = max(self.ultima_escrita, carimbo)
+
+    def piece_mtime(self, index):
+        carimbo = self._stamp(index)
+        if not carimbo:
+            return None
+        mtime = os.fstat(self.fd).st_mtime_ns
+        if mtime > self.ultima_escrita:
+            # Relê o mapa (dist_block grava de outro processo); se o arquivo ainda é mais novo
+            # que toda gravação registrada, foi alterado por fora e nenhum carimbo vale
+            self.ultima_escrita = max(self._stamps(), default=0)
+            if mtime > self.ultima_escrita:
+                return mtime
+        return carimbo
+
+    def read_block(self, index):
+        offset, tamanho = self._extent(index)
+        return os.pread(self.fd, tamanho, offset)
+
+    def block_span(self, index):
+        # dup evita reabrir o arquivo pelo caminho; sendfile usa offsets explícitos
+        offset, tamanho = self._extent(index)
+        return os.fdopen(os.dup(self.fd), 'rb', buffering=0), offset, tamanho
+
+    def _extent(self, index):
+        offset = index * self.tamanho_bloco
+        tamanho = self.tamanho_bloco
+        if index == self.total_blocos - 1:
+            tamanho = os.fstat(self.fd).st_size - offset
+        return offset, tamanho
+
+    def finalize(self):
+        os.fsync(self.fd)
+        return self.arquivo_saida
+
+    def close(self):
+        # Descritores inválidos depois de fechar: um pedido atrasado falha em vez de ler
+        # um descritor reaproveitado
+        fd, self.fd = self.fd, -1
+        mapa_fd, self.mapa_fd = self.mapa_fd, -1
+        if fd >= 0:
+            os.close(fd)
+        if mapa_fd >= 0:
+            os.close(mapa_fd)
+
+
+def open_store(tipo, bloco_dir, arquivo_saida, total_blocos, tamanho_bloco=TAMANHO_BLOCO):
+    """
+    Cria o armazenamento de blocos do tipo pedido ('arquivo' ou 'blocos').
+    """
+    if tipo == STORAGE_BLOCOS:
+        return PerBlockFileStore(bloco_dir, arquivo_saida, total_blocos, tamanho_bloco)
+    if tipo == STORAGE_ARQUIVO:
+        return PreallocatedFileStore(bloco_dir, arquivo_saida, total_blocos, tamanho_bloco)
+    raise ValueError(f"Tipo de armazenamento desconhecido: {tipo}")
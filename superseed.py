@@ -0,0 +1,175 @@
+import random
+import time
+
+# Segundos que uma peça oferecida espera aparecer em outro peer; depois disso quem a recebeu
+# ganha a próxima mesmo assim (pode não ter a quem repassar, ou ter saído da rede)
+SUPERSEED_TIMEOUT = 15
+
+# Intervalo (segundos) do loop do seed com super-seeding, para consultar logo quem acabou de
+# chegar (e passar a ver os HAVEs dele) e repor as ofertas de quem saiu
+SUPERSEED_ROUND = 0.5
+
+
+class SuperSeeder:
+    """
+    Super-seeding do seed inicial. Em vez do bitfield completo, cada downloader vê só as
+    peças que lhe foram oferecidas, uma por vez, escolhidas entre as que nenhum downloader
+    tem. A próxima só é revelada quando a anterior aparece em outro peer (o downloader a
+    repassou) ou, se não há quem precise dela, quando o próprio downloader a obtém. Assim o
+    seed envia cada peça perto de uma vez e o resto do arquivo se espalha entre os downloaders.
+
+    As ofertas a cada peer formam o log de HAVEs que ele enxerga: a versão é o número de peças
+    oferecidas, então GET_HAVES e os HAVEs empurrados continuam valendo por peer. Os métodos
+    são chamados com o lock do swarm adquirido; copias(b) é quantos peers anunciaram o bloco b.
+    """
+
+    def __init__(self, total, timeout=SUPERSEED_TIMEOUT):
+        self.total = total
+        self.timeout = timeout
+        self.ofertas = {}  # peer -> peças oferecidas, em ordem
+        self.pendentes = {}  # peer -> (peça oferecida que ainda não se espalhou, instante da oferta)
+        self.vezes = [0] * total  # quantas vezes cada peça foi oferecida
+
+    def offered(self, peer, tem, copias):
+        """
+        Peças oferecidas ao peer; no primeiro contato ele recebe a sua primeira peça.
+        tem são os blocos que o peer anunciou.
+        """
+        if peer not in self.ofertas:
+            self.ofertas[peer] = []
+            self._offer(peer, tem, copias)
+        return self.ofertas[peer]
+
+    def seen(self, peer, block, mapa, copias):
+        """
+        O peer anunciou o bloco. Libera a próxima oferta de quem esperava por ele se espalhar e
+        retorna as novas ofertas [(peer, [(peça, versão)])]. mapa é o bitfield anunciado por cada peer.
+        """
+        liberados = []
+        for q, (pendente, _) in self.pendentes.items():
+            if pendente != block:
+                continue
+            # Quem recebeu a peça só a passa adiante se alguém precisar dela
+            if q != peer or all(block in bits for p, bits in mapa.items() if p != q):
+                liberados.append(q)
+        return self._release(liberados, mapa, copias)
+
+    def expire(self, mapa, copias, agora=None):
+        """
+        Libera quem espera há mais de timeout segundos pela sua peça se espalhar e tenta de novo
+        os peers sem oferta pendente (ficaram sem candidatas enquanto as peças que faltavam
+        estavam oferecidas a outros).
+        """
+        agora = time.monotonic() if agora is None else agora
+        vencidos = [q for q, (_, instante) in self.pendentes.items() if agora - instante >= self.timeout]
+        for q in vencidos:
+            del self.pendentes[q]
+        ociosos = [q for q in self.ofertas if q not in self.pendentes]
+        return self._release(ociosos, mapa, copias)
+
+    def forget(self, peer):
+        """
+        O peer saiu da rede: a sua peça pendente volta a ser candidata para os outros.
+        """
+        self.pendentes.pop(peer, None)
+        self.ofertas.pop(peer, None)
+
+    def _release(self, peers, mapa, copias):
+        novas = []
+        for q in peers:
+            self.pendentes.pop(q, None)
+            block = self._offer(q, mapa.get(q, ()), copias)
+            if block is not None:
+                novas.append((q, [(block, len(self.ofertas[q]))]))
+        return novas
+
+    def _offer(self, peer, tem, copias):
+        """
+        Oferece ao peer, entre as peças que nenhum downloader tem nem espera receber, a menos
+        oferecida (empates por sorteio). As que já circulam ficam de fora: o peer as consegue
+        com os outros.
+        """
+        oferecidas = set(self.ofertas[peer])
+        oferecidas.update(b for b, _ in self.pendentes.values())
+        candidatas = [b for b in range(self.total) if not copias(b) and b not in tem and b not in oferecidas]
+        if not candidatas:
+            return None
+        block = min(candidatas, key=lambda b: (self.vezes[b], random.random()))
+        self.ofertas[peer].append(block)
+        self.pendentes[peer] = (block, time.monotonic())
+        self.vezes[block] += 1
+        return block
+
+
+def simular(n_peers=5, n_pecas=32, seed=None):
+    """
+    Simula o super-seeding sem rede: a cada rodada, cada downloader baixa do seed a peça que
+    lhe foi oferecida ou, sem oferta pendente, uma peça que outro downloader já tem. A cada
+    oferta confere a regra do super-seeding: cada downloader tem no máximo uma peça oferecida
+    que ainda não baixou, e a próxima só é revelada depois que a anterior aparece em outro
+    peer. Retorna um resumo com quantas peças o seed enviou e as violações encontradas.
+    """
+    aleatorio = random.Random(seed)
+    peers = list(range(n_peers))
+    mapa = {p: set() for p in peers}
+    seeder = SuperSeeder(n_pecas, timeout=float('inf'))
+    violacoes = []
+
+    def copias(b):
+        return sum(b in tem for tem in mapa.values())
+
+    def conferir(novas):
+        for q, _ in novas:
+            ofertas = seeder.ofertas[q]
+            faltando = [b for b in ofertas if b not in mapa[q]]
+            if len(faltando) > 1:
+                violacoes.append(f'peer {q} com {len(faltando)} ofertas pendentes: {faltando}')
+            if len(ofertas) > 1:
+                anterior = ofertas[-2]
+                outros = [r for r in peers if r != q]
+                espalhou = any(anterior in mapa[r] for r in outros) if outros else anterior in mapa[q]
+                if not espalhou:
+                    violacoes.append(f'peer {q} recebeu a peça {ofertas[-1]} antes de a {anterior} se espalhar')
+
+    for p in peers:
+        seeder.offered(p, mapa[p], copias)
+    envios_seed = rodadas = 0
+    while any(len(tem) < n_pecas for tem in mapa.values()) and rodadas < 4 * n_pecas * n_peers:
+        rodadas += 1
+        for p in aleatorio.sample(peers, n_peers):
+            oferecidas = [b for b in seeder.ofertas.get(p, ()) if b not in mapa[p]]
+            if oferecidas:
+                block = oferecidas[0]
+                envios_seed += 1
+            else:
+                opcoes = sorted({b for r in peers if r != p for b in mapa[r] - mapa[p]})
+                if not opcoes:
+                    continue
+                block = aleatorio.choice(opcoes)
+            mapa[p].add(block)
+            conferir(seeder.seen(p, block, mapa, copias))
+        conferir(seeder.expire(mapa, copias))
+    return {
+        'peers': n_peers,
+        'pieces': n_pecas,
+        'complete': all(len(tem) == n_pecas for tem in mapa.values()),
+        'rounds': rodadas,
+        'seed_uploads': envios_seed,
+        'seed_ratio': round(envios_seed / n_pecas, 2),
+        'violations': violacoes,
+    }
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    import sys
+    parser = argparse.ArgumentParser(description='Simula o super-seeding e confere que cada downloader recebe '
+                                                 'uma peça por vez')
+    parser.add_argument('--peers', type=int, default=5, help='quantidade de downloaders')
+    parser.add_argument('--pieces', type=int, default=32, help='quantidade de peças do arquivo')
+    parser.add_argument('--seed', type=int, help='semente do sorteio das trocas entre downloaders')
+    args = parser.parse_args()
+    resumo = simular(args.peers, args.pieces, args.seed)
+    print(json.dumps(resumo, indent=2, ensure_ascii=False))
+    sys.exit(1 if resumo['violations'] or not resumo['complete'] else 0)
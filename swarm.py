@@ -0,0 +1,1148 @@
+import asyncio
+import os
+import random
+import threading
+import time
+import json
+from utils import dividir_pasta_em_blocos, tabela_arquivos, reconstruir_pasta, salvar_metadados, ler_metadados
+from logger import gerar_log, DEBUG, INFO, WARNING
+from bitfield import Bitfield, encode_indices, decode_indices
+from rarity import RarityIndex
+from storage import open_store, block_index, block_name, TAMANHO_BLOCO, TAMANHO_CHUNK
+from hashing import PieceHasher, hash_piece, info_hash, ALGORITMO_HASH
+from scheduler import DownloadScheduler
+from metrics import REGISTRY, TimedLock
+from choker import Choker
+from superseed import SuperSeeder, SUPERSEED_ROUND
+from codec import CODECS
+from resume import load_resume, save_resume
+from dht import DHT_ANNOUNCE_INTERVAL, DHT_RETRY
+from pex import (encode_peers, decode_peers, PEX_INTERVAL, PEX_FANOUT, PEX_MAX, PEX_TTL, MAX_KNOWN_PEERS, PEX_TARGET,
+                 PEX_ANNOUNCE_INTERVAL, PEX_ANNOUNCE_TTL_FRACTION)
+
+# Duração de cada rodada do scheduler entre dois anúncios ao tracker (segundos)
+DOWNLOAD_ROUND = 5
+
+# Tempo (segundos) sem pedir blocos a um peer que respondeu CHOKED
+CHOKE_BACKOFF = 10
+
+BYTES = REGISTRY.counter('minibit_bytes_total', 'Bytes de blocos transferidos com outros peers', ('direcao',))
+BYTES_IN = BYTES.labels('in')
+ANNOUNCES = REGISTRY.counter('minibit_announces_total', 'Anúncios ao tracker por resultado', ('resultado',))
+PEX_LEARNED = REGISTRY.counter('minibit_pex_learned_peers_total', 'Peers novos conhecidos pela troca de peers (PEX)')
+DHT_LEARNED = REGISTRY.counter('minibit_dht_learned_peers_total', 'Peers novos encontrados na DHT')
+SUPERSEED_OFFERS = REGISTRY.counter('minibit_superseed_offers_total', 'Peças oferecidas aos downloaders no super-seeding')
+COMPRESSED_CHUNKS = REGISTRY.counter('minibit_compressed_chunks_total',
+                                     'Trechos pedidos por peers que aceitam compressão, por resultado',
+                                     ('swarm', 'resultado'))
+COMPRESSION_SAVED = REGISTRY.counter('minibit_compression_saved_bytes_total',
+                                     'Bytes a menos enviados por causa da compressão', ('swarm',))
+COMPRESSION_SECONDS = REGISTRY.counter('minibit_compression_cpu_seconds_total',
+                                       'Tempo de CPU gasto comprimindo e descomprimindo trechos', ('swarm', 'operacao'))
+
+
+class Swarm:
+    """
+    Um torrent dentro de um peer: os blocos de um conjunto de arquivos, identificado pelo
+    info-hash do manifesto. Guarda tudo que é próprio do torrent (armazenamento, bitfields,
+    raridade, peers conhecidos, anúncios e scheduler); o socket de escuta, o pool de conexões,
+    o pool de hash e o limite de requisições em voo são do Peer e compartilhados entre os swarms.
+
+    Um swarm com origem é semeado a partir da pasta origem; sem origem, o manifesto é lido
+    do metadata.json em metadados_dir.
+    """
+
+    def __init__(self, peer, origem=None, metadados_dir=None, bloco_dir=None, arquivo_saida=None,
+                 piece_size=TAMANHO_BLOCO):
+        self.peer = peer
+        self.peer_id = peer.peer_id
+        self.port = peer.port
+        self.origem = origem
+        self.seed = origem is not None
+        self.metadados_dir = metadados_dir
+        self.nome = os.path.basename(os.path.normpath(origem)) if origem else None
+        self.bloco_dir = bloco_dir
+        self.arquivo_saida = arquivo_saida
+        self.info_hash = None
+
+        self.blocks = Bitfield(0)  # recriado quando o total de blocos é conhecido
+        self.have_log = []  # índices dos blocos obtidos, em ordem; a versão é o tamanho da lista
+        self.known_peers = set()
+        self.peer_blocks_map = {}  # peer -> Bitfield dos blocos anunciados
+        self.peer_versions = {}  # peer -> versão do have_log do peer já aplicada
+        # Conexões do pool em que pedimos o bitfield de cada peer: por elas chegam os HAVEs dele
+        self.inscritos = {}  # peer -> conexão
+        # Conexões recebidas que pediram nosso bitfield e recebem um HAVE a cada bloco obtido
+        self.assinantes = set()
+        # PEX: último contato direto com cada peer (handshake, HAVE ou conexão recebida)
+        self.vistos = {}  # peer -> instante (monotonic)
+        self.next_pex = 0
+        self.next_dht = 0
+        self.rarity = RarityIndex(0)  # disponibilidade de cada bloco entre os peers conhecidos
+        self.suggested_blocks = []
+        # Quem pode baixar de nós (decidido pelo choker) e quem nos bloqueou (peer -> até quando)
+        self.choker = Choker(slots=peer.unchoke_slots)
+        self.choked_by = {}
+        # Super-seeding (só no seed, com peer.super_seed): criado quando o total de blocos é conhecido
+        self.superseed = None
+        # Compressão dos trechos servidos (codec.py): codec definido em prepare conforme a
+        # configuração do peer, trechos que não diminuem ao comprimir e contadores de ganho/CPU
+        self.codec = None
+        self.incompressiveis = set()
+        self.compressao = {'trechos': 0, 'incompressiveis': 0, 'bytes_originais': 0, 'bytes_enviados': 0,
+                           'recebidos': 0, 'cpu_compressao': 0.0, 'cpu_descompressao': 0.0}
+        self.compressao_lock = threading.Lock()
+        self.lock = TimedLock(threading.RLock(), 'swarm')
+        self.scheduler = DownloadScheduler(self, max_outstanding=peer.max_outstanding,
+                                           endgame_threshold=peer.endgame_threshold, budget=peer.budget)
+
+        # Anúncios ao tracker: versão do have_log já anunciada (None = mandar bitfield completo)
+        # e intervalo mínimo entre anúncios, definido pelo tracker em cada resposta
+        self.announced_version = None
+        self.announce_interval = 0
+        self.next_announce = 0
+        self.last_announce = 0
+        self.tracker_ttl = None  # segundos até o tracker esquecer um peer que não anuncia
+
+        self.BLOCKS_TOTAL = None
+
+        # Peças de piece_size bytes, transferidas em sub-requisições de chunk_size bytes
+        self.piece_size = piece_size
+        self.chunk_size = min(TAMANHO_CHUNK, piece_size)
+        self.total_size = None
+
+        # Manifesto com o hash de cada peça, gerado pelo seed ao dividir o arquivo, e a tabela
+        # de arquivos (path, offset, length) para recriar a pasta original no fim do download
+        self.piece_hashes = None
+        self.files = None
+        self.pasta_saida = None
+        self.pasta_reconstruida = False
+        self.store = None  # criado quando o total de blocos é conhecido
+
+        # Resume: versão do have_log já gravada e blocos que precisam ser verificados ao iniciar
+        self.resume_version = None
+        self.suspect_blocks = set()
+        # Serializa as gravações do resume (unchoke loop e conclusão do download)
+        self.resume_lock = threading.Lock()
+
+    @property
+    def pool(self):
+        return self.peer.pool
+
+    @property
+    def queue_depth(self):
+        return self.peer.queue_depth
+
+    @property
+    def hash_pool(self):
+        return self.peer.hash_pool
+
+    def label(self):
+        return self.nome or self.metadados_dir
+
+    def set_blocks_total_dynamic(self, max_retries=10, retry_delay=3):
+        """
+        Define dinamicamente o total de blocos: o seed calcula a partir dos arquivos originais,
+        os demais peers leem o manifesto (tamanho da peça, total e hashes) do metadata.json do seed.
+        """
+        attempts = 0
+        while attempts < max_retries:
+            try:
+                if self.seed:
+                    self.files = tabela_arquivos(self.origem)
+                    self.total_size = sum(entrada['length'] for entrada in self.files)
+                    total = (self.total_size + self.piece_size - 1) // self.piece_size
+                    self.BLOCKS_TOTAL = total
+                    gerar_log(f"[Peer {self.peer_id}] Calculou total de blocos de {self.nome}: {total} de {self.piece_size} bytes")
+                    return True
+                else:
+                    try:
+                        metadados = ler_metadados(self.metadados_dir)
+                    except FileNotFoundError:
+                        gerar_log(f"[Peer {self.peer_id}] Metadados do seed não encontrados em {self.metadados_dir}. Tentando novamente ({attempts+1}/{max_retries})...")
+                        attempts += 1
+                        time.sleep(retry_delay)
+                        continue
+                    self.nome = metadados['name']
+                    self.info_hash = metadados['info_hash']
+                    self.piece_size = metadados['piece_size']
+                    self.chunk_size = metadados['chunk_size']
+                    self.total_size = metadados['total_size']
+                    self.piece_hashes = metadados['piece_hashes']
+                    self.files = metadados.get('files')  # manifestos antigos não têm a tabela
+                    total = metadados['total_pieces']
+                    self.BLOCKS_TOTAL = total
+                    gerar_log(f"[Peer {self.peer_id}] Leu total de blocos de {self.nome}: {total} de {self.piece_size} bytes")
+                    return True
+            except Exception as e:
+                gerar_log(f"[Peer {self.peer_id}] Erro ao ler/definir total de blocos: {e}")
+                attempts += 1
+                time.sleep(retry_delay)
+        gerar_log(f"[Peer {self.peer_id}] Falhou ao definir total de blocos após {max_retries} tentativas.")
+        return False
+
+    def load_blocks(self):
+        """
+        Carrega blocos existentes no diretório local do peer.
+        Com um arquivo de resume válido, as peças registradas nele (com mtime e hash
+        inalterados) são aceitas direto; só as demais presentes no disco ficam como suspeitas
+        para verify_local_blocks. Sem resume, todas as peças locais são suspeitas.
+        Um peer pode começar sem nenhum bloco: com super-seeding o seed distribui as
+        primeiras peças, sem precisar da cópia prévia do dist_block.
+        """
+        resume = None if self.seed else load_resume(self.bloco_dir, self.info_hash, self.BLOCKS_TOTAL)
+        blocos = self.store.existing_blocks()
+        if self.seed:
+            confiaveis = blocos
+        elif resume is not None:
+            confiaveis = resume.trusted(self.piece_hashes, self.store) & blocos
+        else:
+            confiaveis = set()
+        self.suspect_blocks = blocos - confiaveis
+        with self.lock:
+            self.blocks = Bitfield(self.BLOCKS_TOTAL)
+            self.rarity = RarityIndex(self.BLOCKS_TOTAL)
+            for b in blocos:
+                self.blocks.add(b)
+                self.rarity.mark_owned(b)
+        origem = 'do resume' if resume is not None else 'locais'
+        gerar_log(f"[Peer {self.peer_id}] Carregou {len(self.blocks)} blocos {origem} de {self.nome} "
+                  f"({len(self.suspect_blocks)} a verificar).")
+        return True
+
+    def verify_local_blocks(self, blocos):
+        """
+        Confere os blocos informados contra o manifesto, em paralelo no pool de hash.
+        Blocos corrompidos são descartados e serão baixados de novo.
+        """
+        blocos = sorted(blocos)
+        hashes = self.hash_pool.map(lambda b: hash_piece(self.store.read_block(b)), blocos)
+        invalidos = [b for b, h in zip(blocos, hashes) if h != self.piece_hashes[b]]
+        if invalidos:
+            gerar_log(f"[Peer {self.peer_id}] Blocos locais com hash inválido descartados: {invalidos}")
+            with self.lock:
+                for b in invalidos:
+                    self.blocks.discard(b)
+                    self.rarity.mark_missing(b)
+
+    def save_resume(self):
+        """
+        Grava o arquivo de resume se algum bloco chegou desde a última gravação.
+        A cópia do bitfield é feita sob o lock do swarm; a escrita em disco, só sob resume_lock,
+        então duas gravações nunca se cruzam e uma versão antiga não sobrescreve uma nova.
+        """
+        with self.resume_lock:
+            with self.lock:
+                versao = len(self.have_log)
+                if versao == self.resume_version:
+                    return
+                blocks = self.blocks.copy()
+            save_resume(self.bloco_dir, self.info_hash, blocks, self.piece_hashes, self.store)
+            self.resume_version = versao
+
+    def block_length(self, index):
+        """
+        Tamanho em bytes do bloco (peça) de índice index; só o último pode ser menor.
+        """
+        if index == self.BLOCKS_TOTAL - 1:
+            return self.total_size - index * self.piece_size
+        return self.piece_size
+
+    def chunks_per_block(self):
+        return max(1, (self.piece_size + self.chunk_size - 1) // self.chunk_size)
+
+    def chunk_requests(self, block):
+        """
+        Comandos 'REQUEST info_hash block_N offset tamanho' que cobrem o bloco em
+        sub-requisições de chunk_size bytes.
+        """
+        tamanho = self.block_length(block)
+        return [f'REQUEST {self.info_hash} {block_name(block)} {offset} {min(self.chunk_size, tamanho - offset)}'
+                for offset in range(0, tamanho, self.chunk_size)]
+
+    def assemble_block(self, block, respostas):
+        """
+        Junta as respostas dos chunks de um bloco, na ordem dos pedidos, e retorna (resposta, dados).
+        A resposta só é 'DATA' se todos os chunks chegaram completos.
+        """
+        for resposta, _ in respostas:
+            if resposta != 'DATA':
+                return resposta, b''
+        data = b''.join(dados for _, dados in respostas)
+        if len(data) != self.block_length(block):
+            return 'INCOMPLETE', b''
+        return 'DATA', data
+
+    def piece_hasher(self, block):
+        """
+        Cria o hash incremental de um bloco, alimentado chunk a chunk durante o download.
+        """
+        return PieceHasher(len(self.chunk_requests(block)), self.hash_pool)
+
+    def verify_block(self, block, data, digest=None):
+        """
+        Confere o bloco contra o manifesto. Sem digest (hash calculado durante o download),
+        o hash do bloco inteiro é calculado no pool de hash.
+        """
+        if digest is None:
+            digest = self.hash_pool.submit(hash_piece, data).result()
+        return digest == self.piece_hashes[block]
+
+    def save_block(self, block, data):
+        """
+        Salva bloco recebido no armazenamento local, o registra no log de HAVEs e avisa
+        os peers inscritos com 'HAVE info_hash bloco versão'.
+        """
+        self.store.write_block(block, data)
+        assinantes = ()
+        with self.lock:
+            if block not in self.blocks:
+                self.blocks.add(block)
+                self.rarity.mark_owned(block)
+                self.have_log.append(block)
+                versao = len(self.have_log)
+                assinantes = list(self.assinantes)
+        gerar_log("[Peer %s] Salvou bloco %s de %s", self.peer_id, block, self.nome, nivel=DEBUG)
+        for link in assinantes:
+            link.push(f'HAVE {self.info_hash} {block} {versao}')
+
+    def reconstruct_file(self):
+        """
+        Reconstrói arquivo original a partir dos blocos recebidos.
+        """
+        with self.lock:
+            total_blocks = len(self.blocks)
+            blocks_total = self.BLOCKS_TOTAL
+        if total_blocks == blocks_total:
+            caminho = self.store.finalize()
+            self.save_resume()
+            gerar_log(f"[Peer {self.peer_id}] Arquivo reconstruído com sucesso em {caminho}.")
+            with self.lock:
+                reconstruir = self.files is not None and not self.pasta_reconstruida
+                self.pasta_reconstruida = True
+            if reconstruir:
+                reconstruir_pasta(caminho, self.files, self.pasta_saida)
+
+    def announce_request(self):
+        """
+        Monta o ANNOUNCE: o bitfield completo no primeiro anúncio (FULL) e, depois, só os
+        blocos obtidos desde o último anúncio aceito (DELTA). Retorna (comando, corpo, versão).
+        """
+        with self.lock:
+            versao = len(self.have_log)
+            if self.announced_version is None:
+                return (f'ANNOUNCE {self.info_hash} {self.port} {self.BLOCKS_TOTAL} FULL',
+                        self.blocks.to_bytes(), versao)
+            novos = self.have_log[self.announced_version:]
+        return f'ANNOUNCE {self.info_hash} {self.port} {self.BLOCKS_TOTAL} DELTA', encode_indices(novos), versao
+
+    def handle_announce_response(self, resposta, data, versao):
+        """
+        Trata a resposta do tracker a um ANNOUNCE. Retorna True se o anúncio foi aceito.
+        RESYNC (o tracker não conhece este peer, por exemplo após reiniciar) faz o próximo
+        anúncio mandar o bitfield completo.
+        """
+        ANNOUNCES.labels(resposta if resposta in ('PEERS', 'RESYNC') else 'recusado').inc()
+        if resposta == 'RESYNC':
+            gerar_log(f"[Peer {self.peer_id}] Tracker pediu o bitfield completo de {self.nome}")
+            self.announced_version = None
+            return False
+        if resposta != 'PEERS':
+            gerar_log(f"[Peer {self.peer_id}] Tracker recusou o anúncio de {self.nome}: {resposta}")
+            return False
+        self.announced_version = versao
+        self.last_announce = time.monotonic()
+        self.apply_tracker_response(data)
+        return True
+
+    def announce_due(self):
+        """
+        Indica se já passou o min_interval pedido pelo tracker desde o último anúncio. Com peers
+        suficientes (vindos também do PEX), o tracker só é procurado a cada PEX_ANNOUNCE_INTERVAL,
+        mas sempre antes do ttl do tracker, para este peer continuar nas listas de peers dele.
+        """
+        agora = time.monotonic()
+        if agora < self.next_announce:
+            return False
+        with self.lock:
+            conhecidos = len(self.known_peers)
+        intervalo = PEX_ANNOUNCE_INTERVAL
+        if self.tracker_ttl:
+            intervalo = min(intervalo, self.tracker_ttl * PEX_ANNOUNCE_TTL_FRACTION)
+        return conhecidos < PEX_TARGET or agora >= self.last_announce + intervalo
+
+    def announce_to_tracker(self, max_retries=10, retry_delay=3):
+        """
+        Anuncia os blocos ao tracker e recebe a lista de peers em uma única requisição.
+        """
+        retries = 0
+        while retries < max_retries:
+            try:
+                comando, corpo, versao = self.announce_request()
+                resposta, data = self.peer.tracker_call(comando, corpo)
+                if self.handle_announce_response(resposta, data, versao):
+                    return True
+                if self.announced_version is not None:
+                    return False
+                comando, corpo, versao = self.announce_request()
+                return self.handle_announce_response(*self.peer.tracker_call(comando, corpo), versao)
+            except Exception as e:
+                ANNOUNCES.labels('falha').inc()
+                gerar_log(f"[Peer {self.peer_id}] Falha ao conectar tracker: {e}. Tentando novamente ({retries+1}/{max_retries})")
+                retries += 1
+                time.sleep(retry_delay)
+        gerar_log(f"[Peer {self.peer_id}] Não conseguiu conectar ao tracker após {max_retries} tentativas.")
+        return False
+
+    async def announce_to_tracker_async(self, max_retries=10, retry_delay=3):
+        """
+        Versão asyncio de announce_to_tracker.
+        """
+        retries = 0
+        while retries < max_retries:
+            try:
+                comando, corpo, versao = self.announce_request()
+                resposta, data = await self.peer.tracker_call_async(comando, corpo)
+                if self.handle_announce_response(resposta, data, versao):
+                    return True
+                if self.announced_version is not None:
+                    return False
+                comando, corpo, versao = self.announce_request()
+                return self.handle_announce_response(*await self.peer.tracker_call_async(comando, corpo), versao)
+            except Exception as e:
+                ANNOUNCES.labels('falha').inc()
+                gerar_log(f"[Peer {self.peer_id}] Falha ao conectar tracker: {e}. Tentando novamente ({retries+1}/{max_retries})")
+                retries += 1
+                await asyncio.sleep(retry_delay)
+        gerar_log(f"[Peer {self.peer_id}] Não conseguiu conectar ao tracker após {max_retries} tentativas.")
+        return False
+
+    def apply_tracker_response(self, data):
+        """
+        Atualiza peers conhecidos, blocos sugeridos e o intervalo mínimo até o próximo anúncio
+        a partir da resposta do tracker. Os peers do tracker se somam aos já conhecidos (por
+        PEX ou anúncios anteriores); quem não responde sai em forget_peer.
+        """
+        info = json.loads(data.decode())
+        peers = info['peers']
+        suggested_blocks = info['suggested_blocks']
+        with self.lock:
+            self.known_peers.update(tuple(p) for p in peers if tuple(p)[1] != self.port)
+            peers_conhecidos = set(self.known_peers)
+            self.suggested_blocks = suggested_blocks
+        self.announce_interval = info.get('min_interval', self.announce_interval)
+        self.tracker_ttl = info.get('ttl', self.tracker_ttl)
+        self.next_announce = time.monotonic() + self.announce_interval
+        gerar_log("[Peer %s] Peers conhecidos em %s: %s", self.peer_id, self.nome, sorted(peers_conhecidos))
+        gerar_log("[Peer %s] Blocos sugeridos pelo tracker: %s", self.peer_id, suggested_blocks, nivel=DEBUG)
+
+    async def peer_request_async(self, peer, comando, corpo=b''):
+        return await self.peer.peer_request_async(peer, comando, corpo)
+
+    def availability_request(self, peer):
+        """
+        Comando para atualizar a disponibilidade de um peer: o bitfield completo na primeira
+        consulta (GET_BLOCKS) e, depois, só os blocos obtidos desde a última versão vista (GET_HAVES).
+        """
+        with self.lock:
+            versao = self.peer_versions.get(peer)
+        if versao is None:
+            return f'GET_BLOCKS {self.info_hash}'
+        return f'GET_HAVES {self.info_hash} {versao}'
+
+    def update_peer_blocks(self, peers=None):
+        """
+        Handshake de disponibilidade com os peers conhecidos (ou apenas com os peers informados):
+        pede o bitfield (ou o delta desde a última versão vista) pela conexão do pool, que
+        a partir daí recebe um HAVE a cada bloco novo do peer.
+        """
+        for peer in list(self.known_peers if peers is None else peers):
+            try:
+                conn = self.pool.get(peer)
+                resposta, corpo = conn.request(self.availability_request(peer))
+                self.set_peer_blocks(peer, resposta, corpo, conn)
+            except Exception as e:
+                self.pool.discard(peer)
+                self.forget_peer(peer, e)
+
+    async def update_peer_blocks_async(self, peers=None):
+        """
+        Versão asyncio de update_peer_blocks: consulta os peers em paralelo.
+        """
+        async def atualizar(peer):
+            try:
+                conn = await self.peer.async_pool.get(peer)
+                resposta, corpo = await conn.request(self.availability_request(peer))
+                self.set_peer_blocks(peer, resposta, corpo, conn)
+            except Exception as e:
+                self.peer.async_pool.discard(peer)
+                self.forget_peer(peer, e)
+
+        await asyncio.gather(*(atualizar(peer) for peer in list(self.known_peers if peers is None else peers)))
+
+    def new_peers(self):
+        """
+        Peers conhecidos sem handshake numa conexão aberta: nunca consultados ou cuja conexão
+        caiu (e com ela os HAVEs). Na reconexão basta o delta desde a última versão vista.
+        """
+        with self.lock:
+            return [p for p in self.known_peers if p not in self.inscritos or self.inscritos[p].closed]
+
+    def set_peer_blocks(self, peer, resposta, corpo, conn=None):
+        """
+        Aplica ao mapa de blocos a resposta de um peer: 'BLOCKS versão' com o bitfield completo
+        ou 'HAVES versão' com os índices dos blocos obtidos desde a versão pedida.
+        conn é a conexão em que a resposta chegou e por onde chegarão os próximos HAVEs.
+        """
+        tipo, versao = resposta.split()
+        versao = int(versao)
+        obtidos = []
+        with self.lock:
+            if tipo == 'BLOCKS':
+                if versao >= self.peer_versions.get(peer, -1):
+                    novo = Bitfield.from_bytes(self.BLOCKS_TOTAL, corpo)
+                    self.rarity.remove_all(self.peer_blocks_map.get(peer, ()))
+                    self.rarity.add_all(novo)
+                    self.peer_blocks_map[peer] = novo
+                    obtidos = list(novo)
+            elif tipo == 'HAVES' and peer in self.peer_blocks_map:
+                blocks = self.peer_blocks_map[peer]
+                for b in decode_indices(corpo):
+                    if b not in blocks:
+                        blocks.add(b)
+                        self.rarity.add(b)
+                        obtidos.append(b)
+            else:
+                raise ValueError(f"Resposta inesperada à consulta de blocos: {resposta}")
+            self.peer_versions[peer] = max(versao, self.peer_versions.get(peer, -1))
+            # Só a contagem vai para o log: o bitfield continua mudando depois de solto o lock
+            contagem = len(self.peer_blocks_map[peer])
+            if conn is not None:
+                self.inscritos[peer] = conn
+            self.vistos[peer] = time.monotonic()
+            envios = self.super_seed_seen(peer, obtidos)
+        self.push_offers(envios)
+        gerar_log("[Peer %s] Atualizou blocos do peer %s em %s: %d/%d blocos (%s, %d bytes)",
+                  self.peer_id, peer, self.nome, contagem, self.BLOCKS_TOTAL, tipo, len(corpo), nivel=DEBUG)
+        self.scheduler.wake()
+
+    def apply_have(self, peer, block, versao):
+        """
+        Aplica um 'HAVE' empurrado pelo peer: marca o bloco no mapa e, se ele nos falta,
+        acorda o scheduler para pedi-lo sem esperar a próxima volta. A versão só avança
+        sem lacunas, para que um GET_HAVES depois de uma reconexão não perca nenhum bloco.
+        """
+        with self.lock:
+            blocks = self.peer_blocks_map.get(peer)
+            if blocks is None:
+                return  # HAVE de uma conexão anterior ao handshake; o bitfield já o inclui
+            novo = block not in blocks
+            if novo:
+                blocks.add(block)
+                self.rarity.add(block)
+            if versao == self.peer_versions.get(peer, -1) + 1:
+                self.peer_versions[peer] = versao
+            self.vistos[peer] = time.monotonic()
+            falta = novo and block not in self.blocks
+            envios = self.super_seed_seen(peer, [block]) if novo else []
+        self.push_offers(envios)
+        if not novo:
+            return
+        gerar_log("[Peer %s] Peer %s anunciou block_%s em %s", self.peer_id, peer, block, self.nome, nivel=DEBUG)
+        if falta:
+            self.scheduler.wake()
+
+    def subscribe(self, link):
+        # Chamado com self.lock adquirido. Quem pede nosso bitfield também passa a ser consultado:
+        # um peer que chegou antes conhece assim os que chegaram depois dele
+        if link is not None and not link.closed:
+            self.assinantes.add(link)
+            if link.remoto is not None and len(self.known_peers) < MAX_KNOWN_PEERS:
+                self.known_peers.add(link.remoto)
+
+    def unsubscribe(self, link):
+        with self.lock:
+            self.assinantes.discard(link)
+
+    def learn_peers(self, peers, visto=None, origem='PEX'):
+        """
+        Acrescenta aos peers conhecidos os endereços recebidos por PEX ou pela DHT (até
+        MAX_KNOWN_PEERS) e registra o contato direto com visto, o peer que mandou a mensagem.
+        Os novos passam pelo handshake na próxima volta de run.
+        """
+        with self.lock:
+            if visto is not None:
+                self.known_peers.add(visto)
+                self.vistos[visto] = time.monotonic()
+            vagas = MAX_KNOWN_PEERS - len(self.known_peers)
+            novos = [p for p in dict.fromkeys(peers) if p[1] != self.port and p not in self.known_peers][:max(vagas, 0)]
+            self.known_peers.update(novos)
+        if novos:
+            (PEX_LEARNED if origem == 'PEX' else DHT_LEARNED).inc(len(novos))
+            gerar_log("[Peer %s] %s em %s: %d peers novos %s", self.peer_id, origem, self.nome, len(novos), novos,
+                      nivel=DEBUG)
+        return novos
+
+    def pex_peers(self, excluir=None):
+        """
+        Endereços repassados por PEX: os peers conhecidos com contato direto nos últimos
+        PEX_TTL segundos, do mais recente para o mais antigo, sem o destinatário.
+        """
+        limite = time.monotonic() - PEX_TTL
+        with self.lock:
+            recentes = sorted(((t, p) for p, t in self.vistos.items()
+                               if t >= limite and p != excluir and p in self.known_peers), reverse=True)
+        return [p for _, p in recentes[:PEX_MAX]]
+
+    def pex_targets(self):
+        """
+        Se já é hora de uma rodada de PEX, sorteia até PEX_FANOUT peers com handshake numa
+        conexão aberta e retorna [(peer, conexão)]; caso contrário, lista vazia.
+        """
+        agora = time.monotonic()
+        if agora < self.next_pex:
+            return []
+        with self.lock:
+            abertos = [(p, c) for p, c in self.inscritos.items() if not c.closed]
+        if abertos:
+            self.next_pex = agora + PEX_INTERVAL
+        return random.sample(abertos, min(PEX_FANOUT, len(abertos)))
+
+    def pex_request(self, peer):
+        return f'PEX {self.info_hash}', encode_peers(self.pex_peers(excluir=peer))
+
+    def handle_pex_response(self, peer, resposta, corpo):
+        if resposta != 'PEERS':
+            raise ValueError(f"Resposta inesperada ao PEX: {resposta}")
+        self.learn_peers(decode_peers(corpo))
+
+    def exchange_peers(self):
+        """
+        Rodada de PEX: manda a alguns peers os endereços vistos recentemente e aprende os deles,
+        pela mesma conexão persistente. Chamada periodicamente pelo unchoke loop.
+        """
+        for peer, conn in self.pex_targets():
+            try:
+                resposta, corpo = conn.request(*self.pex_request(peer))
+                self.handle_pex_response(peer, resposta, corpo)
+            except Exception as e:
+                gerar_log("[Peer %s] Erro no PEX com %s: %s", self.peer_id, peer, e, nivel=WARNING)
+
+    async def exchange_peers_async(self):
+        """
+        Versão asyncio de exchange_peers: consulta os peers em paralelo.
+        """
+        async def trocar(peer, conn):
+            try:
+                resposta, corpo = await conn.request(*self.pex_request(peer))
+                self.handle_pex_response(peer, resposta, corpo)
+            except Exception as e:
+                gerar_log("[Peer %s] Erro no PEX com %s: %s", self.peer_id, peer, e, nivel=WARNING)
+
+        await asyncio.gather(*(trocar(peer, conn) for peer, conn in self.pex_targets()))
+
+    def forget_peer(self, peer, erro):
+        """
+        Remove um peer que não respondeu das estruturas locais.
+        """
+        gerar_log("[Peer %s] Erro ao atualizar blocos do peer %s: %s", self.peer_id, peer, erro, nivel=WARNING)
+        with self.lock:
+            if peer in self.peer_blocks_map:
+                self.rarity.remove_all(self.peer_blocks_map.pop(peer))
+            self.peer_versions.pop(peer, None)
+            self.inscritos.pop(peer, None)
+            self.vistos.pop(peer, None)
+            if self.superseed is not None:
+                self.superseed.forget(peer)
+            if peer in self.known_peers:
+                self.known_peers.remove(peer)
+
+    def calculate_rarest_blocks(self, prioridade=()):
+        """
+        Retorna os blocos que faltam, do mais raro para o mais comum na rede, com os blocos
+        de prioridade na frente. Sai direto dos buckets do índice de raridade, sem recontar
+        nem ordenar a lista toda.
+        """
+        with self.lock:
+            return self.rarity.rarest(prioridade=prioridade)
+
+    def select_peers_for_unchoke(self):
+        """
+        Rodada do tit-for-tat: desbloqueia os peers que mais nos enviaram dados na janela
+        (ou, com o arquivo completo, os que mais rápido baixam de nós) e gira o slot otimista.
+        """
+        with self.lock:
+            known = set(self.known_peers)
+        seeding = self.is_complete()
+        fixos, otimista = self.choker.recalculate(known, seeding=seeding)
+        modo = 'seeding' if seeding else 'downloading'
+        gerar_log(f"[Peer {self.peer_id}] Peers desbloqueados em {self.nome} ({modo}): {fixos}")
+        gerar_log(f"[Peer {self.peer_id}] Peer otimista desbloqueado em {self.nome}: {otimista}")
+        gerar_log("[Peer %s] Taxas (upload, download) em %s: %s", self.peer_id, self.nome, self.choker.rates(), nivel=DEBUG)
+
+    def available_peers(self):
+        """
+        Peers a quem vale pedir blocos: os que anunciaram blocos e não nos bloquearam recentemente.
+        Chamado com self.lock adquirido.
+        """
+        agora = time.monotonic()
+        return [p for p in self.peer_blocks_map if self.choked_by.get(p, 0) <= agora]
+
+    def handle_block_response(self, peer, block, resposta, data, digest=None):
+        """
+        Salva o bloco recebido em resposta a um REQUEST se o hash bater com o manifesto.
+        Retorna True se o bloco foi salvo; caso contrário ele continua faltando e será pedido de novo.
+        """
+        if resposta == 'CHOKED':
+            with self.lock:
+                self.choked_by[peer] = time.monotonic() + CHOKE_BACKOFF
+            gerar_log("[Peer %s] Peer %s nos bloqueou em %s; pausa de %ss", self.peer_id, peer, self.nome, CHOKE_BACKOFF)
+            return False
+        if resposta != 'DATA':
+            gerar_log("[Peer %s] Peer %s respondeu %s para bloco %s", self.peer_id, peer, resposta, block, nivel=DEBUG)
+            return False
+        BYTES_IN.inc(len(data))
+        if data and not self.verify_block(block, data, digest):
+            gerar_log("[Peer %s] Bloco %s do peer %s falhou na verificação de hash, descartado",
+                      self.peer_id, block, peer, nivel=WARNING)
+            return False
+        if data:
+            self.choker.record_download(peer, len(data))
+            self.save_block(block, data)
+            gerar_log("[Peer %s] Baixou block_%s do peer %s", self.peer_id, block, peer)
+            self.reconstruct_file()
+            return True
+        gerar_log("[Peer %s] Dados recebidos vazios para bloco %s do peer %s", self.peer_id, block, peer, nivel=WARNING)
+        return False
+
+    def dht_due(self):
+        return self.peer.dht is not None and time.monotonic() >= self.next_dht
+
+    def discover_dht(self):
+        """
+        Anuncia o swarm na DHT do peer e acrescenta aos conhecidos os peers já anunciados lá
+        (a mesma busca serve para as duas coisas). Sem peers conhecidos, tenta de novo em
+        DHT_RETRY segundos em vez de DHT_ANNOUNCE_INTERVAL.
+        """
+        dht = self.peer.dht
+        if not len(dht.tabela):
+            dht.bootstrap(self.peer.dht_bootstrap)
+        peers = [p for p in dht.announce(self.info_hash, self.port) if p[1] != self.port]
+        self.learn_peers(peers, origem='DHT')
+        with self.lock:
+            conhecidos = len(self.known_peers)
+        self.next_dht = time.monotonic() + (DHT_ANNOUNCE_INTERVAL if conhecidos else DHT_RETRY)
+        gerar_log("[Peer %s] DHT em %s: %d peers anunciados, %d conhecidos", self.peer_id, self.nome, len(peers),
+                  conhecidos, nivel=DEBUG)
+
+    def super_seed_blocks(self, link, versao=None):
+        """
+        Handshake de disponibilidade no super-seeding: 'BLOCKS' com o bitfield das peças oferecidas
+        a quem pediu (a primeira é escolhida no primeiro contato) ou, numa reconexão, 'HAVES' com
+        as oferecidas desde a versão pedida. Conexões sem HELLO não recebem ofertas.
+        Chamado com self.lock adquirido.
+        """
+        remoto = link.remoto if link is not None else None
+        if remoto is None:
+            return 'BLOCKS 0', Bitfield(self.BLOCKS_TOTAL).to_bytes()
+        ofertas = self.superseed.offered(remoto, self.peer_blocks_map.get(remoto, ()), self.rarity.count)
+        if versao is not None and versao <= len(ofertas):
+            return f'HAVES {len(ofertas)}', encode_indices(ofertas[versao:])
+        oferecidas = Bitfield(self.BLOCKS_TOTAL)
+        for b in ofertas:
+            oferecidas.add(b)
+        return f'BLOCKS {len(ofertas)}', oferecidas.to_bytes()
+
+    def super_seed_seen(self, peer, blocks):
+        """
+        Repassa ao super-seeding os blocos que o peer anunciou e retorna os HAVEs das novas
+        ofertas, a enviar com push_offers depois de soltar o lock. Chamado com self.lock adquirido.
+        """
+        if self.superseed is None:
+            return []
+        novas = []
+        for b in blocks:
+            novas += self.superseed.seen(peer, b, self.peer_blocks_map, self.rarity.count)
+        return self.offer_pushes(novas)
+
+    def offer_pushes(self, novas):
+        """
+        HAVEs [(conexão, comando)] que anunciam as novas ofertas [(peer, [(bloco, versão)])] pelas
+        conexões em que cada peer pediu o nosso bitfield. Chamado com self.lock adquirido.
+        """
+        envios = []
+        for peer, pecas in novas:
+            links = [link for link in self.assinantes if link.remoto == peer]
+            SUPERSEED_OFFERS.inc(len(pecas))
+            gerar_log("[Peer %s] Super-seeding de %s: %s oferecido(s) a %s", self.peer_id, self.nome,
+                      [block_name(b) for b, _ in pecas[:8]], peer, nivel=DEBUG)
+            for block, versao in pecas:
+                envios += [(link, f'HAVE {self.info_hash} {block} {versao}') for link in links]
+        return envios
+
+    def push_offers(self, envios):
+        for link, comando in envios:
+            link.push(comando)
+
+    def check_super_seed(self):
+        """
+        Rodada periódica do super-seeding no seed: libera quem esperou demais pela sua peça se
+        espalhar e oferece peças a quem tinha ficado sem.
+        """
+        with self.lock:
+            if self.superseed is None:
+                return
+            envios = self.offer_pushes(self.superseed.expire(self.peer_blocks_map, self.rarity.count))
+        self.push_offers(envios)
+
+    def handle_message(self, partes, corpo=b'', link=None):
+        """
+        Responde o handshake de disponibilidade (GET_BLOCKS, ou GET_HAVES numa reconexão) deste
+        swarm e inscreve link, a conexão de quem pediu, nos HAVEs dos próximos blocos. A
+        inscrição e a resposta saem do mesmo estado, sob o lock: nenhum bloco fica de fora.
+        No super-seeding, a resposta traz só as peças oferecidas a quem pediu (super_seed_blocks).
+        Um PEX traz os peers vistos por quem pediu e é respondido com os nossos.
+        partes é a linha de comando já dividida, com o info-hash em partes[1].
+        """
+        comando = partes[0]
+        if comando == 'GET_BLOCKS':
+            with self.lock:
+                self.subscribe(link)
+                if self.superseed is not None:
+                    return self.super_seed_blocks(link)
+                return f'BLOCKS {len(self.have_log)}', self.blocks.to_bytes()
+        elif comando == 'GET_HAVES':
+            versao = int(partes[2])
+            with self.lock:
+                self.subscribe(link)
+                if self.superseed is not None:
+                    return self.super_seed_blocks(link, versao)
+                if versao > len(self.have_log):
+                    # Versão de uma execução anterior deste peer: manda o bitfield completo
+                    return f'BLOCKS {len(self.have_log)}', self.blocks.to_bytes()
+                return f'HAVES {len(self.have_log)}', encode_indices(self.have_log[versao:])
+        elif comando == 'PEX':
+            remoto = link.remoto if link is not None else None
+            self.learn_peers(decode_peers(corpo), visto=remoto)
+            return 'PEERS', encode_peers(self.pex_peers(excluir=remoto))
+        gerar_log("[Peer %s] Comando desconhecido: %s", self.peer_id, partes, nivel=WARNING)
+        return 'UNKNOWN_COMMAND', b''
+
+    def requested_chunk(self, partes, remoto=None, codecs=()):
+        """
+        Interpreta um 'REQUEST info_hash bloco [offset tamanho]' já dividido e retorna
+        (resposta, fonte, inicio, tamanho). Se a resposta não for 'DATA' nem 'ZDATA', não há fonte
+        a enviar. A fonte é uma memoryview do trecho pedido, tirada da peça no cache do peer
+        (PieceCache), ou, com o cache desligado ou menor que a peça, o arquivo aberto para enviar
+        com sendfile. Se o swarm comprime e o peer aceita o codec (codecs, do HELLO), o trecho
+        vai comprimido como 'ZDATA codec tamanho_original' (compressed_chunk).
+        Sem offset/tamanho, envia o bloco inteiro. Peers bloqueados pelo choker recebem 'CHOKED';
+        no super-seeding as ofertas já racionam o upload do seed e o choker não se aplica.
+        O lock só protege a consulta ao conjunto de blocos, não a leitura nem o envio.
+        """
+        liberado = self.choker.allows(remoto) if self.superseed is None else remoto is not None
+        if not liberado:
+            gerar_log("[Peer %s] REQUEST de %s recusado em %s: peer bloqueado", self.peer_id, remoto, self.nome, nivel=DEBUG)
+            return 'CHOKED', None, 0, 0
+        block = block_index(partes[2])
+        with self.lock:
+            disponivel = block in self.blocks
+        if not disponivel:
+            gerar_log("[Peer %s] Bloco %s solicitado não disponível", self.peer_id, block, nivel=DEBUG)
+            return 'NOT_AVAILABLE', None, 0, 0
+        tamanho_bloco = self.block_length(block)
+        offset = int(partes[3]) if len(partes) > 3 else 0
+        tamanho = int(partes[4]) if len(partes) > 4 else tamanho_bloco - offset
+        if offset < 0 or tamanho < 0 or offset + tamanho > tamanho_bloco:
+            gerar_log("[Peer %s] Intervalo inválido pedido para %s: %d+%d", self.peer_id, block, offset, tamanho, nivel=WARNING)
+            return 'BAD_RANGE', None, 0, 0
+        gerar_log("[Peer %s] Enviando bloco %s de %s (%d+%d) para %s", self.peer_id, block, self.nome, offset, tamanho,
+                  remoto, nivel=DEBUG)
+        if self.codec is not None and self.codec.nome in codecs:
+            comprimido = self.compressed_chunk(block, offset, tamanho)
+            if comprimido is not None:
+                return f'ZDATA {self.codec.nome} {tamanho}', memoryview(comprimido), 0, len(comprimido)
+        cache = self.peer.piece_cache
+        if cache.fits(tamanho_bloco):
+            peca = cache.get_or_load((self.info_hash, block), lambda: self.store.read_block(block))
+            return 'DATA', memoryview(peca)[offset:offset + tamanho], 0, tamanho
+        fonte, base, _ = self.store.block_span(block)
+        return 'DATA', fonte, base + offset, tamanho
+
+    def chunk_cached(self, partes, codecs=()):
+        """
+        Indica se o REQUEST pode ser respondido sem ler a peça do disco nem comprimir: a forma
+        pedida do trecho já está no cache, ou a peça não cabe nele e sai por sendfile. Pedidos
+        malformados também contam, pois são recusados sem tocar no disco.
+        """
+        try:
+            block = block_index(partes[2])
+            offset = int(partes[3]) if len(partes) > 3 else 0
+            tamanho = int(partes[4]) if len(partes) > 4 else self.block_length(block) - offset
+        except (IndexError, ValueError):
+            return True
+        cache = self.peer.piece_cache
+        if self.codec is not None and self.codec.nome in codecs:
+            chave = (self.info_hash, block, offset, tamanho, self.codec.nome)
+            with self.lock:
+                incompressivel = chave in self.incompressiveis
+            if not incompressivel:
+                return chave in cache
+        return not cache.fits(self.block_length(block)) or (self.info_hash, block) in cache
+
+    def compressed_chunk(self, block, offset, tamanho):
+        """
+        Trecho comprimido com o codec do swarm, ou None se ele não diminui ao comprimir.
+        As formas comprimidas ficam no cache de peças do peer (chave com offset, tamanho e
+        codec), então os trechos mais pedidos são comprimidos uma vez só; os que não diminuem
+        são lembrados e vão sempre sem compressão.
+        """
+        codec = self.codec
+        chave = (self.info_hash, block, offset, tamanho, codec.nome)
+        with self.lock:
+            incompressivel = chave in self.incompressiveis
+        if incompressivel:
+            COMPRESSED_CHUNKS.labels(self.nome, 'incompressivel').inc()
+            return None
+        comprimido = self.peer.piece_cache.get_or_load(chave, lambda: self.compress_chunk(block, offset, tamanho))
+        if len(comprimido) >= tamanho:
+            self.peer.piece_cache.discard(chave)
+            with self.lock:
+                self.incompressiveis.add(chave)
+            with self.compressao_lock:
+                self.compressao['incompressiveis'] += 1
+            COMPRESSED_CHUNKS.labels(self.nome, 'incompressivel').inc()
+            return None
+        with self.compressao_lock:
+            self.compressao['trechos'] += 1
+            self.compressao['bytes_originais'] += tamanho
+            self.compressao['bytes_enviados'] += len(comprimido)
+        COMPRESSED_CHUNKS.labels(self.nome, 'comprimido').inc()
+        COMPRESSION_SAVED.labels(self.nome).inc(tamanho - len(comprimido))
+        return comprimido
+
+    def compress_chunk(self, block, offset, tamanho):
+        """
+        Lê o trecho (da peça no cache, se couber, ou do armazenamento) e o comprime,
+        contando o tempo de CPU gasto.
+        """
+        cache = self.peer.piece_cache
+        if cache.fits(self.block_length(block)):
+            peca = cache.get_or_load((self.info_hash, block), lambda: self.store.read_block(block))
+            dados = memoryview(peca)[offset:offset + tamanho]
+        else:
+            arquivo, base, _ = self.store.block_span(block)
+            with arquivo:
+                dados = os.pread(arquivo.fileno(), tamanho, base + offset)
+        inicio = time.thread_time()
+        comprimido = self.codec.compress(dados)
+        self.count_codec_cpu('compressao', time.thread_time() - inicio)
+        return comprimido
+
+    def decode_chunk(self, resposta, corpo):
+        """
+        Converte a resposta 'ZDATA codec tamanho' de um REQUEST em ('DATA', trecho descomprimido);
+        as demais respostas passam sem mudança. Um corpo que não descomprime no tamanho
+        anunciado levanta ValueError, tratado como erro da conexão.
+        """
+        if not resposta.startswith('ZDATA'):
+            return resposta, corpo
+        _, nome, tamanho = resposta.split()
+        codec = CODECS.get(nome)
+        if codec is None:
+            raise ValueError(f"Codec desconhecido na resposta: {resposta}")
+        inicio = time.thread_time()
+        dados = codec.decompress(corpo, int(tamanho))
+        self.count_codec_cpu('descompressao', time.thread_time() - inicio, 'recebidos')
+        return 'DATA', dados
+
+    def count_codec_cpu(self, operacao, segundos, contador=None):
+        with self.compressao_lock:
+            self.compressao[f'cpu_{operacao}'] += segundos
+            if contador is not None:
+                self.compressao[contador] += 1
+        COMPRESSION_SECONDS.labels(self.nome, operacao).inc(segundos)
+
+    def compression_stats(self):
+        """
+        Resumo da compressão neste swarm: trechos enviados comprimidos e incompressíveis, bytes
+        originais e enviados desses trechos, economia (fração de bytes poupados), trechos
+        comprimidos recebidos e CPU gasta (ms).
+        """
+        with self.compressao_lock:
+            stats = dict(self.compressao)
+        stats['economia'] = round(1 - stats['bytes_enviados'] / stats['bytes_originais'], 3) if stats['bytes_originais'] else 0.0
+        stats['cpu_compressao'] = round(stats['cpu_compressao'] * 1000, 1)
+        stats['cpu_descompressao'] = round(stats['cpu_descompressao'] * 1000, 1)
+        return stats
+
+    def log_compression(self):
+        """
+        Registra o resumo da compressão, se o swarm comprime ou recebeu trechos comprimidos.
+        """
+        stats = self.compression_stats()
+        if self.codec is not None or stats['recebidos']:
+            gerar_log(f"[Peer {self.peer_id}] Compressão em {self.nome}: {stats}")
+
+    def prepare(self):
+        """
+        Divide os arquivos (seed), define o total de blocos e carrega os blocos locais.
+        """
+        if not self.set_blocks_total_dynamic():
+            gerar_log(f"[Peer {self.peer_id}] Falha ao definir total de blocos de {self.label()}.")
+            return False
+        if self.bloco_dir is None:
+            self.bloco_dir = f'blocos_peer_{self.peer_id}_{self.nome}'
+        if self.arquivo_saida is None:
+            self.arquivo_saida = f'reconstruido_peer_{self.peer_id}_{self.nome}'
+        self.pasta_saida = os.path.splitext(self.arquivo_saida)[0] + '_arquivos'
+        self.store = open_store(self.peer.storage, self.bloco_dir, self.arquivo_saida, self.BLOCKS_TOTAL,
+                                self.piece_size)
+        if self.seed:
+            self.piece_hashes = dividir_pasta_em_blocos(self.origem, self.bloco_dir, tamanho_bloco=self.piece_size,
+                                                        store=self.store, tabela=self.files)
+            metadados = {
+                'name': self.nome,
+                'piece_size': self.piece_size,
+                'chunk_size': self.chunk_size,
+                'total_pieces': self.BLOCKS_TOTAL,
+                'total_size': self.total_size,
+                'hash_algorithm': ALGORITMO_HASH,
+                'piece_hashes': self.piece_hashes,
+                'files': self.files,
+            }
+            self.info_hash = info_hash(metadados)
+            # Os metadados só são publicados depois que o seed tem todos os blocos
+            salvar_metadados(self.bloco_dir, dict(metadados, info_hash=self.info_hash))
+            gerar_log(f"[Peer {self.peer_id}] Salvou total de blocos de {self.nome}: {self.BLOCKS_TOTAL} (info-hash {self.info_hash})")
+        if not self.load_blocks():
+            gerar_log(f"[Peer {self.peer_id}] Erro ao carregar blocos locais de {self.nome}.")
+            return False
+        if self.suspect_blocks:
+            self.verify_local_blocks(self.suspect_blocks)
+        self.save_resume()
+        if self.seed and self.peer.super_seed:
+            self.superseed = SuperSeeder(self.BLOCKS_TOTAL)
+            gerar_log(f"[Peer {self.peer_id}] Super-seeding de {self.nome}: uma peça por vez para cada downloader")
+        self.codec = self.peer.swarm_codec(self.nome)
+        if self.codec is not None:
+            gerar_log(f"[Peer {self.peer_id}] Compressão {self.codec.nome} ligada em {self.nome}")
+        return True
+
+    def block_count(self):
+        """
+        Quantidade de blocos que o peer tem, incluindo os carregados do disco ao iniciar.
+        """
+        with self.lock:
+            return len(self.blocks)
+
+    def is_complete(self):
+        """
+        Indica se o peer já possui todos os blocos.
+        """
+        with self.lock:
+            return len(self.blocks) == self.BLOCKS_TOTAL
+
+    def is_done(self):
+        """
+        Indica se o swarm pode encerrar (arquivo completo e o peer não é seu seed).
+        """
+        if self.is_complete():
+            if not self.seed:
+                gerar_log(f"[Peer {self.peer_id}] Arquivo {self.nome} completo! Encerrando...")
+                return True
+            # Com super-seeding o loop do seed gira a cada SUPERSEED_ROUND: o aviso sai só em nível DEBUG
+            gerar_log(f"[Peer {self.peer_id}] Arquivo {self.nome} completo, permanecendo online para servir os blocos.",
+                      nivel=DEBUG if self.superseed is not None else INFO)
+        return False
+
+    def close(self):
+        """
+        Fecha o armazenamento do swarm quando o peer encerra.
+        """
+        if self.store is not None:
+            self.store.close()
+
+    def idle_wait(self, segundos):
+        """
+        Pausa do loop quando não há o que baixar. Com super-seeding o seed gira a cada
+        SUPERSEED_ROUND, para consultar logo quem acabou de chegar.
+        """
+        return SUPERSEED_ROUND if self.superseed is not None else segundos
+
+    def run(self):
+        """
+        Loop principal do swarm: anuncia ao tracker e à DHT quando devido, consulta os peers novos e
+        roda o scheduler até o arquivo ficar completo (ou para sempre, no seed).
+        """
+        while True:
+            if self.is_done():
+                break
+
+            if self.dht_due():
+                try:
+                    self.discover_dht()
+                except Exception as e:
+                    self.next_dht = time.monotonic() + DHT_RETRY
+                    gerar_log("[Peer %s] Erro na busca da DHT em %s: %s", self.peer_id, self.nome, e, nivel=WARNING)
+
+            if self.peer.use_tracker and self.announce_due() and not self.announce_to_tracker():
+                gerar_log(f"[Peer {self.peer_id}] Não conseguiu conectar tracker, tentando novamente...")
+                time.sleep(5)
+                continue
+
+            with self.lock:
+                peers_list = list(self.known_peers)
+
+            gerar_log("[Peer %s] Peers disponíveis em %s: %s", self.peer_id, self.nome, peers_list, nivel=DEBUG)
+            if not peers_list:
+                gerar_log(f"[Peer {self.peer_id}] Nenhum peer conhecido, aguardando...")
+                time.sleep(self.idle_wait(5))
+                continue
+
+            novos = self.new_peers()
+            if novos:
+                self.update_peer_blocks(novos)
+            if self.is_complete():
+                self.check_super_seed()
+                time.sleep(self.idle_wait(3))
+                continue
+            self.scheduler.run(DOWNLOAD_ROUND)
+
+    async def run_async(self):
+        """
+        Versão asyncio de run.
+        """
+        while True:
+            if self.is_done():
+                break
+
+            if self.dht_due():
+                try:
+                    await asyncio.to_thread(self.discover_dht)
+                except Exception as e:
+                    self.next_dht = time.monotonic() + DHT_RETRY
+                    gerar_log("[Peer %s] Erro na busca da DHT em %s: %s", self.peer_id, self.nome, e, nivel=WARNING)
+
+            if self.peer.use_tracker and self.announce_due() and not await self.announce_to_tracker_async():
+                gerar_log(f"[Peer {self.peer_id}] Não conseguiu conectar tracker, tentando novamente...")
+                await asyncio.sleep(5)
+                continue
+
+            with self.lock:
+                peers_list = list(self.known_peers)
+
+            gerar_log("[Peer %s] Peers disponíveis em %s: %s", self.peer_id, self.nome, peers_list, nivel=DEBUG)
+            if not peers_list:
+                gerar_log(f"[Peer {self.peer_id}] Nenhum peer conhecido, aguardando...")
+                await asyncio.sleep(self.idle_wait(5))
+                continue
+
+            novos = self.new_peers()
+            if novos:
+                await self.update_peer_blocks_async(novos)
+            if self.is_complete():
+                self.check_super_seed()
+                await asyncio.sleep(self.idle_wait(3))
+                continue
+            await self.scheduler.run_async(DOWNLOAD_ROUND)
@@ -1,98 +1,244 @@
+import asyncio
 import socket
 import threading
 import random
 import json
-from utils import gerar_log
+import time
+from bitfield import Bitfield, decode_indices
+from tracker_state import SwarmTable, PEER_TTL, MAX_BLOCKS
+from logger import gerar_log, configurar_log, NIVEIS, FORMATOS, FORMATO_TEXTO, DEBUG, WARNING
+from wire import read_frame, read_frame_async, send_frame, encode_frame
+from metrics import REGISTRY, start_metrics_server
 
-# Conjunto de peers ativos: (ip, porta)
-PEERS = set()
+# Intervalo mínimo (segundos) entre dois ANNOUNCE de um mesmo peer, informado em cada resposta
+MIN_INTERVAL = 10
 
-# Mapeia cada peer para os blocos que ele possui
-PEER_BLOCKS = {}
+# Comandos aceitos pelo tracker (os demais aparecem como 'outro' nas métricas)
+COMANDOS = ('ANNOUNCE', 'REGISTER', 'GET_PEERS', 'UPDATE_BLOCKS')
 
-# Lock para sincronizar o acesso concorrente
-LOCK = threading.Lock()
+# Porta do endpoint HTTP de métricas (Prometheus) do tracker; 0 desliga
+METRICS_PORT = 5001
+
+# Estado do tracker por swarm (info-hash): peers, seus bitfields e a raridade dos blocos
+SWARMS = SwarmTable()
+
+REQUEST_SECONDS = REGISTRY.histogram('minibit_tracker_request_seconds',
+                                     'Tempo para o tracker processar cada requisição', ('comando',))
+REQUEST_ERRORS = REGISTRY.counter('minibit_tracker_request_errors_total', 'Conexões de peers encerradas com erro')
+REGISTRY.gauge('minibit_tracker_swarms', 'Swarms conhecidos pelo tracker').set_function(lambda: len(SWARMS.swarms))
+REGISTRY.gauge('minibit_tracker_peers', 'Peers ativos em cada swarm', ('info_hash',)).set_function(SWARMS.peer_counts)
+
+def peers_response(estado, peer_addr=None):
+    """
+    Monta a resposta com peers conhecidos do swarm (exceto o próprio), blocos sugeridos,
+    min_interval e o ttl depois do qual um peer que não anuncia é removido, a partir do
+    snapshot do estado, sem adquirir os locks dos shards.
+    """
+    snapshot = estado.snapshot()
+    available_peers = [p for p in snapshot.peers if p != peer_addr]
+
+    # Limita o número de peers retornados (máximo 5)
+    peers_response = available_peers if len(available_peers) <= 5 else random.sample(available_peers, 5)
+
+    return json.dumps({
+        'peers': peers_response,
+        'suggested_blocks': snapshot.suggested,
+        'min_interval': MIN_INTERVAL,
+        'ttl': estado.ttl,
+    }).encode()
+
+def swarm_for_total(info_hash, total, criar=False):
+    """
+    Estado do swarm para uma requisição que traz o total de blocos, e a resposta de erro
+    (ou None) quando o total não é aceito: fora de 1..MAX_BLOCKS ou diferente do total
+    fixado pelo primeiro registro do info-hash.
+    """
+    if not 0 < total <= MAX_BLOCKS:
+        return None, ('ERROR Invalid block total', b'')
+    estado = SWARMS.get(info_hash, criar=criar)
+    if estado is not None and not estado.fix_total(total):
+        gerar_log("[TRACKER] Total de blocos %d diferente do fixado (%d) no swarm %s", total, estado.total, info_hash,
+                  nivel=WARNING)
+        return None, ('ERROR Block total mismatch', b'')
+    return estado, None
 
 def handle_client(conn, addr):
     """
     Gerencia as requisições recebidas dos peers.
+    """
+    try:
+        frame = read_frame(conn)
+        if frame is not None:
+            req_id, comando, corpo = frame
+            send_frame(conn, req_id, *timed_request(comando, corpo, addr))
+    except Exception as e:
+        REQUEST_ERRORS.inc()
+        gerar_log("[TRACKER] Erro ao tratar peer %s: %s", addr, e, nivel=WARNING)
+    finally:
+        conn.close()
 
-    Tipos de requisição:
-    - REGISTER: registra um novo peer e seus blocos iniciais
-    - GET_PEERS: retorna peers conhecidos e blocos sugeridos para download
-    - UPDATE_BLOCKS: atualiza blocos que um peer possui
+async def handle_client_async(reader, writer):
+    """
+    Versão asyncio de handle_client.
     """
-    global PEERS, PEER_BLOCKS
+    addr = writer.get_extra_info('peername')[:2]
     try:
-        data = conn.recv(4096).decode()
-        if data.startswith('REGISTER'):
-            parts = data.split()
-            if len(parts) < 3:
-                conn.send(b'ERROR Invalid REGISTER format')
-                return
-            peer_port = int(parts[1])
-            blocks_str = parts[2]
-            blocks = set(blocks_str.split(',')) if blocks_str else set()
-            peer_addr = (addr[0], peer_port)  # IP fixo do peer + porta que ele escuta
-            with LOCK:
-                if peer_addr not in PEERS:
-                    PEERS.add(peer_addr)
-                    gerar_log(f"[TRACKER] Novo peer registrado: {peer_addr}")
-                PEER_BLOCKS[peer_addr] = blocks
-            gerar_log(f"[TRACKER] Atualizou blocos do peer {peer_addr}: {blocks}")
-            conn.send(b'OK')
-
-        elif data == 'GET_PEERS':
-            with LOCK:
-                available_peers = [p for p in PEERS if p != addr]
-
-                # Limita o número de peers retornados (máximo 5)
-                peers_response = available_peers if len(available_peers) <= 5 else random.sample(available_peers, 5)
-
-                # Determina os blocos mais raros entre os peers
-                all_blocks = []
-                for blocks in PEER_BLOCKS.values():
-                    all_blocks.extend(blocks)
-                freq = {}
-                for b in all_blocks:
-                    freq[b] = freq.get(b, 0) + 1
-                rarest_blocks = sorted(freq.items(), key=lambda x: x[1])
-                suggested_blocks = [b for b, _ in rarest_blocks[:5] if b and b.startswith('block_')]
-
-                response = json.dumps({
-                    'peers': peers_response,
-                    'suggested_blocks': suggested_blocks
-                })
-            conn.send(response.encode())
-            gerar_log(f"[TRACKER] Enviou peers e blocos sugeridos para {addr}")
-
-        elif data.startswith('UPDATE_BLOCKS'):
-            blocks_str = data[len('UPDATE_BLOCKS '):]
-            blocks = set(blocks_str.split(',')) if blocks_str else set()
-            with LOCK:
-                # Atualiza blocos de todos os peers com mesmo IP
-                peers_to_update = [p for p in PEERS if p[0] == addr[0]]
-                for p in peers_to_update:
-                    PEER_BLOCKS[p] = blocks
-                    gerar_log(f"[TRACKER] Atualizou blocos do peer {p}: {blocks}")
-            conn.send(b'OK')
+        frame = await read_frame_async(reader)
+        if frame is not None:
+            req_id, comando, corpo = frame
+            writer.write(encode_frame(req_id, *timed_request(comando, corpo, addr)))
+            await writer.drain()
+    except Exception as e:
+        REQUEST_ERRORS.inc()
+        gerar_log("[TRACKER] Erro ao tratar peer %s: %s", addr, e, nivel=WARNING)
+    finally:
+        writer.close()
 
+def timed_request(data, corpo, addr):
+    """
+    process_request medindo o tempo de processamento por comando (minibit_tracker_request_seconds).
+    """
+    inicio = time.perf_counter()
+    comando = data.split(' ', 1)[0]
+    try:
+        return process_request(data, corpo, addr)
+    finally:
+        REQUEST_SECONDS.labels(comando if comando in COMANDOS else 'outro').observe(time.perf_counter() - inicio)
+
+def process_request(data, corpo, addr):
+    """
+    Processa uma requisição de um peer e retorna (resposta, corpo da resposta).
+    Toda requisição traz o info-hash do swarm logo depois do comando; os blocos chegam
+    como bitfield no corpo do quadro.
+
+    Tipos de requisição:
+    - ANNOUNCE info_hash porta total FULL|DELTA: registra o peer no swarm com o bitfield completo
+      (FULL) ou só os blocos novos desde o último anúncio (DELTA) e já responde com os peers (PEERS)
+    - REGISTER info_hash porta total: registra um novo peer e seus blocos iniciais
+    - GET_PEERS info_hash: retorna peers conhecidos e blocos sugeridos para download
+    - UPDATE_BLOCKS info_hash porta total: atualiza blocos que um peer possui
+    """
+    if data.startswith('ANNOUNCE'):
+        parts = data.split()
+        if len(parts) < 5 or parts[4] not in ('FULL', 'DELTA'):
+            return 'ERROR Invalid ANNOUNCE format', b''
+        info_hash = parts[1]
+        peer_addr = (addr[0], int(parts[2]))
+        total = int(parts[3])
+        estado, erro = swarm_for_total(info_hash, total, criar=True)
+        if erro:
+            return erro
+        if parts[4] == 'FULL':
+            blocks = Bitfield.from_bytes(total, corpo)
+            if estado.set_blocks(peer_addr, blocks):
+                gerar_log(f"[TRACKER] Novo peer registrado no swarm {info_hash}: {peer_addr}")
         else:
-            conn.send(b'UNKNOWN_COMMAND')
+            blocks = estado.add_blocks(peer_addr, decode_indices(corpo))
+            if blocks is None:
+                # Delta de um peer desconhecido (tracker reiniciado ou peer expirado): pede o bitfield completo
+                return 'RESYNC', b''
+        response = peers_response(estado, peer_addr)
+        gerar_log("[TRACKER] ANNOUNCE %s de %s no swarm %s (%d bytes): %d/%d blocos", parts[4], peer_addr, info_hash,
+                  len(corpo), len(blocks), total, nivel=DEBUG)
+        return 'PEERS', response
 
-    except Exception as e:
-        gerar_log(f"[TRACKER] Erro ao tratar peer {addr}: {e}")
-    finally:
-        conn.close()
+    elif data.startswith('REGISTER'):
+        parts = data.split()
+        if len(parts) < 4:
+            return 'ERROR Invalid REGISTER format', b''
+        info_hash = parts[1]
+        peer_port = int(parts[2])
+        estado, erro = swarm_for_total(info_hash, int(parts[3]), criar=True)
+        if erro:
+            return erro
+        # Um peer pode registrar-se sem blocos (peças grandes, download do zero)
+        blocks = Bitfield.from_bytes(estado.total, corpo)
+        peer_addr = (addr[0], peer_port)  # IP fixo do peer + porta que ele escuta
+        if estado.set_blocks(peer_addr, blocks):
+            gerar_log(f"[TRACKER] Novo peer registrado no swarm {info_hash}: {peer_addr}")
+        gerar_log("[TRACKER] Atualizou blocos do peer %s: %d/%d blocos", peer_addr, len(blocks), blocks.tamanho,
+                  nivel=DEBUG)
+        return 'OK', b''
+
+    elif data.startswith('GET_PEERS'):
+        parts = data.split()
+        if len(parts) < 2:
+            return 'ERROR Invalid GET_PEERS format', b''
+        estado = SWARMS.get(parts[1])
+        if estado is None:
+            return 'UNKNOWN_SWARM', b''
+        response = peers_response(estado)
+        gerar_log("[TRACKER] Enviou peers e blocos sugeridos do swarm %s para %s", parts[1], addr, nivel=DEBUG)
+        return 'PEERS', response
+
+    elif data.startswith('UPDATE_BLOCKS'):
+        parts = data.split()
+        if len(parts) < 4:
+            return 'ERROR Invalid UPDATE_BLOCKS format', b''
+        # Identifica o peer por (ip, porta): vários peers podem compartilhar o mesmo IP
+        peer_addr = (addr[0], int(parts[2]))
+        estado, erro = swarm_for_total(parts[1], int(parts[3]))
+        if erro:
+            return erro
+        if estado is None or not estado.known(peer_addr):
+            return 'ERROR Peer not registered', b''
+        blocks = Bitfield.from_bytes(estado.total, corpo)
+        estado.set_blocks(peer_addr, blocks)
+        gerar_log("[TRACKER] Atualizou blocos do peer %s: %d/%d blocos", peer_addr, len(blocks), blocks.tamanho,
+                  nivel=DEBUG)
+        return 'OK', b''
+
+    return 'UNKNOWN_COMMAND', b''
 
 def start_tracker(host='localhost', port=5000):
     s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     s.bind((host, port))
     s.listen()
+    SWARMS.start_reaper(log=gerar_log)
     gerar_log(f"[TRACKER] Running on {host}:{port}")
     while True:
         conn, addr = s.accept()
         threading.Thread(target=handle_client, args=(conn, addr)).start()
 
+async def start_tracker_async(host='localhost', port=5000):
+    """
+    Tracker no modo asyncio: um único loop de eventos atende todas as conexões.
+    """
+    server = await asyncio.start_server(handle_client_async, host, port, reuse_address=True)
+    SWARMS.start_reaper(log=gerar_log)
+    gerar_log(f"[TRACKER] Running (asyncio) on {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
 if __name__ == '__main__':
-    start_tracker()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description='Tracker MiniBit')
+    parser.add_argument('--modo', choices=('thread', 'asyncio'), default='thread',
+                        help='motor de rede: threads (padrão) ou asyncio')
+    parser.add_argument('--min-interval', type=int, default=MIN_INTERVAL,
+                        help='intervalo mínimo em segundos entre anúncios de um peer')
+    parser.add_argument('--ttl', type=int, default=PEER_TTL,
+                        help='segundos sem anúncio até um peer ser removido')
+    parser.add_argument('--log-level', choices=NIVEIS, default='info',
+                        help='nível mínimo dos registros de log')
+    parser.add_argument('--log-format', choices=FORMATOS, default=FORMATO_TEXTO,
+                        help='formato do log: texto ou uma linha JSON por registro')
+    parser.add_argument('--log-file', metavar='ARQUIVO',
+                        help='arquivo que também recebe os registros de log')
+    parser.add_argument('--metrics-port', type=int, default=METRICS_PORT,
+                        help='porta do endpoint HTTP de métricas no formato Prometheus (0 = desligado)')
+    args = parser.parse_args()
+    configurar_log(args.log_level, args.log_format, args.log_file)
+    if args.metrics_port:
+        try:
+            start_metrics_server(args.metrics_port)
+            gerar_log(f"[TRACKER] Métricas em http://localhost:{args.metrics_port}/metrics")
+        except OSError as e:
+            gerar_log("[TRACKER] Não foi possível abrir a porta de métricas %s: %s", args.metrics_port, e, nivel=WARNING)
+    MIN_INTERVAL = args.min_interval
+    SWARMS.ttl = args.ttl
+    if args.modo == 'asyncio':
+        asyncio.run(start_tracker_async())
+    else:
+        start_tracker()
@@ -0,0 +1,239 @@
+import threading
+import time
+import zlib
+from rarity import RarityIndex
+from metrics import TimedLock
+
+# Quantidade de partições (cada uma com seu lock) do estado do tracker
+SHARDS = 16
+
+# Tempo (segundos) sem anúncios depois do qual um peer é considerado morto
+PEER_TTL = 45
+
+# Idade máxima (segundos) do snapshot usado nas respostas com a lista de peers
+SNAPSHOT_MAX_AGE = 1.0
+
+# Maior total de blocos aceito para um swarm (1 TiB com blocos de 256 KiB); o total vem do
+# peer e dimensiona os bitfields e o índice de raridade do tracker
+MAX_BLOCKS = 1 << 22
+
+
+class PeerEntry:
+    """
+    Blocos anunciados por um peer e o instante do último anúncio.
+    """
+
+    def __init__(self, blocks):
+        self.blocks = blocks
+        self.last_seen = time.monotonic()
+
+
+class Snapshot:
+    """
+    Visão imutável dos peers ativos e dos blocos sugeridos, lida sem lock pelas respostas.
+    """
+
+    def __init__(self, peers, suggested, versao):
+        self.peers = peers
+        self.suggested = suggested
+        self.versao = versao
+        self.criado = time.monotonic()
+
+
+class TrackerState:
+    """
+    Estado do tracker particionado por peer: cada shard tem seu próprio lock, então anúncios
+    de peers diferentes raramente disputam o mesmo lock. O índice de raridade tem um lock à
+    parte, sempre adquirido depois do lock do shard.
+
+    As respostas com a lista de peers leem um Snapshot imutável, refeito só quando um peer
+    entra ou sai (ou quando fica velho), em vez de percorrer o estado a cada requisição.
+    Peers que não anunciam há mais de ttl segundos são removidos pelo reaper.
+    O total de blocos é fixado pelo primeiro registro (fix_total) e não muda depois.
+    """
+
+    def __init__(self, shards=SHARDS, ttl=PEER_TTL):
+        self.ttl = ttl
+        self.total = None
+        self.shards = [({}, TimedLock(threading.Lock(), 'tracker_shard')) for _ in range(shards)]
+        self.rarity = RarityIndex(0)
+        self.rarity_lock = TimedLock(threading.Lock(), 'tracker_rarity')
+        self.versao = 0  # incrementada quando o conjunto de peers muda
+        self.versao_lock = threading.Lock()
+        self.snapshot_lock = TimedLock(threading.Lock(), 'tracker_snapshot')
+        self._snapshot = Snapshot((), [], -1)
+
+    def _shard(self, peer_addr):
+        chave = f'{peer_addr[0]}:{peer_addr[1]}'.encode()
+        return self.shards[zlib.crc32(chave) % len(self.shards)]
+
+    def _bump(self):
+        with self.versao_lock:
+            self.versao += 1
+
+    def fix_total(self, total):
+        """
+        Fixa o total de blocos do swarm no primeiro registro. Retorna False se o total
+        anunciado é diferente do fixado (outro arquivo ou peer malformado).
+        """
+        with self.rarity_lock:
+            if self.total is None:
+                self.total = total
+                self.rarity = RarityIndex(total)
+            return total == self.total
+
+    def _rarity_diff(self, antigo, novo):
+        # Chamado com o lock do shard adquirido; os bitfields já têm o total fixado do swarm
+        with self.rarity_lock:
+            if antigo is None:
+                self.rarity.add_all(novo)
+            else:
+                self.rarity.remove_all(b for b in antigo if b not in novo)
+                self.rarity.add_all(b for b in novo if b not in antigo)
+
+    def set_blocks(self, peer_addr, blocks):
+        """
+        Registra o peer (se novo) com o bitfield completo. Retorna True se o peer é novo.
+        """
+        peers, lock = self._shard(peer_addr)
+        with lock:
+            entrada = peers.get(peer_addr)
+            self._rarity_diff(entrada.blocks if entrada else None, blocks)
+            if entrada is None:
+                peers[peer_addr] = PeerEntry(blocks)
+                self._bump()
+                return True
+            entrada.blocks = blocks
+            entrada.last_seen = time.monotonic()
+            return False
+
+    def add_blocks(self, peer_addr, indices):
+        """
+        Aplica um delta de blocos novos. Retorna o bitfield atualizado, ou None se o peer não é conhecido.
+        """
+        peers, lock = self._shard(peer_addr)
+        with lock:
+            entrada = peers.get(peer_addr)
+            if entrada is None:
+                return None
+            novos = [b for b in indices if b < entrada.blocks.tamanho and b not in entrada.blocks]
+            for b in novos:
+                entrada.blocks.add(b)
+            if novos:
+                with self.rarity_lock:
+                    self.rarity.add_all(novos)
+            entrada.last_seen = time.monotonic()
+            return entrada.blocks
+
+    def known(self, peer_addr):
+        peers, lock = self._shard(peer_addr)
+        with lock:
+            return peer_addr in peers
+
+    def expire(self):
+        """
+        Remove os peers que não anunciam há mais de ttl segundos e retorna seus endereços.
+        """
+        limite = time.monotonic() - self.ttl
+        removidos = []
+        for peers, lock in self.shards:
+            with lock:
+                mortos = [p for p, entrada in peers.items() if entrada.last_seen < limite]
+                for p in mortos:
+                    entrada = peers.pop(p)
+                    with self.rarity_lock:
+                        self.rarity.remove_all(entrada.blocks)
+                removidos.extend(mortos)
+        if removidos:
+            self._bump()
+        return removidos
+
+    def snapshot(self):
+        """
+        Retorna o snapshot atual, refazendo-o se o conjunto de peers mudou ou se ele ficou velho.
+        """
+        atual = self._snapshot
+        if atual.versao == self.versao and time.monotonic() - atual.criado < SNAPSHOT_MAX_AGE:
+            return atual
+        with self.snapshot_lock:
+            atual = self._snapshot
+            if atual.versao == self.versao and time.monotonic() - atual.criado < SNAPSHOT_MAX_AGE:
+                return atual
+            versao = self.versao
+            peers = []
+            for shard, lock in self.shards:
+                with lock:
+                    peers.extend(shard)
+            with self.rarity_lock:
+                # Os blocos mais raros (que ao menos um peer tem) saem direto do índice de raridade
+                suggested = self.rarity.rarest(limite=5, minimo=1)
+            self._snapshot = Snapshot(tuple(peers), suggested, versao)
+            return self._snapshot
+
+    def empty(self):
+        return all(not peers for peers, _ in self.shards)
+
+
+class SwarmTable:
+    """
+    Estados (TrackerState) de cada swarm, indexados pelo info-hash. Um swarm é criado no
+    primeiro anúncio e descartado pelo reaper quando o último peer dele expira.
+    """
+
+    def __init__(self, shards=SHARDS, ttl=PEER_TTL):
+        self.shards = shards
+        self.ttl = ttl
+        self.swarms = {}
+        self.lock = TimedLock(threading.Lock(), 'tracker_swarms')
+
+    def get(self, info_hash, criar=False):
+        """
+        Estado do swarm, ou None se ele não existe e criar é falso.
+        """
+        with self.lock:
+            estado = self.swarms.get(info_hash)
+            if estado is None and criar:
+                estado = self.swarms[info_hash] = TrackerState(self.shards, self.ttl)
+            return estado
+
+    def peer_counts(self):
+        """
+        Quantidade de peers ativos em cada swarm, pelo snapshot mais recente.
+        """
+        with self.lock:
+            swarms = list(self.swarms.items())
+        return {(info_hash,): len(estado._snapshot.peers) for info_hash, estado in swarms}
+
+    def expire(self):
+        """
+        Expira os peers silenciosos de todos os swarms e descarta os swarms vazios.
+        Retorna {info_hash: endereços removidos}.
+        """
+        with self.lock:
+            swarms = list(self.swarms.items())
+        removidos = {}
+        for info_hash, estado in swarms:
+            estado.ttl = self.ttl
+            mortos = estado.expire()
+            if mortos:
+                removidos[info_hash] = mortos
+            if estado.empty():
+                with self.lock:
+                    if self.swarms.get(info_hash) is estado and estado.empty():
+                        del self.swarms[info_hash]
+        return removidos
+
+    def start_reaper(self, intervalo=None, log=None):
+        """
+        Inicia a thread que remove periodicamente os peers expirados de todos os swarms.
+        """
+        intervalo = intervalo or max(1, self.ttl / 3)
+
+        def reaper():
+            while True:
+                time.sleep(intervalo)
+                for info_hash, removidos in self.expire().items():
+                    if log:
+                        log(f"[TRACKER] Peers expirados removidos do swarm {info_hash}: {removidos}")
+
+        threading.Thread(target=reaper, daemon=True).start()
@@ -1,56 +1,210 @@
 import os
+import json
+import tempfile
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from hashing import hash_piece
+from logger import gerar_log, DEBUG
 
-# Divide uma pasta contendo arquivos em blocos numerados sequencialmente
-def dividir_pasta_em_blocos(pasta_origem, pasta_saida, tamanho_bloco=1024):
+# Arquivo com os metadados da divisão (tamanho da peça, do chunk, total de peças e de bytes)
+ARQUIVO_METADADOS = 'metadata.json'
+
+# Bytes lidos de uma vez por tarefa ao dividir, reconstruir e copiar arquivos
+LOTE_DIVISAO = 8 * 1024 * 1024
+
+# Threads que dividem (leem, hasheiam e gravam lotes de blocos) e reconstroem arquivos em paralelo
+WORKERS_DIVISAO = min(8, os.cpu_count() or 2)
+
+# Lista os arquivos da pasta em ordem determinística (pastas e nomes ordenados) com a posição
+# de cada um no fluxo contínuo que é dividido em blocos: [{'path', 'offset', 'length'}, ...].
+# path é relativo à pasta, com '/' como separador; a tabela vai no manifesto (metadata.json).
+def tabela_arquivos(pasta_origem):
+    tabela = []
+    offset = 0
+    for root, dirs, files in os.walk(pasta_origem):
+        dirs.sort()
+        for arquivo in sorted(files):
+            caminho = os.path.join(root, arquivo)
+            tamanho = os.path.getsize(caminho)
+            relativo = os.path.relpath(caminho, pasta_origem).replace(os.sep, '/')
+            tabela.append({'path': relativo, 'offset': offset, 'length': tamanho})
+            offset += tamanho
+    return tabela
+
+# Caminho local de uma entrada da tabela, recusando caminhos que sairiam da pasta
+def caminho_da_tabela(pasta, entrada):
+    partes = entrada['path'].split('/')
+    if entrada['path'].startswith('/') or any(p in ('', '.', '..') for p in partes):
+        raise ValueError(f"Caminho inválido na tabela de arquivos: {entrada['path']!r}")
+    return os.path.join(pasta, *partes)
+
+# Lê o intervalo [inicio, inicio + tamanho) do fluxo formado pelos arquivos da tabela
+# direto para um buffer, com um pread por arquivo que o intervalo cruza
+def _ler_fluxo(fds, tabela, offsets, inicio, tamanho):
+    buffer = bytearray(tamanho)
+    visao = memoryview(buffer)
+    posicao = 0
+    i = max(0, bisect_right(offsets, inicio) - 1)
+    while posicao < tamanho and i < len(tabela):
+        entrada = tabela[i]
+        dentro = inicio + posicao - entrada['offset']
+        n = min(entrada['length'] - dentro, tamanho - posicao)
+        if n > 0:
+            lidos = os.preadv(fds[i], [visao[posicao:posicao + n]], dentro)
+            if lidos != n:
+                raise IOError(f"{entrada['path']} mudou durante a divisão")
+            posicao += n
+        i += 1
+    return buffer
+
+# Divide uma pasta contendo arquivos em blocos numerados sequencialmente.
+# Os arquivos são tratados como um fluxo contínuo na ordem de tabela_arquivos: só o último
+# bloco pode ser menor, então o bloco N sempre começa no offset N * tamanho_bloco do arquivo
+# reconstruído. Se um store for informado, os blocos são gravados nele em vez de arquivos block_N.
+# Lotes de blocos consecutivos (LOTE_DIVISAO bytes) são lidos, hasheados e gravados em paralelo
+# por um pool de threads: pread/pwrite e o hashlib liberam o GIL em buffers grandes.
+# Retorna o manifesto: a lista com o hash de cada bloco, na ordem dos blocos.
+def dividir_pasta_em_blocos(pasta_origem, pasta_saida, tamanho_bloco=1024, store=None, tabela=None,
+                            workers=WORKERS_DIVISAO):
     # Cria pasta de saída se não existir
     if not os.path.exists(pasta_saida):
         os.makedirs(pasta_saida)
+    if tabela is None:
+        tabela = tabela_arquivos(pasta_origem)
+    total_bytes = sum(entrada['length'] for entrada in tabela)
+    total_blocos = (total_bytes + tamanho_bloco - 1) // tamanho_bloco
+    offsets = [entrada['offset'] for entrada in tabela]
+    blocos_por_lote = max(1, LOTE_DIVISAO // tamanho_bloco)
 
-    bloco_num = 0  # Contador para numerar os blocos
-    for root, dirs, files in os.walk(pasta_origem):
-        # Percorre arquivos da pasta de origem
-        for arquivo in files:
-            caminho_completo = os.path.join(root, arquivo)
-            with open(caminho_completo, 'rb') as f:
-                while True:
-                    dados = f.read(tamanho_bloco)
-                    if not dados:
-                        break
-                    nome_bloco = f'block_{bloco_num}'
-                    caminho_bloco = os.path.join(pasta_saida, nome_bloco)
-                    with open(caminho_bloco, 'wb') as bf:
-                        bf.write(dados)
-                    bloco_num += 1
-    print(f"[UTILS] Pasta dividida em {bloco_num} blocos na pasta {pasta_saida}")
-
-# Salva a contagem total dos blocos em um arquivo de texto
-def salvar_contagem_blocos(pasta_blocos, arquivo_contagem='block_count.txt'):
-    blocos = [b for b in os.listdir(pasta_blocos) if b.startswith('block_') and b != arquivo_contagem]
-    total = len(blocos)
-    caminho = os.path.join(pasta_blocos, arquivo_contagem)
-    with open(caminho, 'w') as f:
-        f.write(str(total))
-    print(f"[UTILS] Salvou contagem de blocos ({total}) em {caminho}")
-
-def reconstruir_arquivo(pasta_blocos, nome_arquivo_saida):
+    def gravar(numero, dados):
+        if store is not None:
+            store.write_block(numero, dados)
+        else:
+            with open(os.path.join(pasta_saida, f'block_{numero}'), 'wb') as bf:
+                bf.write(dados)
+
+    def processar_lote(primeiro):
+        ultimo = min(primeiro + blocos_por_lote, total_blocos)
+        inicio = primeiro * tamanho_bloco
+        buffer = memoryview(_ler_fluxo(fds, tabela, offsets, inicio, min(ultimo * tamanho_bloco, total_bytes) - inicio))
+        hashes = []
+        for numero in range(primeiro, ultimo):
+            dados = buffer[(numero - primeiro) * tamanho_bloco:(numero - primeiro + 1) * tamanho_bloco]
+            hashes.append(hash_piece(dados))
+            gravar(numero, dados)
+        return hashes
+
+    fds = [os.open(caminho_da_tabela(pasta_origem, entrada), os.O_RDONLY) for entrada in tabela]
+    try:
+        lotes = range(0, total_blocos, blocos_por_lote)
+        if len(lotes) <= 1 or workers <= 1:
+            resultados = map(processar_lote, lotes)
+            hashes = [h for lote in resultados for h in lote]
+        else:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='divisao') as pool:
+                hashes = [h for lote in pool.map(processar_lote, lotes) for h in lote]
+    finally:
+        for fd in fds:
+            os.close(fd)
+    gerar_log("[UTILS] Pasta dividida em %d blocos (%d arquivos) na pasta %s", total_blocos, len(tabela), pasta_saida)
+    return hashes
+
+# Copia tamanho bytes entre dois descritores por offsets explícitos: copy_file_range faz a cópia
+# dentro do kernel (sem passar pelo Python); sem ele, a cópia usa pread/pwrite em buffers grandes
+def copiar_intervalo(fd_origem, fd_destino, tamanho, offset_origem=0, offset_destino=0):
+    while tamanho > 0:
+        n = min(tamanho, LOTE_DIVISAO)
+        if hasattr(os, 'copy_file_range'):
+            try:
+                copiados = os.copy_file_range(fd_origem, fd_destino, n, offset_origem, offset_destino)
+            except OSError:
+                copiados = os.pwrite(fd_destino, os.pread(fd_origem, n, offset_origem), offset_destino)
+        else:
+            copiados = os.pwrite(fd_destino, os.pread(fd_origem, n, offset_origem), offset_destino)
+        if copiados <= 0:
+            raise IOError(f"Cópia interrompida com {tamanho} bytes faltando")
+        tamanho -= copiados
+        offset_origem += copiados
+        offset_destino += copiados
+
+# Grava o arquivo inteiro em um temporário na mesma pasta e o renomeia por cima do destino:
+# quem lê (ou um peer reiniciado depois de um crash) vê o conteúdo antigo ou o novo, nunca um pela metade.
+# O temporário tem nome único, então gravações concorrentes do mesmo destino não se atrapalham
+def gravar_atomico(caminho, dados):
+    pasta, nome = os.path.split(caminho)
+    fd, temporario = tempfile.mkstemp(prefix=f'.{nome}.', suffix='.tmp', dir=pasta or '.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(dados)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(temporario, 0o644)
+        os.replace(temporario, caminho)
+    except BaseException:
+        try:
+            os.unlink(temporario)
+        except FileNotFoundError:
+            pass
+        raise
+
+# Salva os metadados da divisão em JSON na pasta de blocos do seed
+def salvar_metadados(pasta_blocos, metadados):
+    os.makedirs(pasta_blocos, exist_ok=True)
+    caminho = os.path.join(pasta_blocos, ARQUIVO_METADADOS)
+    gravar_atomico(caminho, json.dumps(metadados).encode())
+    gerar_log("[UTILS] Salvou metadados em %s", caminho, nivel=DEBUG)
+
+# Lê os metadados da divisão; levanta FileNotFoundError se o seed ainda não os gravou
+def ler_metadados(pasta_blocos):
+    with open(os.path.join(pasta_blocos, ARQUIVO_METADADOS), 'r') as f:
+        return json.load(f)
+
+def reconstruir_arquivo(pasta_blocos, nome_arquivo_saida, total_blocos=None):
     """
     Junta os blocos na pasta e reconstrói o arquivo original.
-    Os blocos devem estar nomeados block_0, block_1, ...
+    Os blocos devem estar nomeados block_0, block_1, ...; com total_blocos informado a pasta
+    não precisa ser listada. Cada bloco é copiado dentro do kernel (copiar_intervalo).
     """
-    blocos = sorted([b for b in os.listdir(pasta_blocos) if b.startswith('block_')],
-                    key=lambda x: int(x.split('_')[1]))
+    if total_blocos is None:
+        total_blocos = len([b for b in os.listdir(pasta_blocos) if b.startswith('block_')])
     with open(nome_arquivo_saida, 'wb') as f_out:
-        for bloco in blocos:
-            caminho_bloco = os.path.join(pasta_blocos, bloco)
-            with open(caminho_bloco, 'rb') as bf:
-                f_out.write(bf.read())
-    print(f"[UTILS] Arquivo reconstruído em {nome_arquivo_saida}")
+        offset = 0
+        for numero in range(total_blocos):
+            with open(os.path.join(pasta_blocos, f'block_{numero}'), 'rb') as bf:
+                tamanho = os.fstat(bf.fileno()).st_size
+                copiar_intervalo(bf.fileno(), f_out.fileno(), tamanho, 0, offset)
+            offset += tamanho
+        f_out.truncate(offset)
+    gerar_log("[UTILS] Arquivo reconstruído em %s", nome_arquivo_saida)
 
-def gerar_log(mensagem, arquivo_log=None):
+def reconstruir_pasta(arquivo_fluxo, tabela, pasta_destino, workers=WORKERS_DIVISAO):
     """
-    Função simples para gerar logs no console e opcionalmente salvar em arquivo.
+    Recria em pasta_destino os arquivos originais, com os limites exatos da tabela de arquivos
+    do manifesto, a partir do arquivo com o fluxo completo (o arquivo reconstruído).
+    Os arquivos são criados com o tamanho final e preenchidos por trechos de até LOTE_DIVISAO
+    bytes, copiados em paralelo.
     """
-    print(f"[LOG] {mensagem}")
-    if arquivo_log:
-        with open(arquivo_log, 'a') as f:
-            f.write(mensagem + '\n')
\ No newline at end of file
+    trechos = []
+    fds = []
+    try:
+        origem = os.open(arquivo_fluxo, os.O_RDONLY)
+        fds.append(origem)
+        for entrada in tabela:
+            caminho = caminho_da_tabela(pasta_destino, entrada)
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            fd = os.open(caminho, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            fds.append(fd)
+            os.ftruncate(fd, entrada['length'])
+            for inicio in range(0, entrada['length'], LOTE_DIVISAO):
+                trechos.append((fd, min(LOTE_DIVISAO, entrada['length'] - inicio), entrada['offset'] + inicio, inicio))
+
+        def copiar(trecho):
+            fd, tamanho, offset_origem, offset_destino = trecho
+            copiar_intervalo(origem, fd, tamanho, offset_origem, offset_destino)
+
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='reconstrucao') as pool:
+            list(pool.map(copiar, trechos))
+    finally:
+        for fd in fds:
+            os.close(fd)
+    gerar_log("[UTILS] %d arquivos reconstruídos em %s", len(tabela), pasta_destino)
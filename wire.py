@@ -0,0 +1,485 @@
+import asyncio
+import socket
+import struct
+import threading
+from concurrent.futures import Future
+
+# Cabeçalho de cada quadro: tamanho do payload + id da requisição
+FRAME_HEADER = struct.Struct('!II')
+
+# Limite de segurança para o tamanho de um quadro
+MAX_FRAME = 64 * 1024 * 1024
+
+# Quantidade padrão de requisições em voo por conexão (pipelining)
+PIPELINE_DEPTH = 16
+
+
+class ConnectionClosed(ConnectionError):
+    """
+    Conexão encerrada pelo outro lado enquanto ainda havia quadros pendentes.
+    """
+
+
+def encode_frame(req_id, comando, corpo=b''):
+    """
+    Monta um quadro: cabeçalho, linha de comando terminada em '\\n' e corpo binário opcional.
+    """
+    return encode_frame_header(req_id, comando, len(corpo)) + corpo
+
+
+def encode_frame_header(req_id, comando, tamanho_corpo):
+    """
+    Monta apenas o cabeçalho e a linha de comando de um quadro cujo corpo de tamanho_corpo
+    bytes será enviado em seguida por outro caminho (por exemplo, os.sendfile).
+    """
+    linha = comando.encode() + b'\n'
+    return FRAME_HEADER.pack(len(linha) + tamanho_corpo, req_id) + linha
+
+
+def send_frame(sock, req_id, comando, corpo=b''):
+    """
+    Envia um quadro completo pelo socket.
+    """
+    sock.sendall(encode_frame(req_id, comando, corpo))
+
+
+def send_frame_buffer(sock, req_id, comando, corpo):
+    """
+    Envia um quadro cujo corpo é um buffer (por exemplo, memoryview sobre uma peça em cache)
+    sem concatená-lo ao cabeçalho: os dois vão na mesma chamada sendmsg (scatter/gather).
+    """
+    cabecalho = encode_frame_header(req_id, comando, len(corpo))
+    if not hasattr(sock, 'sendmsg'):
+        sock.sendall(cabecalho)
+        sock.sendall(corpo)
+        return
+    partes = [memoryview(cabecalho), memoryview(corpo).cast('B')]
+    while partes:
+        enviados = sock.sendmsg(partes)
+        while enviados:
+            if enviados >= len(partes[0]):
+                enviados -= len(partes.pop(0))
+            else:
+                partes[0] = partes[0][enviados:]
+                enviados = 0
+        while partes and not len(partes[0]):
+            partes.pop(0)
+
+
+def recv_exact(sock, n):
+    """
+    Lê exatamente n bytes do socket. Retorna None se a conexão fechar antes do primeiro byte.
+    """
+    buf = bytearray(n)
+    view = memoryview(buf)
+    lidos = 0
+    while lidos < n:
+        r = sock.recv_into(view[lidos:], n - lidos)
+        if r == 0:
+            if lidos == 0:
+                return None
+            raise ConnectionClosed(f"Conexão fechada após {lidos}/{n} bytes")
+        lidos += r
+    return bytes(buf)
+
+
+def decode_payload(payload):
+    """
+    Separa o payload de um quadro em (linha de comando, corpo).
+    """
+    fim = payload.find(b'\n')
+    if fim < 0:
+        return payload.decode(), b''
+    return payload[:fim].decode(), payload[fim + 1:]
+
+
+def read_frame(sock):
+    """
+    Lê um quadro do socket e retorna (req_id, comando, corpo), ou None se a conexão foi encerrada.
+    """
+    header = recv_exact(sock, FRAME_HEADER.size)
+    if header is None:
+        return None
+    tamanho, req_id = FRAME_HEADER.unpack(header)
+    if tamanho > MAX_FRAME:
+        raise ValueError(f"Quadro grande demais: {tamanho} bytes")
+    payload = recv_exact(sock, tamanho) if tamanho else b''
+    if payload is None:
+        raise ConnectionClosed("Conexão fechada antes do payload")
+    comando, corpo = decode_payload(payload)
+    return req_id, comando, corpo
+
+
+class PeerConnection:
+    """
+    Conexão persistente com outro peer. Permite várias requisições em voo ao mesmo tempo:
+    cada quadro leva um id e uma thread leitora entrega as respostas às Futures pendentes.
+    hello, se informado, é enviado logo após conectar (quadro de id 0, sem resposta) para
+    que o outro lado saiba quem é este peer. Com limiter (ratelimit.RateLimiter), a leitura
+    do próximo quadro espera até o corpo recebido caber no limite de download.
+    Quadros de id 0 vindos do outro lado não respondem a nada (por exemplo, HAVE): vão para
+    on_push(endereco, comando, corpo), chamado na thread leitora.
+    """
+
+    def __init__(self, endereco, queue_depth=PIPELINE_DEPTH, timeout=10, hello=None, limiter=None, on_push=None):
+        self.endereco = endereco
+        self.timeout = timeout
+        self.limiter = limiter
+        self.on_push = on_push
+        self.sock = socket.create_connection(endereco, timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if hello:
+            send_frame(self.sock, 0, hello)
+        self.sock.settimeout(None)
+        self.slots = threading.BoundedSemaphore(queue_depth)
+        self.pendentes = {}
+        self.next_id = 1
+        self.lock = threading.Lock()
+        self.closed = False
+        threading.Thread(target=self._reader_loop, daemon=True).start()
+
+    def submit(self, comando, corpo=b''):
+        """
+        Envia uma requisição sem esperar a resposta. Retorna uma Future com (comando, corpo).
+        Bloqueia se já houver queue_depth requisições em voo.
+        """
+        if not self.slots.acquire(timeout=self.timeout):
+            raise TimeoutError(f"Fila de requisições cheia para {self.endereco}")
+        future = Future()
+        with self.lock:
+            if self.closed:
+                self.slots.release()
+                raise ConnectionClosed(f"Conexão com {self.endereco} já encerrada")
+            req_id = self.next_id
+            self.next_id = self.next_id % 0xFFFFFFFF + 1
+            self.pendentes[req_id] = future
+            try:
+                send_frame(self.sock, req_id, comando, corpo)
+            except OSError as e:
+                del self.pendentes[req_id]
+                self.slots.release()
+                self._fail_all(e)
+                raise
+        return future
+
+    def request(self, comando, corpo=b'', timeout=None):
+        """
+        Envia uma requisição e espera pela resposta.
+        """
+        return self.submit(comando, corpo).result(timeout or self.timeout)
+
+    def _reader_loop(self):
+        erro = None
+        try:
+            while True:
+                frame = read_frame(self.sock)
+                if frame is None:
+                    break
+                req_id, comando, corpo = frame
+                if req_id == 0:
+                    if self.on_push is not None:
+                        self.on_push(self.endereco, comando, corpo)
+                    continue
+                with self.lock:
+                    future = self.pendentes.pop(req_id, None)
+                if future is not None:
+                    self.slots.release()
+                    future.set_result((comando, corpo))
+                if self.limiter is not None and corpo:
+                    self.limiter.acquire(self.endereco, len(corpo))
+        except Exception as e:
+            erro = e
+        with self.lock:
+            self._fail_all(erro)
+
+    def _fail_all(self, erro=None):
+        # Chamado com self.lock adquirido
+        self.closed = True
+        pendentes, self.pendentes = self.pendentes, {}
+        for future in pendentes.values():
+            self.slots.release()
+            future.set_exception(ConnectionClosed(f"Conexão com {self.endereco} encerrada: {erro}"))
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+    def close(self):
+        """
+        Encerra a conexão e falha todas as requisições pendentes.
+        """
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        with self.lock:
+            self._fail_all()
+
+
+class ServerConnection:
+    """
+    Lado servidor de uma conexão persistente com outro peer. As respostas saem da thread que
+    atende a conexão, mas os quadros de id 0 (push, como HAVE) saem da thread que salvou o
+    bloco: o lock garante que os quadros não se misturem no socket. Quem envia um quadro em
+    partes (cabeçalho e depois sendfile) segura o lock durante o envio todo.
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.lock = threading.Lock()
+        self.closed = False
+        self.remoto = None  # (ip, porta de escuta) do peer, informado pelo HELLO
+        self.codecs = frozenset()  # codecs de compressão que o peer aceita, também do HELLO
+
+    def send(self, req_id, comando, corpo=b''):
+        with self.lock:
+            send_frame(self.sock, req_id, comando, corpo)
+
+    def push(self, comando, corpo=b''):
+        """
+        Envia um quadro sem resposta (id 0). Erros só marcam a conexão como encerrada;
+        a thread que atende a conexão percebe a falha na próxima leitura.
+        """
+        if self.closed:
+            return
+        try:
+            self.send(0, comando, corpo)
+        except OSError:
+            self.closed = True
+
+
+class ConnectionPool:
+    """
+    Mantém uma conexão persistente por peer, reutilizada entre rodadas de download.
+    """
+
+    def __init__(self, queue_depth=PIPELINE_DEPTH, timeout=10, hello=None, limiter=None, on_push=None):
+        self.queue_depth = queue_depth
+        self.timeout = timeout
+        self.hello = hello
+        self.limiter = limiter
+        self.on_push = on_push
+        self.conexoes = {}
+        self.lock = threading.Lock()
+
+    def get(self, endereco):
+        """
+        Retorna a conexão aberta com o peer, criando uma nova se necessário.
+        """
+        with self.lock:
+            conn = self.conexoes.get(endereco)
+            if conn is not None and not conn.closed:
+                return conn
+        nova = PeerConnection(endereco, queue_depth=self.queue_depth, timeout=self.timeout, hello=self.hello,
+                              limiter=self.limiter, on_push=self.on_push)
+        with self.lock:
+            conn = self.conexoes.get(endereco)
+            if conn is not None and not conn.closed:
+                nova.close()
+                return conn
+            self.conexoes[endereco] = nova
+            return nova
+
+    def discard(self, endereco):
+        """
+        Fecha e remove a conexão com um peer (por exemplo, após um erro).
+        """
+        with self.lock:
+            conn = self.conexoes.pop(endereco, None)
+        if conn is not None:
+            conn.close()
+        if self.limiter is not None:
+            self.limiter.forget(endereco)
+
+    def close_all(self):
+        with self.lock:
+            conexoes, self.conexoes = self.conexoes, {}
+        for conn in conexoes.values():
+            conn.close()
+
+
+async def read_frame_async(reader):
+    """
+    Versão asyncio de read_frame: lê um quadro de um StreamReader.
+    """
+    try:
+        header = await reader.readexactly(FRAME_HEADER.size)
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            return None
+        raise ConnectionClosed("Conexão fechada no meio do cabeçalho")
+    tamanho, req_id = FRAME_HEADER.unpack(header)
+    if tamanho > MAX_FRAME:
+        raise ValueError(f"Quadro grande demais: {tamanho} bytes")
+    try:
+        payload = await reader.readexactly(tamanho) if tamanho else b''
+    except asyncio.IncompleteReadError:
+        raise ConnectionClosed("Conexão fechada antes do payload")
+    comando, corpo = decode_payload(payload)
+    return req_id, comando, corpo
+
+
+class AsyncServerConnection:
+    """
+    Equivalente asyncio de ServerConnection. push pode ser chamado de qualquer thread (o
+    bloco pode ter sido salvo fora do loop de eventos): o quadro é agendado no loop e
+    espera o lock, já que não se pode escrever no transporte durante um loop.sendfile.
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.loop = asyncio.get_running_loop()
+        self.lock = asyncio.Lock()
+        self.closed = False
+        self.remoto = None
+        self.codecs = frozenset()
+
+    async def send(self, req_id, comando, corpo=b''):
+        async with self.lock:
+            self.writer.write(encode_frame(req_id, comando, corpo))
+            await self.writer.drain()
+
+    def push(self, comando, corpo=b''):
+        if not self.closed:
+            asyncio.run_coroutine_threadsafe(self._push(comando, corpo), self.loop)
+
+    async def _push(self, comando, corpo):
+        if self.closed or self.writer.is_closing():
+            return
+        try:
+            await self.send(0, comando, corpo)
+        except OSError:
+            self.closed = True
+
+
+class AsyncPeerConnection:
+    """
+    Equivalente asyncio de PeerConnection: conexão persistente com pipelining,
+    onde uma task leitora resolve as Futures de cada requisição.
+    """
+
+    def __init__(self, endereco, reader, writer, queue_depth=PIPELINE_DEPTH, timeout=10, limiter=None,
+                 on_push=None):
+        self.endereco = endereco
+        self.limiter = limiter
+        self.on_push = on_push
+        self.reader = reader
+        self.writer = writer
+        self.timeout = timeout
+        self.slots = asyncio.Semaphore(queue_depth)
+        self.pendentes = {}
+        self.next_id = 1
+        self.closed = False
+        self.reader_task = asyncio.ensure_future(self._reader_loop())
+
+    @classmethod
+    async def open(cls, endereco, queue_depth=PIPELINE_DEPTH, timeout=10, hello=None, limiter=None, on_push=None):
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(*endereco), timeout)
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if hello:
+            writer.write(encode_frame(0, hello))
+        return cls(endereco, reader, writer, queue_depth=queue_depth, timeout=timeout, limiter=limiter,
+                   on_push=on_push)
+
+    async def request(self, comando, corpo=b''):
+        """
+        Envia uma requisição e espera a resposta (comando, corpo).
+        Várias corrotinas podem chamar request ao mesmo tempo na mesma conexão.
+        """
+        await asyncio.wait_for(self.slots.acquire(), self.timeout)
+        try:
+            if self.closed:
+                raise ConnectionClosed(f"Conexão com {self.endereco} já encerrada")
+            req_id = self.next_id
+            self.next_id = self.next_id % 0xFFFFFFFF + 1
+            future = asyncio.get_running_loop().create_future()
+            self.pendentes[req_id] = future
+            self.writer.write(encode_frame(req_id, comando, corpo))
+            await self.writer.drain()
+            try:
+                return await asyncio.wait_for(future, self.timeout)
+            finally:
+                self.pendentes.pop(req_id, None)
+        finally:
+            self.slots.release()
+
+    async def _reader_loop(self):
+        erro = None
+        try:
+            while True:
+                frame = await read_frame_async(self.reader)
+                if frame is None:
+                    break
+                req_id, comando, corpo = frame
+                if req_id == 0:
+                    if self.on_push is not None:
+                        self.on_push(self.endereco, comando, corpo)
+                    continue
+                future = self.pendentes.pop(req_id, None)
+                if future is not None and not future.done():
+                    future.set_result((comando, corpo))
+                if self.limiter is not None and corpo:
+                    await self.limiter.acquire_async(self.endereco, len(corpo))
+        except Exception as e:
+            erro = e
+        self._fail_all(erro)
+
+    def _fail_all(self, erro=None):
+        self.closed = True
+        pendentes, self.pendentes = self.pendentes, {}
+        for future in pendentes.values():
+            if not future.done():
+                future.set_exception(ConnectionClosed(f"Conexão com {self.endereco} encerrada: {erro}"))
+        self.writer.close()
+
+    def close(self):
+        self.reader_task.cancel()
+        self._fail_all()
+
+
+class AsyncConnectionPool:
+    """
+    Equivalente asyncio de ConnectionPool.
+    """
+
+    def __init__(self, queue_depth=PIPELINE_DEPTH, timeout=10, hello=None, limiter=None, on_push=None):
+        self.queue_depth = queue_depth
+        self.timeout = timeout
+        self.hello = hello
+        self.limiter = limiter
+        self.on_push = on_push
+        self.conexoes = {}
+        self.abrindo = {}
+
+    async def get(self, endereco):
+        conn = self.conexoes.get(endereco)
+        if conn is not None and not conn.closed:
+            return conn
+        # Evita abrir duas conexões para o mesmo peer em corrotinas concorrentes
+        tarefa = self.abrindo.get(endereco)
+        if tarefa is None:
+            tarefa = asyncio.ensure_future(
+                AsyncPeerConnection.open(endereco, queue_depth=self.queue_depth, timeout=self.timeout,
+                                         hello=self.hello, limiter=self.limiter, on_push=self.on_push))
+            self.abrindo[endereco] = tarefa
+        try:
+            conn = await asyncio.shield(tarefa)
+        finally:
+            if self.abrindo.get(endereco) is tarefa and tarefa.done():
+                del self.abrindo[endereco]
+        self.conexoes[endereco] = conn
+        return conn
+
+    def discard(self, endereco):
+        conn = self.conexoes.pop(endereco, None)
+        if conn is not None:
+            conn.close()
+        if self.limiter is not None:
+            self.limiter.forget(endereco)
+
+    def close_all(self):
+        conexoes, self.conexoes = self.conexoes, {}
+        for conn in conexoes.values():
+            conn.close()